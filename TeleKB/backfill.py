@@ -0,0 +1,142 @@
+import traceback
+
+def split_id_range(first_id: int, last_id: int, window_size: int) -> list:
+    """Splits the inclusive id range into disjoint inclusive (first, last) windows."""
+    windows = []
+    start = max(first_id, 1)
+    while start <= last_id:
+        end = min(start + window_size - 1, last_id)
+        windows.append((start, end))
+        start = end + 1
+    return windows
+
+class Backfill:
+    """Collects a historical id/date range of one channel.
+
+    The range is split into id windows; `workers` windows are fetched concurrently
+    on the Telethon loop and then go through the normal Collector pipeline in id
+    order. Progress is kept per window in backfill_jobs/backfill_windows, and saved
+    messages are recorded with source='backfill', so the live last_message_id
+    checkpoint is never moved and an interrupted backfill resumes where it stopped.
+    """
+    DEFAULT_WINDOW_SIZE = 500
+    DEFAULT_WORKERS = 4
+
+    def __init__(self, collector, workers: int = DEFAULT_WORKERS, window_size: int = DEFAULT_WINDOW_SIZE):
+        self.collector = collector
+        self.db = collector.db
+        self.telegram_service = collector.telegram_service
+        self.log = collector.log
+        self.progress = collector.progress
+        self.workers = max(1, workers)
+        self.window_size = max(1, window_size)
+
+    def resolve_range(self, ch, since=None, until=None, first_id=None, last_id=None):
+        """Turns dates into an inclusive id range. Defaults to everything up to the live checkpoint."""
+        ch_id = ch['channel_id']
+        if first_id is None:
+            first_id = self.telegram_service.get_message_id_before(ch_id, since) + 1 if since else 1
+        if last_id is None:
+            if until:
+                last_id = self.telegram_service.get_message_id_before(ch_id, until)
+            else:
+                # Anything newer belongs to the live run
+                last_id = ch['last_message_id']
+        return first_id, last_id
+
+    def run(self, channel_id, since=None, until=None, first_id=None, last_id=None,
+            phone_callback=None, code_callback=None, password_callback=None):
+        self.telegram_service.reset_run_stats()
+        if self.collector.image_stage:
+            self.collector.image_stage.reset_stats()
+        try:
+            self.log("Connecting to Telegram...")
+            connected = self.telegram_service.connect(
+                phone_callback=phone_callback,
+                code_callback=code_callback,
+                password_callback=password_callback
+            )
+            if not connected:
+                self.log("Login failed or cancelled.")
+                return self.progress
+
+            self.collector.recover_pending()
+            if self.collector.takeout_min_messages is not None:
+                self.log("Opening a takeout session for the backfill...")
+                if self.telegram_service.start_takeout():
+                    self.log("Takeout session open.")
+
+            ch = self.db.get_channel(channel_id)
+            if ch is None:
+                self.log(f"Channel {channel_id} is not registered. Add it in Channel Management first.")
+                return self.progress
+
+            first_id, last_id = self.resolve_range(ch, since, until, first_id, last_id)
+            if last_id < first_id:
+                self.log(f"Nothing to backfill for {ch['title']} (range {first_id}..{last_id}).")
+                return self.progress
+
+            job = self.db.get_open_backfill_job(channel_id, first_id, last_id)
+            if job:
+                job_id = job['job_id']
+                self.log(f"Resuming backfill job {job_id} for {ch['title']} [{first_id}..{last_id}]")
+            else:
+                job_id = self.db.create_backfill_job(channel_id, first_id, last_id, split_id_range(first_id, last_id, self.window_size))
+                self.log(f"Created backfill job {job_id} for {ch['title']} [{first_id}..{last_id}]")
+
+            self.process_job(job_id, ch)
+        except Exception as e:
+            self.log(f"Critical Error: {e}")
+            traceback.print_exc()
+        finally:
+            self.telegram_service.end_takeout()
+            self.collector.report_run_stats()
+        return self.progress
+
+    def process_job(self, job_id, ch):
+        ch_id = ch['channel_id']
+        ch_title = ch['title']
+        windows = self.db.get_backfill_windows(job_id)
+        self.log(f"  {len(windows)} windows pending ({self.workers} fetched concurrently).")
+
+        self.progress.reset(channels_total=1)
+        self.progress.start_channel(ch_title)
+
+        for i in range(0, len(windows), self.workers):
+            if self.collector.should_stop():
+                break
+            batch = windows[i:i + self.workers]
+            results = self.telegram_service.fetch_message_windows(
+                ch_id, [(w['first_id'], w['last_id']) for w in batch]
+            )
+            self.progress.add_found(sum(len(r) for r in results if r))
+
+            for window, messages in zip(batch, results):
+                if messages is None:
+                    self.log(f"  Window {window['first_id']}..{window['last_id']} failed; it stays pending.")
+                    continue
+                if self.process_window(ch_id, ch_title, window, messages):
+                    self.db.mark_backfill_window_done(job_id, window['first_id'])
+                if self.collector.stop_requested:
+                    break
+
+        if not self.db.get_backfill_windows(job_id):
+            self.db.finish_backfill_job(job_id)
+            self.log(f"Backfill job {job_id} complete.")
+        else:
+            self.log(f"Backfill job {job_id} paused with pending windows; run it again to resume.")
+        self.progress.finish_channel()
+
+    def process_window(self, ch_id, ch_title, window, messages) -> bool:
+        """Returns True when every message of the window has been committed."""
+        # Albums may straddle window edges; members from outside the window are pulled in here
+        done_ids = self.db.get_processed_message_ids(ch_id, window['first_id'] - self.collector.ALBUM_MAX)
+        messages = self.collector.complete_albums(ch_id, messages, done_ids)
+        posts = [[m for m in post if m.id not in done_ids] for post in self.collector.group_posts(messages)]
+        posts = [p for p in posts if p]
+        saved = 0
+        for _, fpath in self.collector.process_posts(ch_id, ch_title, posts, source="backfill"):
+            if fpath:
+                saved += 1
+        # Fewer results than posts means the run was stopped part-way
+        return saved == len(posts)
@@ -0,0 +1,361 @@
+import datetime
+import glob
+import hashlib
+import json
+import os
+import re
+import tarfile
+import time
+import zipfile
+from .file_manager import FileManager
+from .file_lock import FileLock
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class ColdStorage:
+    """Packs completed <YYYY-MM>/ folders (Markdown, images, files) into compressed
+    archives in <output>/cold_storage/, and reads them back.
+
+    Each rollup of a month writes one part, <YYYY-MM>.<n>.<ext>, and its index
+    <YYYY-MM>.<n>.json (member path, size and hash). The archive is written to a
+    temporary name and renamed, the index is written the same way, and only then are
+    the originals deleted; a part without an index is an interrupted rollup and is
+    discarded, and originals already in an index are just deleted, so an interrupted
+    rollup resumes where it stopped. Files written into a month after it was rolled up
+    go into its next part. A Markdown file present in several parts reads as their
+    concatenation, and the manifest offsets of its later sections are shifted to match.
+    Packing and extracting hold the collectors' commit lock, so no section is appended
+    to a month while its files are deleted, rewritten or their offsets shifted.
+
+    Configured through settings.json: "cold_storage": {"keep_months": 2,
+    "format": "auto", "level": 10}. keep_months counts the current month; "auto" uses
+    zstd (tar stream) when the zstandard package is installed, otherwise zip.
+    """
+    DIR_NAME = "cold_storage"
+    DEFAULTS = {"keep_months": 2, "format": "auto", "level": 10}
+    EXTENSIONS = {"zstd": ".tar.zst", "gzip": ".tar.gz", "zip": ".zip"}
+    MONTH_PATTERN = re.compile(r"^\d{4}-\d{2}$")
+    PART_PATTERN = re.compile(r"^(\d{4}-\d{2})\.(\d+)\.json$")
+    # Files still being written (resumable downloads, atomic renames) stay hot
+    SKIP_SUFFIXES = (".part", ".tmp")
+    # Already compressed; zip stores them as is
+    STORED_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".mp4", ".mov", ".zip", ".pdf")
+
+    def __init__(self, db, output_dir: str, config: dict = None):
+        self.db = db
+        # Normalized like the paths it is compared with (see FileManager.normalize_path)
+        self.output_dir = FileManager.normalize_path(output_dir)
+        self.dir = os.path.join(self.output_dir, self.DIR_NAME)
+        self.config = {**self.DEFAULTS, **(config or {})}
+        self._cache = (None, {})  # (part, Markdown members) of the last part read
+        self._lock = FileLock(db.db_path + ".lock")  # the same lock as Collector._commit_lock
+
+    def archive_format(self) -> str:
+        fmt = self.config["format"]
+        if fmt == "auto":
+            return "zstd" if zstandard else "zip"
+        if fmt == "zstd" and not zstandard:
+            print("zstandard is not installed; cold storage falls back to zip.")
+            return "zip"
+        if fmt not in self.EXTENSIONS:
+            raise ValueError(f"Unknown cold storage format: {fmt}")
+        return fmt
+
+    def relpath(self, path: str) -> str:
+        """Output-relative member name of a file path (absolute, or relative to the
+        working directory like a path stored by a run given a relative --output)."""
+        path = FileManager.normalize_path(path)
+        try:
+            return os.path.relpath(path, self.output_dir).replace(os.sep, "/")
+        except ValueError:
+            # On another drive (Windows); never in this output directory
+            return path
+
+    # --- Index ---
+
+    def parts(self, month: str = None) -> list:
+        """Indexes of the complete parts (of one month), oldest first."""
+        parts = []
+        for path in glob.glob(os.path.join(self.dir, "*.json")):
+            m = self.PART_PATTERN.match(os.path.basename(path))
+            if m and (month is None or m.group(1) == month):
+                with open(path, encoding="utf-8") as f:
+                    parts.append(json.load(f))
+        return sorted(parts, key=lambda p: (p["month"], p["part"]))
+
+    def locate(self, path: str) -> list:
+        """Parts holding the file, oldest first."""
+        rel = self.relpath(path)
+        month = rel.split("/", 1)[0]
+        return [p for p in self.parts(month) if rel in p["members"]]
+
+    def discard_interrupted(self):
+        """Removes temporary files and parts whose index was never written."""
+        indexed = {p["archive"] for p in self.parts()}
+        for path in glob.glob(os.path.join(self.dir, "*")):
+            name = os.path.basename(path)
+            if name.endswith(".tmp") or (not name.endswith(".json") and name not in indexed):
+                os.remove(path)
+
+    # --- Rollup ---
+
+    def _pending_months(self) -> set:
+        return {os.path.basename(os.path.dirname(row['file_path'])) for row in self.db.get_pending_messages()}
+
+    def eligible_months(self) -> list:
+        today = datetime.date.today()
+        current = today.year * 12 + today.month - 1
+        pending = self._pending_months()
+        months = []
+        for name in sorted(os.listdir(self.output_dir)):
+            if not self.MONTH_PATTERN.match(name) or not os.path.isdir(os.path.join(self.output_dir, name)):
+                continue
+            year, month = map(int, name.split("-"))
+            if year * 12 + month - 1 > current - self.config["keep_months"] or name in pending:
+                continue
+            months.append(name)
+        return months
+
+    def rollup(self, log=print) -> dict:
+        """Rolls up every eligible month. Returns totals: months, files, bytes before
+        and after."""
+        os.makedirs(self.dir, exist_ok=True)
+        with self._lock:
+            self.discard_interrupted()
+        totals = {"months": 0, "files": 0, "bytes_before": 0, "bytes_after": 0}
+        for month in self.eligible_months():
+            result = self.rollup_month(month)
+            if result is None:
+                continue
+            totals["months"] += 1
+            for key in ("files", "bytes_before", "bytes_after"):
+                totals[key] += result[key]
+            log(f"Rolled up {month}: {result['files']} file(s), "
+                f"{result['bytes_before'] / 1024 / 1024:.1f}MB -> {result['bytes_after'] / 1024 / 1024:.1f}MB")
+        return totals
+
+    def _month_files(self, month: str) -> list:
+        files = []
+        for root, _, names in os.walk(os.path.join(self.output_dir, month)):
+            files.extend(os.path.join(root, n) for n in names if not n.endswith(self.SKIP_SUFFIXES))
+        return sorted(files)
+
+    def rollup_month(self, month: str):
+        """Packs the month's files into a new part. Returns its counts, or None if
+        there was nothing to pack (or a write into the month is pending)."""
+        with self._lock:
+            # Checked again under the lock: pending rows left now are a crashed
+            # writer's, whose recovery may still truncate the month's files
+            if month in self._pending_months():
+                return None
+            return self._rollup_month(month)
+
+    def _rollup_month(self, month: str):
+        previous = self.parts(month)
+        archived = {}
+        for part in previous:
+            archived.update(part["members"])
+        pack = []
+        for path in self._month_files(month):
+            rel = self.relpath(path)
+            if rel in archived and archived[rel] == self._member_info(path) and rel in previous[-1]["members"]:
+                # Packed by an interrupted rollup; only the deletion is left
+                self._retire(path, rel, previous[:-1])
+            else:
+                pack.append((path, rel))
+        if not pack:
+            self._remove_empty_dirs(month)
+            return None
+
+        fmt = self.archive_format()
+        number = previous[-1]["part"] + 1 if previous else 1
+        name = f"{month}.{number}{self.EXTENSIONS[fmt]}"
+        target = os.path.join(self.dir, name)
+        members = {rel: self._member_info(path) for path, rel in pack}
+        self._write_archive(fmt, target + ".tmp", pack)
+        os.replace(target + ".tmp", target)
+        index = {"month": month, "part": number, "format": fmt, "archive": name,
+                 "created_at": int(time.time()), "members": members}
+        self._write_json(os.path.join(self.dir, f"{month}.{number}.json"), index)
+
+        for path, rel in pack:
+            self._retire(path, rel, previous)
+        self._remove_empty_dirs(month)
+        return {"files": len(pack), "bytes_before": sum(m["size"] for m in members.values()),
+                "bytes_after": os.path.getsize(target)}
+
+    def _retire(self, path: str, rel: str, earlier: list):
+        """Deletes a packed original. A Markdown file that earlier parts also hold is
+        read after them, so its manifest rows are shifted by what precedes it."""
+        if rel.endswith(".md") and any(rel in p["members"] for p in earlier):
+            prefix = len(self._concat([self._read_member(p, rel) for p in earlier if rel in p["members"]]))
+            self.shift_sections(path, prefix + len(self.separator()))
+        os.remove(path)
+
+    def shift_sections(self, path: str, delta: int):
+        """Moves the manifest rows of the file on disk by `delta`. Rows are only
+        recognized as this file's by their bytes, so this is safe to repeat. The
+        caller holds the commit lock."""
+        with open(path, "rb") as f:
+            data = f.read()
+        moved = []
+        for row in self._manifest_rows(path):
+            if row['byte_offset'] is None:
+                continue
+            section = data[row['byte_offset']:row['byte_offset'] + row['byte_length']]
+            if FileManager.content_hash(section) == row['content_hash']:
+                moved.append((row['byte_offset'] + delta, row['byte_length'], row['content_hash'], row['id']))
+        self.db.set_section_locations(moved)
+
+    def _manifest_rows(self, path: str) -> list:
+        """Manifest rows of the file, however its path was spelled when they were written."""
+        target = FileManager.normalize_path(path)
+        rows = []
+        for stored in self.db.get_manifest_files():
+            if FileManager.normalize_path(stored) == target:
+                rows.extend(self.db.get_manifest_rows(stored))
+        return rows
+
+    def _remove_empty_dirs(self, month: str):
+        for root, _, _ in sorted(os.walk(os.path.join(self.output_dir, month)), key=lambda w: -len(w[0])):
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass  # not empty
+
+    @staticmethod
+    def _member_info(path: str) -> dict:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return {"size": os.path.getsize(path), "sha256": digest.hexdigest()}
+
+    @staticmethod
+    def _write_json(path: str, data: dict):
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _write_archive(self, fmt: str, path: str, pack):
+        with open(path, "wb") as raw:
+            if fmt == "zip":
+                with zipfile.ZipFile(raw, "w") as z:
+                    for src, rel in pack:
+                        stored = rel.lower().endswith(self.STORED_SUFFIXES)
+                        z.write(src, rel, compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+            elif fmt == "zstd":
+                writer = zstandard.ZstdCompressor(level=self.config["level"]).stream_writer(raw, closefd=False)
+                with writer, tarfile.open(fileobj=writer, mode="w|") as tar:
+                    for src, rel in pack:
+                        tar.add(src, rel)
+            else:
+                with tarfile.open(fileobj=raw, mode="w:gz") as tar:
+                    for src, rel in pack:
+                        tar.add(src, rel)
+            raw.flush()
+            os.fsync(raw.fileno())
+
+    # --- Reading ---
+
+    def _open_tar(self, part: dict, f):
+        if part["format"] == "zstd":
+            if not zstandard:
+                raise RuntimeError(f"{part['archive']} needs the zstandard package")
+            return tarfile.open(fileobj=zstandard.ZstdDecompressor().stream_reader(f), mode="r|")
+        return tarfile.open(fileobj=f, mode="r|gz")
+
+    def _iter_members(self, part: dict, wanted=None):
+        """(relative path, bytes) of the part's members (those in `wanted`, if given)."""
+        path = os.path.join(self.dir, part["archive"])
+        if part["format"] == "zip":
+            with zipfile.ZipFile(path) as z:
+                for rel in z.namelist():
+                    if wanted is None or rel in wanted:
+                        yield rel, z.read(rel)
+            return
+        with open(path, "rb") as f, self._open_tar(part, f) as tar:
+            for info in tar:
+                if info.isfile() and (wanted is None or info.name in wanted):
+                    yield info.name, tar.extractfile(info).read()
+
+    def _read_member(self, part: dict, rel: str) -> bytes:
+        if rel.endswith(".md"):
+            # Markdown of a part is small; keep the last part's in memory for lookups
+            if self._cache[0] != part["archive"]:
+                wanted = {r for r in part["members"] if r.endswith(".md")}
+                self._cache = (part["archive"], dict(self._iter_members(part, wanted)))
+            return self._cache[1][rel]
+        for _, data in self._iter_members(part, {rel}):
+            return data
+        raise KeyError(rel)
+
+    @staticmethod
+    def separator() -> bytes:
+        return FileManager.encode_section(FileManager.SECTION_SEPARATOR)
+
+    def _concat(self, chunks) -> bytes:
+        return self.separator().join(c for c in chunks if c)
+
+    def read_bytes(self, path: str):
+        """The file's archived content, or None if it is not in cold storage. Files
+        still on disk are read from disk."""
+        rel = self.relpath(path)
+        parts = self.locate(path)
+        if not parts:
+            return None
+        return self._concat([self._read_member(p, rel) for p in parts])
+
+    def read_text(self, path: str) -> str:
+        """A Markdown file, whether on disk or in cold storage (or both)."""
+        full = FileManager.normalize_path(path)
+        chunks = [self.read_bytes(full) or b""]
+        if os.path.exists(full):
+            with open(full, "rb") as f:
+                chunks.append(f.read())
+        return self._concat(chunks).decode("utf-8").replace(os.linesep, "\n")
+
+    # --- Extract ---
+
+    def extract(self, month: str, log=print) -> int:
+        """Restores a month's files to its folder and removes its parts. Returns the
+        number of files restored."""
+        with self._lock:
+            return self._extract(month, log)
+
+    def _extract(self, month: str, log) -> int:
+        parts = self.parts(month)
+        restored = {}
+        for part in parts:
+            for rel, data in self._iter_members(part):
+                restored[rel] = self._concat([restored.get(rel, b""), data]) if rel.endswith(".md") else data
+        for rel, data in restored.items():
+            target = os.path.join(self.output_dir, *rel.split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.exists(target):
+                with open(target, "rb") as f:
+                    current = f.read()
+                if current.startswith(data):
+                    continue  # restored by an interrupted extract
+                if rel.endswith(".md"):
+                    # Written after the last rollup; it now follows the archived sections
+                    self.shift_sections(target, len(data) + len(self.separator()))
+                    data = self._concat([data, current])
+                else:
+                    continue
+            with open(target + ".tmp", "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(target + ".tmp", target)
+        for part in parts:
+            os.remove(os.path.join(self.dir, f"{month}.{part['part']}.json"))
+            os.remove(os.path.join(self.dir, part["archive"]))
+        self._cache = (None, {})
+        log(f"Extracted {month}: {len(restored)} file(s).")
+        return len(restored)
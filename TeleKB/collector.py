@@ -0,0 +1,729 @@
+import asyncio
+import collections
+import copy
+import datetime
+import os
+import threading
+import traceback
+from .file_manager import FileManager
+from .progress import CollectionProgress
+from .profiler import RunProfiler
+from .media import MediaPolicy
+from .dedup import NearDuplicateIndex, split_paragraphs
+from .cpu_stage import analyze_post, post_record
+from .sessions import ShardQueue
+from .scheduler import ChannelScheduler
+from .sync_log import SyncLog
+from .manifest import ArchiveManifest
+from .connection import TelegramUnavailable
+from .file_lock import FileLock
+from telethon.errors import FloodWaitError
+
+def console_log(message, verbose=False):
+    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {message}", flush=True)
+
+class Collector:
+    """Runs one collection pass over all enabled channels.
+
+    Shared by the GUI (MainWindow) and headless runs (main.py --headless); the
+    caller supplies a log callback and reads progress from `self.progress`.
+    """
+
+    def __init__(self, db, telegram_service, translator, output_dir: str, log=None, progress=None,
+                 media_policy=None, dedup_index=None, cpu_stage=None, session_pool=None, work_queue=None,
+                 image_stage=None):
+        self.db = db
+        self.telegram_service = telegram_service
+        self.translator = translator
+        self.output_dir = output_dir
+        self.log = log or console_log
+        self.progress = progress or CollectionProgress()
+        self.media_policy = media_policy or MediaPolicy()
+        # Optional NearDuplicateIndex; None disables translation reuse
+        self.dedup = dedup_index
+        # Optional CpuStage; analyzes large batches of posts in worker processes
+        self.cpu_stage = cpu_stage
+        # Optional SessionPool; with several accounts, channels are collected in parallel
+        self.session_pool = session_pool
+        # Optional WorkQueue; with several workers, channels are leased to one at a time
+        self.work_queue = work_queue
+        # Optional ImageStage; re-encodes downloaded photos and writes thumbnails
+        self.image_stage = image_stage
+        # Catch-ups of at least this many messages use a takeout session ("takeout"
+        # setting, see TelegramService.takeout_threshold); None disables takeout
+        self.takeout_min_messages = None
+        # Messages per scheduling turn ("scheduling": {"chunk_messages": 200})
+        self.chunk_messages = ChannelScheduler.DEFAULT_CHUNK
+        # Channel id -> newest message id, from the dialogs at the start of a run
+        self.top_message_ids = {}
+
+        # Profiling (user setting / --profile). Extra threads to profile can be
+        # registered as name -> call_soon, e.g. {"tk": lambda fn: root.after(0, fn)}
+        self.profile = False
+        self.profile_threads = {}
+
+        # Cooperative control. The pipeline checks these between messages, so
+        # stopping never abandons a translation or download that has started.
+        self._stop_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        # Shard threads, and other processes on the same database (a second worker, a
+        # backfill), may share a Markdown file; offset + append must not interleave, and
+        # recovery must not mistake another process's in-flight append for a crash
+        self._commit_lock = FileLock(db.db_path + ".lock")
+
+    # --- Run control (safe to call from any thread) ---
+
+    def request_stop(self):
+        self._stop_event.set()
+        self._resume_event.set()  # a paused run has to wake up to stop
+
+    def pause(self):
+        if not self._stop_event.is_set():
+            self._resume_event.clear()
+
+    def resume(self):
+        self._resume_event.set()
+
+    @property
+    def is_paused(self) -> bool:
+        return not self._resume_event.is_set()
+
+    @property
+    def stop_requested(self) -> bool:
+        return self._stop_event.is_set()
+
+    def should_stop(self) -> bool:
+        """Blocks while paused; returns True once a stop has been requested."""
+        if not self._resume_event.is_set():
+            self.log("Paused.")
+            self._resume_event.wait()
+            if not self._stop_event.is_set():
+                self.log("Resumed.")
+        return self._stop_event.is_set()
+
+    def run(self, phone_callback=None, code_callback=None, password_callback=None):
+        profiler = None
+        if self.profile:
+            profiler = RunProfiler(self.output_dir)
+            profiler.start()
+            profiler.profile_current_thread("collector")
+            profiler.attach("telethon-loop", self.telegram_service.loop.call_soon_threadsafe)
+            for name, call_soon in self.profile_threads.items():
+                profiler.attach(name, call_soon)
+            self.log(f"Profiling enabled (run {profiler.run_id}).")
+        self.translator.router.begin_run(self.log)
+        for service in self.telegram_services():
+            service.reset_run_stats()
+        if self.image_stage:
+            self.image_stage.reset_stats()
+
+        try:
+            self.log("Connecting to Telegram...")
+            connected = self.telegram_service.connect(
+                phone_callback=phone_callback,
+                code_callback=code_callback,
+                password_callback=password_callback
+            )
+
+            if not connected:
+                self.log("Login failed or cancelled.")
+                return self.progress
+
+            self.recover_pending()
+
+            channels = self.db.get_channels(only_enabled=True)
+            if not channels:
+                self.log("No enabled channels found.")
+                return self.progress
+
+            self.progress.reset(channels_total=len(channels))
+            if self.work_queue:
+                self.work_queue.start(self.db.get_checkpoints)
+                self.log(f"Worker {self.work_queue.worker_id}: leasing channels from {self.work_queue.path}")
+            if self.session_pool:
+                self.session_pool.connect_others(self.log, phone_callback, code_callback, password_callback)
+            self.top_message_ids = self.load_top_message_ids()
+            if self.session_pool:
+                self.run_shards(channels)
+            else:
+                self.run_scheduled(channels)
+
+            if self._stop_event.is_set():
+                self.log("Collection stopped. Finished messages were saved; the next run resumes from there.")
+
+        except Exception as e:
+            self.log(f"Critical Error: {e}")
+            traceback.print_exc()
+        finally:
+            if self.work_queue:
+                self.work_queue.stop()
+            for service in self.telegram_services():
+                service.end_takeout()
+            self.report_run_stats()
+            if profiler:
+                try:
+                    snap = self.progress.snapshot()
+                    profiler.stop_current_thread("collector")
+                    profile_dir = profiler.stop(message_count=snap["messages_done"], channel_count=snap["channels_done"])
+                    self.log(f"Profile for run {profiler.run_id} written to {profile_dir}")
+                except Exception as e:
+                    self.log(f"Error writing profile: {e}")
+
+        return self.progress
+
+    # --- Scheduling ---
+
+    def load_top_message_ids(self) -> dict:
+        try:
+            if self.session_pool:
+                return self.session_pool.top_message_ids()
+            return self.telegram_service.get_top_message_ids()
+        except TelegramUnavailable as e:
+            self.log(f"Could not read the dialog list to estimate backlogs: {e}")
+            return {}
+
+    def pending_estimates(self, channels) -> dict:
+        """Channel id -> estimated messages behind (ids are sequential per channel)."""
+        return {ch['channel_id']: max(0, self.top_message_ids[ch['channel_id']] - ch['last_message_id'])
+                for ch in channels if ch['channel_id'] in self.top_message_ids}
+
+    def run_scheduled(self, channels):
+        """Collects the channels a chunk at a time, in ChannelScheduler order."""
+        scheduler = ChannelScheduler(channels, self.pending_estimates(channels), self.chunk_messages)
+        while not self.should_stop():
+            turn = scheduler.next()
+            if turn is None:
+                break
+            ch_id, limit = turn
+            # Re-read: earlier turns (or another worker) advanced its checkpoint
+            ch = self.lease_channel(self.db.get_channel(ch_id))
+            if ch is None:
+                scheduler.record(ch_id, 0, finished=True)
+                self.progress.finish_channel()
+                continue
+            try:
+                fetched = self.process_channel(ch, limit=limit)
+            except Exception as e:
+                # One channel failing (left, private, a FloodWait too long to wait out,
+                # Telegram unreachable) must not end the run for the others
+                if isinstance(e, TelegramUnavailable):
+                    self.log(f"Could not reach Telegram for {ch['title']}: {e}. "
+                             f"It keeps its checkpoint and is retried next run.")
+                elif isinstance(e, FloodWaitError):
+                    self.log(f"FloodWait of {e.seconds}s on {ch['title']}; it keeps its checkpoint and is retried next run.")
+                else:
+                    self.log(f"Error in channel {ch['title']}: {e}")
+                    traceback.print_exc()
+                scheduler.record(ch_id, 0, finished=True)
+                self.release_channel(ch_id)
+                self.progress.finish_channel()
+                continue
+            checkpoint = self.db.get_channel(ch_id)['last_message_id']
+            top = self.top_message_ids.get(ch_id)
+            # A turn that commits nothing ends the channel for this run, so failing posts
+            # aren't refetched over and over; they are retried by the next run
+            finished = not fetched or checkpoint == ch['last_message_id'] or (top is not None and checkpoint >= top)
+            if scheduler.record(ch_id, fetched, finished):
+                if not finished:
+                    self.log(f"  {ch['title']} reached its limit of {ch['max_per_run']} messages for this run.")
+                self.release_channel(ch_id)
+                self.progress.finish_channel()
+
+    # --- Multi-worker runs ---
+
+    def lease_channel(self, ch):
+        """With a work queue, leases the channel to this worker and returns its row, with
+        the checkpoint another worker published if that is further along. Returns None
+        if another worker is collecting it. Without a work queue, returns ch."""
+        if not self.work_queue:
+            return ch
+        ch_id = ch['channel_id']
+        published = self.work_queue.acquire(ch_id)
+        if published is None:
+            self.log(f"{ch['title']} is being collected by another worker; skipping it.")
+            return None
+        if published > ch['last_message_id']:
+            self.log(f"{ch['title']}: continuing from checkpoint {published} of another worker.")
+            self.db.update_last_message_id(ch_id, published)
+            ch = self.db.get_channel(ch_id)
+        return ch
+
+    def release_channel(self, ch_id):
+        if self.work_queue:
+            self.work_queue.release(ch_id, self.db.get_channel(ch_id)['last_message_id'])
+
+    # --- Multi-account runs ---
+
+    def for_service(self, telegram_service):
+        """A Collector sharing this one's state and run control, collecting through
+        another account's client."""
+        worker = copy.copy(self)
+        worker.telegram_service = telegram_service
+        return worker
+
+    def run_shards(self, channels):
+        """Collects the channels through every account of the session pool, one thread per account."""
+        pending = self.pending_estimates(channels)
+        # Whole channels per turn here (up to max_per_run); the shard queues move them
+        # between accounts on FloodWaits, so they are only put in priority order
+        shards = {name: ChannelScheduler.order(assigned, pending)
+                  for name, assigned in self.session_pool.assign(channels).items()}
+        for name, assigned in shards.items():
+            self.log(f"Account '{name}': {len(assigned)} channel(s)")
+        queue = ShardQueue(self.session_pool, shards)
+        threads = [threading.Thread(target=self._run_shard, args=(name, queue), name=f"shard-{name}", daemon=True)
+                   for name in shards]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def _run_shard(self, name, queue):
+        service = self.session_pool.services[name]
+        worker = self if service is self.telegram_service else self.for_service(service)
+        while not self.should_stop():
+            ch = queue.next(name, self._stop_event)
+            if ch is None:
+                break
+            leased = self.lease_channel(ch)
+            if leased is None:
+                self.progress.finish_channel()
+                queue.done()
+                continue
+            try:
+                worker.process_channel(leased, limit=ch['max_per_run'] or None)
+                self.progress.finish_channel()
+            except FloodWaitError as e:
+                # Checkpoints are per message, so whoever takes the channel over resumes it
+                queue.flood(name, ch, e.seconds, self.log)
+            except TelegramUnavailable as e:
+                self.log(f"Could not reach Telegram for {ch['title']} (account '{name}'): {e}. "
+                         f"It keeps its checkpoint and is retried next run.")
+                self.progress.finish_channel()
+            except Exception as e:
+                self.log(f"Error in channel {ch['title']} (account '{name}'): {e}")
+                traceback.print_exc()
+                self.progress.finish_channel()
+            finally:
+                self.release_channel(ch['channel_id'])
+                queue.done()
+
+    def process_channel(self, ch, limit=None):
+        """Collects up to `limit` (all if None) messages after the channel's checkpoint.
+        Returns the number of messages scanned."""
+        ch_id = ch['channel_id']
+        ch_title = ch['title']
+        last_id = ch['last_message_id']
+
+        self.progress.start_channel(ch_title)
+        self.log(f"Processing channel: {ch_title} (Last ID: {last_id})")
+        self.maybe_start_takeout(ch_id, last_id)
+
+        messages, scanned, scanned_to = self.telegram_service.fetch_messages(ch_id, min_id=last_id, limit=limit)
+        self.log(f"  Found {len(messages)} new messages.")
+        self.progress.add_found(len(messages))
+
+        if not messages:
+            # Only service messages (joins, pins...) in this stretch; move past them
+            if scanned_to > last_id:
+                self.db.update_last_message_id(ch_id, scanned_to)
+            return scanned
+
+        # Messages already committed (e.g. by an interrupted run) are never redone. The
+        # album lookback reaches below the checkpoint, so include that range too
+        done_ids = self.db.get_processed_message_ids(ch_id, max(0, last_id - self.ALBUM_MAX))
+        messages = self.complete_albums(ch_id, messages, done_ids)
+
+        max_id = last_id
+        posts = [p for p in ([m for m in post if m.id not in done_ids] for post in self.group_posts(messages)) if p]
+        saved = 0
+        for post, fpath in self.process_posts(ch_id, ch_title, posts):
+            # Each successful post advances last_message_id in the same transaction
+            if fpath:
+                max_id = max(max_id, post[-1].id)
+                saved += 1
+
+        if saved == len(posts) and scanned_to > max_id:
+            # Every post is saved; the service messages after the last one are skipped too
+            self.db.update_last_message_id(ch_id, scanned_to)
+            max_id = scanned_to
+        if max_id > last_id:
+            self.log(f"  Updated last_message_id to {max_id}")
+        return scanned
+
+    def maybe_start_takeout(self, ch_id, last_id):
+        """Opens a takeout session for a large catch-up. It stays open for the rest of
+        the run, so later channels of this account use it as well."""
+        service = self.telegram_service
+        if self.takeout_min_messages is None or service.takeout_active:
+            return
+        # Channel message ids are sequential, so the id gap approximates the backlog
+        top = self.top_message_ids.get(ch_id)
+        backlog = (top if top is not None else service.get_latest_message_id(ch_id)) - last_id
+        if backlog >= self.takeout_min_messages:
+            self.log(f"  About {backlog} messages to catch up; opening a takeout session...")
+            if service.start_takeout():
+                self.log("  Takeout session open.")
+
+    # --- Albums ---
+
+    ALBUM_MAX = 10  # Telegram albums hold at most 10 items with consecutive ids
+
+    @staticmethod
+    def group_posts(messages) -> list:
+        """Groups messages into posts: album members (same grouped_id) become one post."""
+        posts = []
+        albums = {}
+        for msg in messages:
+            gid = msg.grouped_id
+            if gid and gid in albums:
+                albums[gid].append(msg)
+                continue
+            post = [msg]
+            if gid:
+                albums[gid] = post
+            posts.append(post)
+        return [sorted(p, key=lambda m: m.id) for p in posts]
+
+    def complete_albums(self, ch_id, messages, done_ids) -> list:
+        """Albums cut by the fetch boundaries (checkpoint, backfill window, limit) are
+        completed with one batched get_messages(ids=[...]) call."""
+        if not messages:
+            return messages
+        first, last = messages[0], messages[-1]
+        wanted = {m.grouped_id for m in (first, last) if m.grouped_id}
+        if not wanted:
+            return messages
+
+        candidate_ids = []
+        if first.grouped_id:
+            candidate_ids += range(max(first.id - self.ALBUM_MAX + 1, 1), first.id)
+        if last.grouped_id:
+            candidate_ids += range(last.id + 1, last.id + self.ALBUM_MAX)
+        have = {m.id for m in messages}
+        candidate_ids = [i for i in candidate_ids if i not in done_ids and i not in have]
+        if not candidate_ids:
+            return messages
+
+        extra = [m for m in self.telegram_service.get_messages_by_ids(ch_id, candidate_ids) if m.grouped_id in wanted]
+        if not extra:
+            return messages
+        self.progress.add_found(len(extra))
+        return sorted(messages + extra, key=lambda m: m.id)
+
+    # --- Post pipeline ---
+
+    PIPELINE_DEPTH = 4  # posts being translated/downloaded ahead of the one being saved
+
+    def process_posts(self, ch_id, ch_title, posts, source="live"):
+        """Saves posts (messages or whole albums) in order, yielding (post, Markdown path
+        or None) as each is committed. Only source="live" posts advance the channel's
+        last_message_id.
+
+        The network half of each post (translation and media downloads) runs as a
+        coroutine on the Telethon loop, up to PIPELINE_DEPTH posts ahead, so fetching,
+        downloading and translating overlap. Rendering and the journaled commit stay on
+        this thread and in id order. A stop or pause lets the posts already in flight
+        finish and be saved.
+
+        The CPU-bound part (Markdown conversion, language detection, SimHash) is done
+        for the whole batch up front by the CpuStage pool when one is configured."""
+        posts = list(posts)
+        analyses = self.cpu_stage.analyze(posts, simhash=bool(self.dedup)) if self.cpu_stage else None
+        pending = iter(enumerate(posts))
+        in_flight = collections.deque()
+        exhausted = False
+        while True:
+            if not in_flight and not exhausted and self.should_stop():
+                break
+            while not exhausted and len(in_flight) < self.PIPELINE_DEPTH and not (self.stop_requested or self.is_paused):
+                i, post = next(pending, (None, None))
+                if post is None:
+                    exhausted = True
+                    break
+                analysis = analyses[i] if analyses else analyze_post(post_record(post, simhash=bool(self.dedup)))
+                in_flight.append((post, self.telegram_service.submit(self.prepare_post(ch_id, post, analysis))))
+            if not in_flight:
+                if exhausted or self.stop_requested:
+                    break
+                continue  # paused; should_stop() above waits for resume
+            post, future = in_flight.popleft()
+            yield post, self.save_post(ch_id, ch_title, post, future.result(), source)
+
+    async def prepare_post(self, ch_id, post, analysis):
+        """Translates the post's text and downloads its media concurrently."""
+        (translated, translation_note), media = await asyncio.gather(
+            self.translate_post(ch_id, post[0].id, analysis),
+            self.download_post_media(ch_id, post)
+        )
+        thumbnails = {}
+        if self.image_stage and media[0]:
+            image_paths, thumbnails = await self.image_stage.process(media[0])
+            media = (image_paths, *media[1:])
+        return {
+            "analysis": analysis,
+            "translated": translated,
+            "translation_note": translation_note,
+            "media": media,
+            "thumbnails": thumbnails,
+        }
+
+    def save_post(self, ch_id, ch_title, post, prepared, source="live"):
+        """Renders and commits one prepared post. Returns the Markdown path or None."""
+        primary = post[0]
+        msg_id = primary.id
+        image_paths, attachment_paths, skipped_media = prepared["media"]
+        analysis = prepared["analysis"]
+
+        try:
+            fpath, content = FileManager.render_markdown(
+                channel_name=ch_title,
+                message_text=analysis["markdown"],
+                translated_text=prepared["translated"],
+                message_id=msg_id,
+                message_date=primary.date,
+                output_dir=self.output_dir,
+                is_korean_skipped=analysis["is_korean"],
+                image_paths=image_paths,
+                attachment_paths=attachment_paths,
+                skipped_media=skipped_media,
+                translation_note=prepared["translation_note"],
+                thumbnails=prepared.get("thumbnails")
+            )
+            self.commit_section(ch_id, msg_id, fpath, content, source=source, member_ids=[m.id for m in post[1:]])
+        except Exception as e:
+            self.log(f"    Error saving file for {msg_id}: {e}")
+            self.progress.message_done(failed=True, count=len(post))
+            return None
+
+        self.progress.message_done(count=len(post))
+        return fpath
+
+    # --- Translation (coroutines on the Telethon loop) ---
+
+    async def translate_post(self, ch_id, msg_id, analysis):
+        if not analysis["text"]:
+            return "", None
+        if analysis["is_korean"]:
+            self.log(f"    Skipping translation for {msg_id} (Korean detected).", verbose=True)
+            return "", None
+        translated, note = await self.translate_text(ch_id, msg_id, analysis["text"], analysis["simhash"])
+        if not translated:
+            self.log(f"    Translation failed for {msg_id}. Saving original.")
+        return translated, note
+
+    async def _translate(self, msg_id, text):
+        self.log(f"    Translating msg {msg_id}...", verbose=True)
+        self.progress.translation_started()
+        try:
+            return await self.translator.translate_to_korean_async(text)
+        finally:
+            self.progress.translation_finished()
+
+    async def translate_text(self, ch_id, msg_id, text, simhash=None):
+        """Translates `text`, reusing the translation of a near-duplicate when one is
+        indexed. Returns (translation, note for the Markdown or None)."""
+        match = self.dedup.find(text, simhash) if self.dedup else None
+        if match:
+            entry, dist = match
+            ref = entry['message_id']
+            plan = NearDuplicateIndex.patch_plan(text, entry)
+            if plan is None:
+                # Paragraphs can't be aligned; only an identical SimHash reuses the whole translation
+                plan = [entry['translation']] if dist == 0 else [None]
+            missing = [i for i, tr in enumerate(plan) if tr is None]
+            if not missing:
+                self.log(f"    Reusing translation of {ref} for {msg_id} (distance {dist}).", verbose=True)
+                return "\n\n".join(plan), f"번역 재사용: 유사 메시지 {ref}의 번역"
+            if len(missing) * 2 <= len(plan):
+                paragraphs = split_paragraphs(text)
+                self.log(f"    Translating {len(missing)}/{len(plan)} changed paragraph(s) of {msg_id} (similar to {ref}).", verbose=True)
+                results = await asyncio.gather(*(self._translate(msg_id, paragraphs[i]) for i in missing))
+                if all(results):
+                    for i, tr in zip(missing, results):
+                        plan[i] = tr
+                    translated = "\n\n".join(plan)
+                    self.dedup.add(ch_id, msg_id, text, translated, simhash)
+                    return translated, f"부분 번역: 유사 메시지 {ref}와 다른 문단만 새로 번역"
+            # Too different (or a paragraph failed): translate the whole post
+
+        translated = await self._translate(msg_id, text)
+        if self.dedup and translated:
+            self.dedup.add(ch_id, msg_id, text, translated, simhash)
+        return translated, None
+
+    def telegram_services(self) -> list:
+        if self.session_pool:
+            return list(self.session_pool.services.values())
+        return [self.telegram_service]
+
+    def report_run_stats(self):
+        memory = self.telegram_service.memory_report()
+        if memory:
+            self.log(memory)
+        for service in self.telegram_services():
+            floods = service.flood_report()
+            if floods:
+                self.log(floods)
+        if self.translator.router.models:
+            self.log(f"Translation model stats ({self.translator.router.run_switches} routing switch(es) this run):")
+            for line in self.translator.router.report_lines():
+                self.log(line)
+        images = self.image_stage.report() if self.image_stage else None
+        if images:
+            self.log(images)
+
+    # --- Media ---
+
+    async def download_post_media(self, ch_id, post):
+        """Downloads the post's media allowed by the media policy.
+        Returns (image_paths, attachment_paths, skipped_media notes)."""
+        primary = post[0]
+        # Use same date logic as FileManager
+        sub_folder = os.path.join(self.output_dir, FileManager.get_target_directory_name(primary.date))
+
+        photos, files, skipped = [], [], []
+        for m in post:
+            kind = MediaPolicy.classify(m)
+            if kind is None:
+                continue
+            allowed, reason = self.media_policy.check(m, ch_id)
+            if not allowed:
+                name = m.media.name or kind
+                skipped.append(f"{name}, {reason}")
+                self.log(f"    Skipping {kind} in {m.id}: {reason}", verbose=True)
+                continue
+            if kind == "photo":
+                photos.append((m, os.path.join(sub_folder, "images", MediaPolicy.target_filename(m, ch_id))))
+            else:
+                files.append((m, os.path.join(sub_folder, "files", MediaPolicy.target_filename(m, ch_id)),
+                              self.media_policy.max_bytes(kind, ch_id)))
+
+        image_paths = []
+        if photos:
+            os.makedirs(os.path.join(sub_folder, "images"), exist_ok=True)
+            # The whole album is fetched concurrently
+            self.log(f"    Downloading {len(photos)} image(s) for {primary.id}...", verbose=True)
+            for (m, _), path in zip(photos, await self.telegram_service.download_media_batch_async(photos)):
+                if path:
+                    image_paths.append(path)
+                else:
+                    self.log(f"    Image download failed for {m.id}")
+
+        attachment_paths = []
+        if files:
+            os.makedirs(os.path.join(sub_folder, "files"), exist_ok=True)
+            self.log(f"    Downloading {len(files)} file(s) for {primary.id}...", verbose=True)
+            for (m, _, _), path in zip(files, await self.telegram_service.download_streamed_batch_async(files)):
+                if path:
+                    attachment_paths.append(path)
+                else:
+                    self.log(f"    File download failed for {m.id}")
+
+        return image_paths, attachment_paths, skipped
+
+    # --- Crash-consistent commit ---
+
+    def commit_section(self, ch_id, msg_id, filepath, content, source="live", member_ids=()):
+        """Appends one Markdown section and records it, so that at any crash point the
+        file and the DB can be reconciled by recover_pending()."""
+        data = FileManager.encode_section(content)
+        filepath = FileManager.normalize_path(filepath)
+        with self._commit_lock:
+            offset = FileManager.get_file_size(filepath)
+            self.db.begin_message(ch_id, msg_id, filepath, offset, len(data), FileManager.content_hash(data), source=source, member_ids=member_ids)
+            try:
+                FileManager.append_section(filepath, data)
+            except Exception:
+                # Nothing (or a partial section) reached the file; undo both sides now
+                FileManager.truncate_file(filepath, offset)
+                self.db.discard_message(ch_id, msg_id, member_ids=member_ids)
+                raise
+            self.db.commit_message(ch_id, msg_id, advance_checkpoint=(source == "live"), member_ids=member_ids)
+
+    def recover_pending(self):
+        """Reconciles messages left 'pending' by a crash: keeps sections that are fully on
+        disk, truncates partial ones. At most the in-flight message is redone.
+
+        Live processes only hold pending rows inside the commit lock, so under it every
+        pending row left is a crashed process's."""
+        with self._commit_lock:
+            self._recover_pending()
+
+    def _recover_pending(self):
+        for row in self.db.get_pending_messages():
+            ch_id, msg_id, fpath = row['channel_id'], row['message_id'], row['file_path']
+            if FileManager.section_matches(fpath, row['byte_offset'], row['byte_length'], row['content_hash']):
+                self.db.commit_message(ch_id, msg_id, advance_checkpoint=(row['source'] == "live"))
+                self.log(f"Recovered message {msg_id} (channel {ch_id}) written before an interruption.")
+            else:
+                FileManager.truncate_file(fpath, row['byte_offset'])
+                self.db.discard_message(ch_id, msg_id)
+                self.log(f"Rolled back partial write of message {msg_id} (channel {ch_id}); it will be collected again.")
+
+    # --- Repairing one section (see ArchiveManifest) ---
+
+    def retranslate_section(self, ch_id, msg_id, translated_text=None):
+        """Replaces the translation in one message's section, in place. Without
+        `translated_text` the original text in the section is translated again.
+        Returns the new translation."""
+        manifest = ArchiveManifest(self.db)
+        if translated_text is None:
+            section = manifest.read(ch_id, msg_id)
+            if section is None:
+                raise KeyError(f"No recorded section for message {msg_id} of channel {ch_id}")
+            original = FileManager.original_text(section)
+            if not original:
+                raise ValueError(f"Message {msg_id} has no text to translate")
+            # Outside the commit lock: collectors in other processes keep appending
+            self.log(f"Translating msg {msg_id} again...")
+            translated_text = self.telegram_service.submit(self.translator.translate_to_korean_async(original)).result()
+            if not translated_text:
+                raise ValueError(f"Translation of message {msg_id} failed")
+        with self._commit_lock:
+            # Re-read under the lock; earlier rewrites in the file may have moved it
+            section = manifest.read(ch_id, msg_id)
+            if section is None:
+                raise KeyError(f"No recorded section for message {msg_id} of channel {ch_id}")
+            before, _, after = FileManager.split_translation(section)
+            manifest.rewrite(ch_id, msg_id, f"{before}{translated_text}\n{after}")
+        self.log(f"Rewrote the translation of message {msg_id} (channel {ch_id}).")
+        return translated_text
+
+    # --- Sync state (sync log in the output directory) ---
+
+    def sync_from_file(self):
+        if not self.output_dir or not os.path.exists(self.output_dir):
+            return
+
+        sync_log = SyncLog(self.db, self.output_dir)
+        if os.path.isdir(sync_log.dir):
+            try:
+                applied = sync_log.apply()
+                self.log(f"Applied {applied} sync log entries from other devices.")
+            except Exception as e:
+                self.log(f"Error applying sync log: {e}")
+            return
+
+        # sync_state.json is the single-file state written before the sync log existed
+        self.log("Checking for sync state file...")
+        sync_data = FileManager.load_sync_state(self.output_dir)
+        if sync_data:
+            try:
+                self.db.update_from_sync_data(sync_data)
+                self.log(f"Synced {len(sync_data)} channels from sync_state.json.")
+            except Exception as e:
+                self.log(f"Error updating from sync file: {e}")
+        else:
+            self.log("No sync file found or file is empty.")
+
+    def sync_to_file(self):
+        if not self.output_dir or not os.path.exists(self.output_dir):
+            return
+
+        try:
+            written = SyncLog(self.db, self.output_dir).export()
+            self.log(f"Sync log: {written} channel change(s) appended.")
+        except Exception as e:
+            self.log(f"Error writing sync log: {e}")
@@ -0,0 +1,138 @@
+import asyncio
+import random
+from telethon import errors, functions
+from .governor import RequestGovernor
+
+# Failures worth a reconnect and retry; anything else (bad peer, no access, ...) is final
+TRANSIENT_ERRORS = (ConnectionError, asyncio.TimeoutError, errors.ServerError, errors.TimedOutError)
+
+class TelegramUnavailable(Exception):
+    """A Telegram call still failed after reconnecting and retrying. Raised instead of
+    returning an empty result, so an outage is never mistaken for "no new messages"."""
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    # Exponential with jitter (half fixed, half random) so several clients don't retry in lockstep
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+class ConnectionManager:
+    """Keeps one TelegramClient connected for a TelegramService.
+
+    Every RPC goes through call(), which waits while a reconnect is in progress (calls
+    queue on the same event instead of each reconnecting on its own), retries
+    transient failures with jittered backoff, and raises TelegramUnavailable when they
+    persist. A keepalive task pings the server so a silently dropped connection is
+    noticed and re-established before the next call needs it. Authorization is
+    checked once and cached.
+    """
+    KEEPALIVE_SEC = 60
+    PING_TIMEOUT_SEC = 15
+    BACKOFF_BASE_SEC = 1.0
+    BACKOFF_MAX_SEC = 60.0
+    RECONNECT_ATTEMPTS = 8
+    CALL_ATTEMPTS = 4
+    FLOOD_RETRIES = 3
+
+    def __init__(self, client, name: str, governor: RequestGovernor):
+        self.client = client
+        self.name = name
+        self.governor = governor
+        self.authorized = None         # cached result of is_user_authorized()
+        self.reconnects = 0
+        self._ready = asyncio.Event()  # set while connected; callers wait on it
+        self._reconnect_task = None
+        self._keepalive_task = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self._ready.is_set() and self.client.is_connected()
+
+    def mark_connected(self, authorized: bool):
+        """Called after the initial connect/login on the client loop."""
+        self.authorized = authorized
+        if authorized:
+            self._ready.set()
+            if self._keepalive_task is None:
+                self._keepalive_task = asyncio.ensure_future(self._keepalive_loop())
+
+    def mark_disconnected(self):
+        self._ready.clear()
+
+    async def ensure(self):
+        """Returns once connected, reconnecting if needed."""
+        if self.is_connected:
+            return
+        if self.authorized is False:
+            raise TelegramUnavailable(f"[{self.name}] not logged in")
+        self._ready.clear()
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.ensure_future(self._reconnect())
+        if not await asyncio.shield(self._reconnect_task):
+            raise TelegramUnavailable(f"[{self.name}] could not reconnect to Telegram")
+
+    async def _reconnect(self) -> bool:
+        for attempt in range(self.RECONNECT_ATTEMPTS):
+            try:
+                if not self.client.is_connected():
+                    await self.client.connect()
+                if self.authorized is None:
+                    self.authorized = await self.client.is_user_authorized()
+                if not self.authorized:
+                    return False
+                self.reconnects += 1
+                self._ready.set()
+                if self._keepalive_task is None:
+                    self._keepalive_task = asyncio.ensure_future(self._keepalive_loop())
+                return True
+            except TRANSIENT_ERRORS + (OSError,) as e:
+                delay = backoff_delay(attempt, self.BACKOFF_BASE_SEC, self.BACKOFF_MAX_SEC)
+                print(f"[{self.name}] Reconnect failed ({e}); retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+        return False
+
+    async def call(self, factory, what: str, kind: str):
+        """Runs `await factory()` connected and paced as a `kind` request (see
+        RequestGovernor), retrying transient failures and FloodWaits the governor
+        accepts. `factory` must start (or resume) the request itself each time."""
+        last_error = None
+        attempt = floods = 0
+        while attempt < self.CALL_ATTEMPTS:
+            await self.governor.acquire(kind)
+            await self.ensure()
+            try:
+                return await factory()
+            except errors.FloodWaitError as e:
+                floods += 1
+                if floods > self.FLOOD_RETRIES or not self.governor.flood(kind, e.seconds):
+                    raise
+            except TRANSIENT_ERRORS as e:
+                last_error = e
+                attempt += 1
+                if isinstance(e, ConnectionError) or not self.client.is_connected():
+                    self.mark_disconnected()
+                if attempt < self.CALL_ATTEMPTS:
+                    delay = backoff_delay(attempt - 1, self.BACKOFF_BASE_SEC, self.BACKOFF_MAX_SEC)
+                    print(f"[{self.name}] {what} failed ({e}); retrying in {delay:.1f}s...")
+                    await asyncio.sleep(delay)
+        raise TelegramUnavailable(f"[{self.name}] {what} failed after {self.CALL_ATTEMPTS} attempts: {last_error}")
+
+    async def _keepalive_loop(self):
+        while True:
+            await asyncio.sleep(self.KEEPALIVE_SEC)
+            if not self._ready.is_set():
+                continue
+            try:
+                await asyncio.wait_for(
+                    self.client(functions.PingRequest(ping_id=random.getrandbits(63))), self.PING_TIMEOUT_SEC
+                )
+            except Exception as e:
+                print(f"[{self.name}] Keepalive failed ({e}); reconnecting...")
+                self.mark_disconnected()
+                try:
+                    await self.client.disconnect()
+                except Exception:
+                    pass
+                try:
+                    await self.ensure()
+                except TelegramUnavailable as e:
+                    print(e)
@@ -0,0 +1,67 @@
+import concurrent.futures
+import multiprocessing
+from .text_utils import TextUtils
+from .dedup import SimHash, NearDuplicateIndex
+
+def post_record(post, simhash: bool = False) -> dict:
+    """Plain data of a post (MessageRecords of a message or album) needed by analyze_post.
+    Media handles are left out, so the record stays picklable."""
+    return {
+        "id": post[0].id,
+        "parts": [(m.message, m.entities) for m in post if m.message],
+        "simhash": simhash,
+    }
+
+def analyze_post(record: dict) -> dict:
+    """The CPU-bound per-post work: Markdown conversion, language detection and the
+    SimHash used for near-duplicate lookup. Runs inline or in a worker process."""
+    text = "\n\n".join(message for message, _ in record["parts"])
+    simhash = None
+    if record["simhash"] and NearDuplicateIndex.indexable(text):
+        simhash = SimHash.compute(text)
+    return {
+        "id": record["id"],
+        "text": text,
+        "markdown": "\n\n".join(TextUtils.convert_entities_to_markdown(m, e) for m, e in record["parts"]),
+        "is_korean": TextUtils.is_korean(text),
+        "simhash": simhash,
+    }
+
+class CpuStage:
+    """Optional process pool for analyze_post, used when a batch of posts is large
+    enough (backfill windows, big catch-ups) to be worth the pickling.
+
+    Configured through settings.json: "cpu_pool": {"workers": 4, "chunk_size": 32}.
+    Without workers every post is analyzed inline on the collector thread.
+    """
+    MIN_BATCH = 64
+
+    def __init__(self, workers: int, chunk_size: int = 32):
+        self.workers = workers
+        self.chunk_size = max(1, chunk_size)
+        self._pool = None
+
+    @classmethod
+    def from_settings(cls, config: dict, workers: int = None):
+        config = config or {}
+        workers = workers if workers is not None else config.get("workers", 0)
+        if not workers:
+            return None
+        return cls(workers, config.get("chunk_size", 32))
+
+    def analyze(self, posts, simhash: bool = False) -> list:
+        """analyze_post for every post, in order."""
+        records = [post_record(p, simhash) for p in posts]
+        if len(records) < self.MIN_BATCH:
+            return [analyze_post(r) for r in records]
+        if self._pool is None:
+            # spawn: forking a process that runs the Telethon loop thread is unsafe
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return list(self._pool.map(analyze_post, records, chunksize=self.chunk_size))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
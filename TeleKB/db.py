@@ -1,4 +1,5 @@
 import sqlite3
+import threading
 import time
 from typing import List, Optional, Tuple
 
@@ -6,6 +7,9 @@ class Database:
     def __init__(self, db_path: str):
         self.db_path = db_path
         self.conn = None
+        # Taken by every write on the shared connection: a commit from one thread would
+        # otherwise also commit another thread's half-finished transaction
+        self.lock = threading.RLock()
         self.init_db()
 
     def get_connection(self):
@@ -43,36 +47,143 @@ class Database:
             )
         ''')
         
+        # Journal columns for crash-consistent commits (see begin_message/commit_message).
+        # Rows written before these existed are complete, hence the 'done' default.
+        self._ensure_columns(cursor, "messages", {
+            "status": "TEXT DEFAULT 'done'",
+            "byte_offset": "INTEGER",
+            "byte_length": "INTEGER",
+            "content_hash": "TEXT",
+            "source": "TEXT DEFAULT 'live'",
+        })
+        
+        # Manifest lookups by file (ArchiveManifest.verify, shifting offsets after a rewrite)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_file ON messages(file_path, byte_offset)")
+        
+        # Scheduling (see ChannelScheduler): higher priority first, weight = share of a
+        # run among equal priorities, max_per_run caps messages per run (NULL: no cap)
+        self._ensure_columns(cursor, "channels", {
+            "priority": "INTEGER DEFAULT 0",
+            "weight": "INTEGER DEFAULT 1",
+            "max_per_run": "INTEGER",
+        })
+        
+        # Historical backfills, tracked apart from the live last_message_id checkpoint.
+        # Each job covers an inclusive id range split into windows fetched concurrently.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS backfill_jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel_id INTEGER NOT NULL,
+                first_id INTEGER NOT NULL,
+                last_id INTEGER NOT NULL,
+                status TEXT DEFAULT 'pending',
+                created_at INTEGER,
+                updated_at INTEGER
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS backfill_windows (
+                job_id INTEGER NOT NULL,
+                first_id INTEGER NOT NULL,
+                last_id INTEGER NOT NULL,
+                status TEXT DEFAULT 'pending',
+                UNIQUE(job_id, first_id)
+            )
+        ''')
+        
+        # SimHash index of translated messages, used to reuse translations of near-duplicates
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS translation_index (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel_id INTEGER,
+                message_id INTEGER,
+                simhash INTEGER NOT NULL,
+                source_text TEXT,
+                translation TEXT,
+                created_at INTEGER
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_translation_index_created ON translation_index(created_at)")
+        
+        # Multi-account collection: which Telegram session collects each channel, and
+        # until when a session is blocked by a FloodWait
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS channel_sessions (
+                channel_id INTEGER PRIMARY KEY,
+                session_name TEXT NOT NULL,
+                updated_at INTEGER
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS telegram_sessions (
+                session_name TEXT PRIMARY KEY,
+                flood_until INTEGER DEFAULT 0,
+                flood_count INTEGER DEFAULT 0,
+                updated_at INTEGER
+            )
+        ''')
+        
+        # Delta sync log (see SyncLog): this device's id and export position, how far
+        # each other device's log has been applied, and what was last exported per channel
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_cursors (
+                device_id TEXT PRIMARY KEY,
+                byte_offset INTEGER NOT NULL,
+                updated_at INTEGER
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_exported (
+                channel_id INTEGER PRIMARY KEY,
+                fingerprint TEXT
+            )
+        ''')
+        
         conn.commit()
 
+    def _ensure_columns(self, cursor, table: str, columns: dict):
+        """Adds missing columns to an existing table (lightweight migration)."""
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in cursor.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
     def add_channel(self, channel_id: int, title: str, username: Optional[str], last_message_id: int):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        now = int(time.time())
-        try:
-            cursor.execute('''
-                INSERT INTO channels (channel_id, title, username, last_message_id, is_enabled, created_at, updated_at)
-                VALUES (?, ?, ?, ?, 1, ?, ?)
-            ''', (channel_id, title, username, last_message_id, now, now))
-            conn.commit()
-            return True
-        except sqlite3.IntegrityError:
-            # Already exists, just enable it if disabled? Spec says:
-            # "추가한 시점 이후의 메시지부터 수집 대상이 된다." -> re-adding logic might be needed if it was fully deleted?
-            # But here we are just adding. If it exists, maybe we should update last_message_id if it was disabled?
-            # Spec 3.3 says "Soft delete".
-            # If re-adding a soft-deleted channel, we should re-enable it and update last_message_id?
-            # Spec 3.3: "제거 후 재추가 시에도 “추가 시점 이후만 수집” 정책으로 과거 재생성은 발생하지 않아야 한다."  
-             cursor.execute('''
-                UPDATE channels 
-                SET is_enabled = 1, last_message_id = ?, updated_at = ?
-                WHERE channel_id = ?
-            ''', (last_message_id, now, channel_id))
-             conn.commit()
-             return True
-        except Exception as e:
-            print(f"Error adding channel: {e}")
-            return False
+        with self.lock:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            now = int(time.time())
+            try:
+                cursor.execute('''
+                    INSERT INTO channels (channel_id, title, username, last_message_id, is_enabled, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, 1, ?, ?)
+                ''', (channel_id, title, username, last_message_id, now, now))
+                conn.commit()
+                return True
+            except sqlite3.IntegrityError:
+                # Already exists, just enable it if disabled? Spec says:
+                # "추가한 시점 이후의 메시지부터 수집 대상이 된다." -> re-adding logic might be needed if it was fully deleted?
+                # But here we are just adding. If it exists, maybe we should update last_message_id if it was disabled?
+                # Spec 3.3 says "Soft delete".
+                # If re-adding a soft-deleted channel, we should re-enable it and update last_message_id?
+                # Spec 3.3: "제거 후 재추가 시에도 “추가 시점 이후만 수집” 정책으로 과거 재생성은 발생하지 않아야 한다."  
+                 cursor.execute('''
+                    UPDATE channels 
+                    SET is_enabled = 1, last_message_id = ?, updated_at = ?
+                    WHERE channel_id = ?
+                ''', (last_message_id, now, channel_id))
+                 conn.commit()
+                 return True
+            except Exception as e:
+                print(f"Error adding channel: {e}")
+                return False
 
     def get_channels(self, only_enabled=True) -> List[sqlite3.Row]:
         conn = self.get_connection()
@@ -83,81 +194,398 @@ class Database:
             cursor.execute("SELECT * FROM channels")
         return cursor.fetchall()
         
-    def delete_channel(self, channel_id: int):
+    def get_channel(self, channel_id: int) -> Optional[sqlite3.Row]:
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM channels WHERE channel_id = ?", (channel_id,))
-        conn.commit()
+        cursor.execute("SELECT * FROM channels WHERE channel_id = ?", (channel_id,))
+        return cursor.fetchone()
+        
+    def delete_channel(self, channel_id: int):
+        with self.lock:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM channels WHERE channel_id = ?", (channel_id,))
+            conn.commit()
 
-    def update_last_message_id(self, channel_id: int, message_id: int):
+    def set_channel_schedule(self, channel_id: int, priority: int, weight: int, max_per_run: Optional[int]):
+        with self.lock:
+            conn = self.get_connection()
+            now = int(time.time())
+            conn.execute("UPDATE channels SET priority = ?, weight = ?, max_per_run = ?, updated_at = ? WHERE channel_id = ?",
+                         (priority, max(1, weight), max_per_run or None, now, channel_id))
+            conn.commit()
+
+    def get_checkpoints(self, channel_ids) -> dict:
         conn = self.get_connection()
-        cursor = conn.cursor()
-        # Only update if new message_id is greater than current? 
-        # Ideally yes, but the caller should handle logic. We just update.
-        # But wait, we might process messages in parallel or out of order? 
-        # Spec 3.4 says "성공적으로 저장된 메시지 중 최대 message_id로 해당 채널의 last_message_id를 갱신한다."
-        # So we should probably check MAX.
-        cursor.execute("UPDATE channels SET last_message_id = MAX(last_message_id, ?) WHERE channel_id = ?", (message_id, channel_id))
-        conn.commit()
+        ids = list(channel_ids)
+        cursor = conn.execute(f"SELECT channel_id, last_message_id FROM channels WHERE channel_id IN ({','.join('?' * len(ids))})", ids)
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+    def update_last_message_id(self, channel_id: int, message_id: int):
+        with self.lock:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            # Only update if new message_id is greater than current? 
+            # Ideally yes, but the caller should handle logic. We just update.
+            # But wait, we might process messages in parallel or out of order? 
+            # Spec 3.4 says "성공적으로 저장된 메시지 중 최대 message_id로 해당 채널의 last_message_id를 갱신한다."
+            # So we should probably check MAX.
+            cursor.execute("UPDATE channels SET last_message_id = MAX(last_message_id, ?) WHERE channel_id = ?", (message_id, channel_id))
+            conn.commit()
 
     def is_message_processed(self, channel_id: int, message_id: int) -> bool:
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM messages WHERE channel_id = ? AND message_id = ?", (channel_id, message_id))
+        cursor.execute("SELECT 1 FROM messages WHERE channel_id = ? AND message_id = ? AND status = 'done'", (channel_id, message_id))
         return cursor.fetchone() is not None
 
-    def save_message_log(self, channel_id: int, message_id: int, file_path: str):
+    def get_processed_message_ids(self, channel_id: int, min_id: int = 0) -> set:
         conn = self.get_connection()
         cursor = conn.cursor()
-        now = int(time.time())
-        try:
-            cursor.execute("INSERT INTO messages (channel_id, message_id, file_path, created_at) VALUES (?, ?, ?, ?)", (channel_id, message_id, file_path, now))
+        cursor.execute("SELECT message_id FROM messages WHERE channel_id = ? AND message_id > ? AND status = 'done'", (channel_id, min_id))
+        return {row[0] for row in cursor.fetchall()}
+
+    # --- Per-message commit protocol ---
+    # 1. begin_message: record the intended append (file, offset, length, hash) as 'pending'
+    # 2. the caller appends the section to the Markdown file and fsyncs it
+    # 3. commit_message: mark the row 'done' and advance last_message_id in one transaction
+    # After a crash, pending rows are either rolled forward (the section is fully on disk)
+    # or rolled back (file truncated to byte_offset) by Collector.recover_pending().
+
+    def begin_message(self, channel_id: int, message_id: int, file_path: str, byte_offset: int, byte_length: int, content_hash: str, source: str = "live", member_ids=()):
+        """member_ids: other messages rendered into the same section (album members)."""
+        with self.lock:
+            conn = self.get_connection()
+            now = int(time.time())
+            conn.executemany('''
+                INSERT OR REPLACE INTO messages (channel_id, message_id, file_path, created_at, status, byte_offset, byte_length, content_hash, source)
+                VALUES (?, ?, ?, ?, 'pending', ?, ?, ?, ?)
+            ''', [(channel_id, mid, file_path, now, byte_offset, byte_length, content_hash, source) for mid in (message_id, *member_ids)])
             conn.commit()
-        except sqlite3.IntegrityError:
-            pass # Already processed
 
-    def update_channel_title(self, channel_id: int, title: str):
+    def commit_message(self, channel_id: int, message_id: int, advance_checkpoint: bool = True, member_ids=()):
+        ids = (message_id, *member_ids)
+        with self.lock:
+            conn = self.get_connection()
+            try:
+                conn.executemany("UPDATE messages SET status = 'done' WHERE channel_id = ? AND message_id = ?", [(channel_id, mid) for mid in ids])
+                if advance_checkpoint:
+                    conn.execute("UPDATE channels SET last_message_id = MAX(last_message_id, ?) WHERE channel_id = ?", (max(ids), channel_id))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def discard_message(self, channel_id: int, message_id: int, member_ids=()):
+        with self.lock:
+            conn = self.get_connection()
+            conn.executemany("DELETE FROM messages WHERE channel_id = ? AND message_id = ? AND status = 'pending'", [(channel_id, mid) for mid in (message_id, *member_ids)])
+            conn.commit()
+
+    def get_pending_messages(self) -> List[sqlite3.Row]:
         conn = self.get_connection()
         cursor = conn.cursor()
-        now = int(time.time())
-        cursor.execute("UPDATE channels SET title = ?, updated_at = ? WHERE channel_id = ?", (title, now, channel_id))
-        conn.commit()
+        # Newest first: rolling back a later append must happen before an earlier one in the same file
+        cursor.execute("SELECT * FROM messages WHERE status = 'pending' ORDER BY byte_offset DESC")
+        return cursor.fetchall()
+
+    # --- Archive manifest ---
+    # Done rows with a byte range are the manifest of the Markdown archive: where each
+    # message's section is, how long it is and its hash. Album members share their
+    # primary's section.
+
+    def get_section(self, channel_id: int, message_id: int) -> Optional[sqlite3.Row]:
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM messages
+            WHERE channel_id = ? AND message_id = ? AND status = 'done' AND file_path IS NOT NULL
+        ''', (channel_id, message_id))
+        return cursor.fetchone()
+
+    def get_manifest_rows(self, file_path: str = None) -> List[sqlite3.Row]:
+        """Done rows that name a file (all files, or one), by file and offset; rows
+        written before byte ranges were recorded have a NULL byte_offset."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        if file_path is None:
+            cursor.execute("SELECT * FROM messages WHERE status = 'done' AND file_path IS NOT NULL ORDER BY file_path, byte_offset")
+        else:
+            cursor.execute("SELECT * FROM messages WHERE status = 'done' AND file_path = ? ORDER BY byte_offset", (file_path,))
+        return cursor.fetchall()
+
+    def get_manifest_files(self) -> List[str]:
+        conn = self.get_connection()
+        return [row[0] for row in conn.execute("SELECT DISTINCT file_path FROM messages WHERE file_path IS NOT NULL")]
+
+    def set_section_locations(self, locations: List[Tuple[int, int, str, int]]):
+        """locations: (byte_offset, byte_length, content_hash, messages.id)."""
+        with self.lock:
+            conn = self.get_connection()
+            conn.executemany("UPDATE messages SET byte_offset = ?, byte_length = ?, content_hash = ? WHERE id = ?", locations)
+            conn.commit()
+
+    def replace_section(self, file_path: str, byte_offset: int, old_length: int, new_length: int, content_hash: str):
+        """Records a section rewritten in place: its new length and hash, and the shift
+        of every later section in the same file."""
+        with self.lock:
+            conn = self.get_connection()
+            try:
+                conn.execute('''
+                    UPDATE messages SET byte_length = ?, content_hash = ?
+                    WHERE file_path = ? AND byte_offset = ? AND status = 'done'
+                ''', (new_length, content_hash, file_path, byte_offset))
+                if new_length != old_length:
+                    conn.execute("UPDATE messages SET byte_offset = byte_offset + ? WHERE file_path = ? AND byte_offset > ?",
+                                 (new_length - old_length, file_path, byte_offset))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    # --- Backfill jobs ---
+
+    def create_backfill_job(self, channel_id: int, first_id: int, last_id: int, windows: List[Tuple[int, int]]) -> int:
+        with self.lock:
+            conn = self.get_connection()
+            now = int(time.time())
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO backfill_jobs (channel_id, first_id, last_id, status, created_at, updated_at)
+                VALUES (?, ?, ?, 'pending', ?, ?)
+            ''', (channel_id, first_id, last_id, now, now))
+            job_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO backfill_windows (job_id, first_id, last_id) VALUES (?, ?, ?)",
+                [(job_id, lo, hi) for lo, hi in windows]
+            )
+            conn.commit()
+            return job_id
+
+    def get_open_backfill_job(self, channel_id: int, first_id: int, last_id: int) -> Optional[sqlite3.Row]:
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM backfill_jobs
+            WHERE channel_id = ? AND first_id = ? AND last_id = ? AND status != 'done'
+            ORDER BY job_id DESC LIMIT 1
+        ''', (channel_id, first_id, last_id))
+        return cursor.fetchone()
+
+    def get_backfill_windows(self, job_id: int, only_pending: bool = True) -> List[sqlite3.Row]:
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        if only_pending:
+            cursor.execute("SELECT * FROM backfill_windows WHERE job_id = ? AND status != 'done' ORDER BY first_id", (job_id,))
+        else:
+            cursor.execute("SELECT * FROM backfill_windows WHERE job_id = ? ORDER BY first_id", (job_id,))
+        return cursor.fetchall()
+
+    def mark_backfill_window_done(self, job_id: int, first_id: int):
+        with self.lock:
+            conn = self.get_connection()
+            now = int(time.time())
+            conn.execute("UPDATE backfill_windows SET status = 'done' WHERE job_id = ? AND first_id = ?", (job_id, first_id))
+            conn.execute("UPDATE backfill_jobs SET updated_at = ? WHERE job_id = ?", (now, job_id))
+            conn.commit()
+
+    def finish_backfill_job(self, job_id: int):
+        with self.lock:
+            conn = self.get_connection()
+            now = int(time.time())
+            conn.execute("UPDATE backfill_jobs SET status = 'done', updated_at = ? WHERE job_id = ?", (now, job_id))
+            conn.commit()
+
+    # --- Translation index ---
+
+    def add_translation_index(self, channel_id: int, message_id: int, simhash: int, source_text: str, translation: str) -> int:
+        # SQLite integers are signed 64-bit
+        if simhash >= 1 << 63:
+            simhash -= 1 << 64
+        with self.lock:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO translation_index (channel_id, message_id, simhash, source_text, translation, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (channel_id, message_id, simhash, source_text, translation, int(time.time())))
+            conn.commit()
+            return cursor.lastrowid
+
+    def get_translation_index(self, since: int) -> List[sqlite3.Row]:
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM translation_index WHERE created_at >= ?", (since,))
+        return cursor.fetchall()
+
+    # --- Session sharding ---
+
+    def get_channel_sessions(self) -> dict:
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT channel_id, session_name FROM channel_sessions")
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+    def set_channel_sessions(self, assignments: dict):
+        """assignments: channel_id -> session_name"""
+        with self.lock:
+            conn = self.get_connection()
+            now = int(time.time())
+            conn.executemany('''
+                INSERT INTO channel_sessions (channel_id, session_name, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(channel_id) DO UPDATE SET session_name = excluded.session_name, updated_at = excluded.updated_at
+            ''', [(channel_id, name, now) for channel_id, name in assignments.items()])
+            conn.commit()
+
+    def get_session_flood_until(self) -> dict:
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT session_name, flood_until FROM telegram_sessions")
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+    def record_session_flood(self, session_name: str, flood_until: int):
+        with self.lock:
+            conn = self.get_connection()
+            now = int(time.time())
+            conn.execute('''
+                INSERT INTO telegram_sessions (session_name, flood_until, flood_count, updated_at) VALUES (?, ?, 1, ?)
+                ON CONFLICT(session_name) DO UPDATE SET flood_until = excluded.flood_until,
+                    flood_count = flood_count + 1, updated_at = excluded.updated_at
+            ''', (session_name, flood_until, now))
+            conn.commit()
+
+    def get_recent_message_counts(self, since: int) -> dict:
+        """Messages saved per channel since `since`; used as the channel's load when balancing."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT channel_id, COUNT(*) FROM messages WHERE created_at >= ? GROUP BY channel_id", (since,))
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+    def update_channel_title(self, channel_id: int, title: str):
+        with self.lock:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            now = int(time.time())
+            cursor.execute("UPDATE channels SET title = ?, updated_at = ? WHERE channel_id = ?", (title, now, channel_id))
+            conn.commit()
 
     def get_sync_data(self) -> List[dict]:
         """Returns all channel metadata for synchronization."""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT channel_id, title, username, last_message_id, is_enabled FROM channels")
+        cursor.execute("SELECT channel_id, title, username, last_message_id, is_enabled, priority, weight, max_per_run, updated_at FROM channels")
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
 
     def update_from_sync_data(self, sync_data: List[dict]):
         """Updates local database from synchronization data."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        now = int(time.time())
-        for item in sync_data:
-            channel_id = item['channel_id']
-            title = item['title']
-            username = item.get('username')
-            last_message_id = item['last_message_id']
-            is_enabled = item.get('is_enabled', 1)
+        with self.lock:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            now = int(time.time())
+            for item in sync_data:
+                channel_id = item['channel_id']
+                title = item['title']
+                username = item.get('username')
+                last_message_id = item['last_message_id']
+                is_enabled = item.get('is_enabled', 1)
             
-            cursor.execute("SELECT 1 FROM channels WHERE channel_id = ?", (channel_id,))
-            if cursor.fetchone():
-                # Update existing channel
-                cursor.execute('''
-                    UPDATE channels 
-                    SET title = ?, username = ?, last_message_id = MAX(last_message_id, ?), is_enabled = ?, updated_at = ?
-                    WHERE channel_id = ?
-                ''', (title, username, last_message_id, is_enabled, now, channel_id))
-            else:
-                # Add new channel from sync
-                cursor.execute('''
-                    INSERT INTO channels (channel_id, title, username, last_message_id, is_enabled, created_at, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (channel_id, title, username, last_message_id, is_enabled, now, now))
-        conn.commit()
+                cursor.execute("SELECT 1 FROM channels WHERE channel_id = ?", (channel_id,))
+                if cursor.fetchone():
+                    # Update existing channel
+                    cursor.execute('''
+                        UPDATE channels 
+                        SET title = ?, username = ?, last_message_id = MAX(last_message_id, ?), is_enabled = ?, updated_at = ?
+                        WHERE channel_id = ?
+                    ''', (title, username, last_message_id, is_enabled, now, channel_id))
+                else:
+                    # Add new channel from sync
+                    cursor.execute('''
+                        INSERT INTO channels (channel_id, title, username, last_message_id, is_enabled, created_at, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (channel_id, title, username, last_message_id, is_enabled, now, now))
+                # Sync files written before scheduling existed carry no schedule; keep the local one
+                if 'priority' in item:
+                    cursor.execute("UPDATE channels SET priority = ?, weight = ?, max_per_run = ? WHERE channel_id = ?",
+                                   (item['priority'], item.get('weight', 1), item.get('max_per_run'), channel_id))
+            conn.commit()
+
+    # --- Delta sync log ---
+
+    def get_sync_meta(self, key: str, default=None):
+        conn = self.get_connection()
+        row = conn.execute("SELECT value FROM sync_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_sync_meta(self, values: dict):
+        with self.lock:
+            conn = self.get_connection()
+            conn.executemany("INSERT INTO sync_meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                             [(k, str(v)) for k, v in values.items()])
+            conn.commit()
+
+    def get_sync_cursors(self) -> dict:
+        conn = self.get_connection()
+        return {row[0]: row[1] for row in conn.execute("SELECT device_id, byte_offset FROM sync_cursors")}
+
+    def get_sync_fingerprints(self) -> dict:
+        conn = self.get_connection()
+        return {row[0]: row[1] for row in conn.execute("SELECT channel_id, fingerprint FROM sync_exported")}
+
+    def set_sync_fingerprints(self, fingerprints: dict):
+        with self.lock:
+            conn = self.get_connection()
+            conn.executemany('''
+                INSERT INTO sync_exported (channel_id, fingerprint) VALUES (?, ?)
+                ON CONFLICT(channel_id) DO UPDATE SET fingerprint = excluded.fingerprint
+            ''', list(fingerprints.items()))
+            conn.commit()
+
+    def get_processed_since(self, rowid: int) -> Tuple[List[Tuple[int, int]], int]:
+        """(channel_id, message_id) of messages committed here (not learned from sync)
+        after messages.id `rowid`, and the highest id seen."""
+        conn = self.get_connection()
+        rows = conn.execute('''
+            SELECT id, channel_id, message_id FROM messages
+            WHERE id > ? AND status = 'done' AND source != 'sync' ORDER BY id
+        ''', (rowid,)).fetchall()
+        return [(r[1], r[2]) for r in rows], (rows[-1][0] if rows else rowid)
+
+    def apply_sync_changes(self, channels: List[dict], processed: List[Tuple[int, int]], cursors: dict, device_id: str):
+        """Merges other devices' channel changes in one transaction: checkpoints take the
+        maximum, metadata the newer updated_at (last writer wins, ties going to the higher
+        device id). Processed ids are recorded as done so they are never collected here again."""
+        newer = ("(excluded.updated_at > COALESCE(channels.updated_at, 0) OR "
+                 "(excluded.updated_at = channels.updated_at AND :device > :local_device))")
+        with self.lock:
+            conn = self.get_connection()
+            now = int(time.time())
+            try:
+                conn.executemany(f'''
+                    INSERT INTO channels (channel_id, title, username, last_message_id, is_enabled, priority, weight, max_per_run, created_at, updated_at)
+                    VALUES (:channel_id, :title, :username, :last_message_id, :is_enabled, :priority, :weight, :max_per_run, :updated_at, :updated_at)
+                    ON CONFLICT(channel_id) DO UPDATE SET
+                        last_message_id = MAX(channels.last_message_id, excluded.last_message_id),
+                        title = CASE WHEN {newer} THEN excluded.title ELSE channels.title END,
+                        username = CASE WHEN {newer} THEN excluded.username ELSE channels.username END,
+                        is_enabled = CASE WHEN {newer} THEN excluded.is_enabled ELSE channels.is_enabled END,
+                        priority = CASE WHEN {newer} THEN excluded.priority ELSE channels.priority END,
+                        weight = CASE WHEN {newer} THEN excluded.weight ELSE channels.weight END,
+                        max_per_run = CASE WHEN {newer} THEN excluded.max_per_run ELSE channels.max_per_run END,
+                        updated_at = MAX(COALESCE(channels.updated_at, 0), excluded.updated_at)
+                ''', [{**c, "local_device": device_id} for c in channels])
+                conn.executemany('''
+                    INSERT INTO messages (channel_id, message_id, created_at, status, source) VALUES (?, ?, ?, 'done', 'sync')
+                    ON CONFLICT(channel_id, message_id) DO NOTHING
+                ''', [(channel_id, message_id, now) for channel_id, message_id in processed])
+                conn.executemany('''
+                    INSERT INTO sync_cursors (device_id, byte_offset, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT(device_id) DO UPDATE SET byte_offset = excluded.byte_offset, updated_at = excluded.updated_at
+                ''', [(device, offset, now) for device, offset in cursors.items()])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
 
     def close(self):
         if self.conn:
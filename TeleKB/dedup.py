@@ -0,0 +1,144 @@
+import hashlib
+import re
+import threading
+import time
+
+_URL_RE = re.compile(r'https?://(?:www\.)?([^/\s]+)\S*')
+_TOKEN_RE = re.compile(r'[#@]?\w+', re.UNICODE)
+
+def split_paragraphs(text: str) -> list:
+    return [p.strip() for p in re.split(r'\n\s*\n', text or "") if p.strip()]
+
+def normalize_paragraph(text: str) -> str:
+    # Unlike SimHash features, URLs are kept whole: a reused paragraph must not carry a stale link
+    return " ".join(text.lower().split())
+
+class SimHash:
+    BITS = 64
+
+    @staticmethod
+    def features(text: str) -> list:
+        # URLs are reduced to their domain so a changed tracking link doesn't count as an edit
+        tokens = _TOKEN_RE.findall(_URL_RE.sub(r'\1', text.lower()))
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    @staticmethod
+    def compute(text: str) -> int:
+        weights = [0] * SimHash.BITS
+        for feature in SimHash.features(text):
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+            for bit in range(SimHash.BITS):
+                weights[bit] += 1 if h >> bit & 1 else -1
+        value = 0
+        for bit, weight in enumerate(weights):
+            if weight > 0:
+                value |= 1 << bit
+        return value
+
+    @staticmethod
+    def distance(a: int, b: int) -> int:
+        return bin(a ^ b).count("1")
+
+class NearDuplicateIndex:
+    """SimHash index over recently translated messages.
+
+    Lookups use the pigeonhole trick: with max_distance = k the 64-bit hash is
+    split into k + 1 bands, and any hash within distance k shares at least one
+    band exactly, so only those buckets are compared.
+    """
+    MIN_TOKENS = 8  # shorter texts collide too easily to be trusted
+
+    def __init__(self, db, max_distance: int = 6, window_days: int = 30):
+        self.db = db
+        self.max_distance = max(0, int(max_distance))
+        self.window_days = window_days
+        self.bands = self.max_distance + 1
+        self.band_bits = SimHash.BITS // self.bands
+        self._buckets = [dict() for _ in range(self.bands)]
+        self._entries = {}  # entry id -> dict
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def from_settings(cls, db, config: dict):
+        config = config or {}
+        # Opt-in: a near-duplicate's translation is of different text
+        if not config.get("enabled", False):
+            return None
+        return cls(db, config.get("max_distance", 6), config.get("window_days", 30))
+
+    def _band_keys(self, value: int):
+        mask = (1 << self.band_bits) - 1
+        for i in range(self.bands):
+            yield i, (value >> (i * self.band_bits)) & mask
+
+    def _insert(self, entry: dict):
+        self._entries[entry['id']] = entry
+        for i, key in self._band_keys(entry['simhash']):
+            self._buckets[i].setdefault(key, []).append(entry['id'])
+
+    def _load(self):
+        since = int(time.time()) - self.window_days * 86400
+        for row in self.db.get_translation_index(since):
+            self._insert({
+                'id': row['id'],
+                'channel_id': row['channel_id'],
+                'message_id': row['message_id'],
+                'simhash': row['simhash'] & ((1 << SimHash.BITS) - 1),  # stored signed in SQLite
+                'source_text': row['source_text'],
+                'translation': row['translation'],
+            })
+
+    @classmethod
+    def indexable(cls, text: str) -> bool:
+        return len(_TOKEN_RE.findall(text or "")) >= cls.MIN_TOKENS
+
+    def find(self, text: str, value: int = None):
+        """Returns (entry, distance) for the closest indexed message within max_distance, or None.
+        `value` is the text's SimHash if already computed."""
+        if not self.indexable(text):
+            return None
+        if value is None:
+            value = SimHash.compute(text)
+        best = None
+        with self._lock:
+            candidates = set()
+            for i, key in self._band_keys(value):
+                candidates.update(self._buckets[i].get(key, ()))
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                dist = SimHash.distance(value, entry['simhash'])
+                if dist <= self.max_distance and (best is None or dist < best[1]):
+                    best = (entry, dist)
+        return best
+
+    def add(self, channel_id: int, message_id: int, text: str, translation: str, value: int = None):
+        if not translation or not self.indexable(text):
+            return
+        if value is None:
+            value = SimHash.compute(text)
+        entry_id = self.db.add_translation_index(channel_id, message_id, value, text, translation)
+        with self._lock:
+            self._insert({
+                'id': entry_id,
+                'channel_id': channel_id,
+                'message_id': message_id,
+                'simhash': value,
+                'source_text': text,
+                'translation': translation,
+            })
+
+    @staticmethod
+    def patch_plan(text: str, entry: dict):
+        """Aligns the new text's paragraphs with the matched message.
+
+        Returns a list with, per paragraph of `text`, either the reusable
+        translated paragraph or None (needs translation). Returns None if the
+        matched translation's paragraphs don't line up with its source.
+        """
+        old_src = split_paragraphs(entry['source_text'])
+        old_tr = split_paragraphs(entry['translation'])
+        if len(old_src) != len(old_tr):
+            return None
+        known = {normalize_paragraph(src): tr for src, tr in zip(old_src, old_tr)}
+        return [known.get(normalize_paragraph(p)) for p in split_paragraphs(text)]
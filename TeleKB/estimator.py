@@ -0,0 +1,115 @@
+from .connection import TelegramUnavailable
+from .progress import CollectionProgress
+from .text_utils import TextUtils
+from .translator import Translator
+
+class RunEstimator:
+    """Dry run: estimates what collecting the current backlog would take, per channel,
+    without fetching the history or calling Gemini.
+
+    The backlog comes from the dialogs' newest message ids against last_message_id (one
+    get_dialogs), and a sample of the newest pending messages of each channel gives the
+    share of content messages, text length (translation tokens and requests) and media
+    size under the media policy. Times assume the rates in settings.json:
+    "estimate": {"translate_rpm": 15, "translate_latency_sec": 3.0, "download_mb_per_sec": 2.0}
+    """
+    SAMPLE_SIZE = 20
+    HISTORY_PAGE = 100      # messages per GetHistory request
+    FETCH_PAGE_SEC = 0.5
+    DEFAULTS = {"translate_rpm": 15, "translate_latency_sec": 3.0, "download_mb_per_sec": 2.0}
+
+    def __init__(self, collector, config: dict = None):
+        self.collector = collector
+        self.config = {**self.DEFAULTS, **(config or {})}
+
+    def estimate(self, channels) -> list:
+        """One row (dict) per channel with pending messages, plus a final "Total" row."""
+        collector = self.collector
+        collector.top_message_ids = collector.load_top_message_ids()
+        pending = collector.pending_estimates(channels)
+        rows = []
+        for ch in channels:
+            backlog = pending.get(ch['channel_id'])
+            if backlog is None:
+                rows.append({"title": ch['title'], "note": "not in dialogs"})
+                continue
+            if ch['max_per_run']:
+                backlog = min(backlog, ch['max_per_run'])
+            if backlog > 0:
+                rows.append(self.estimate_channel(ch, backlog))
+        rows.append(self.total(rows))
+        return rows
+
+    def _service_for(self, ch_id):
+        pool = self.collector.session_pool
+        if pool:
+            for name in pool.connected:
+                if ch_id in pool.visible_channels(name):
+                    return pool.services[name]
+        return self.collector.telegram_service
+
+    def estimate_channel(self, ch, backlog: int) -> dict:
+        ch_id = ch['channel_id']
+        try:
+            records, sampled = self._service_for(ch_id).sample_messages(ch_id, ch['last_message_id'],
+                                                                      min(self.SAMPLE_SIZE, backlog))
+        except TelegramUnavailable as e:
+            return {"title": ch['title'], "pending": backlog, "note": f"sample failed: {e}"}
+        translator = self.collector.translator
+        tokens = requests = media_bytes = 0
+        for m in records:
+            if m.message and not TextUtils.is_korean(m.message):
+                tokens += Translator.estimate_tokens(m.message)
+                requests += len(Translator.split_into_chunks(m.message, translator.chunk_token_budget))
+            if m.media and m.media.size:
+                allowed, _ = self.collector.media_policy.check(m, ch_id)
+                if allowed:
+                    media_bytes += m.media.size
+        # Scale the sample up to the backlog
+        scale = backlog / sampled if sampled else 0
+        row = {
+            "title": ch['title'],
+            "pending": backlog,
+            "messages": round(len(records) * scale),
+            "tokens": round(tokens * scale),
+            "requests": round(requests * scale),
+            "media_bytes": round(media_bytes * scale),
+            "fetch_sec": -(-backlog // self.HISTORY_PAGE) * self.FETCH_PAGE_SEC,
+        }
+        row["seconds"] = self.wall_seconds(row)
+        return row
+
+    def translate_seconds(self, requests: int) -> float:
+        # Bounded by the request quota and by latency over the pipeline's concurrency
+        by_quota = requests / self.config["translate_rpm"] * 60
+        by_latency = requests * self.config["translate_latency_sec"] / self.collector.PIPELINE_DEPTH
+        return max(by_quota, by_latency)
+
+    def wall_seconds(self, row: dict) -> float:
+        download_sec = row["media_bytes"] / (self.config["download_mb_per_sec"] * 1024 * 1024)
+        # Translation and downloads of a post overlap in the pipeline
+        return row["fetch_sec"] + max(self.translate_seconds(row["requests"]), download_sec)
+
+    def total(self, rows) -> dict:
+        keys = ("pending", "messages", "tokens", "requests", "media_bytes", "fetch_sec")
+        total = {"title": "Total"}
+        for key in keys:
+            total[key] = sum(r.get(key, 0) for r in rows if "seconds" in r)
+        total["seconds"] = self.wall_seconds(total)
+        return total
+
+    @staticmethod
+    def format_table(rows) -> list:
+        lines = [f"{'Channel':<28} {'Pending':>8} {'Msgs':>7} {'Tokens':>9} {'Reqs':>6} {'Media':>9} {'Time':>8}"]
+        lines.append("-" * len(lines[0]))
+        for r in rows:
+            title = r["title"][:28]
+            if "seconds" not in r:
+                pending = r.get("pending", "?")
+                lines.append(f"{title:<28} {pending:>8}  ({r['note']})")
+                continue
+            if r["title"] == "Total":
+                lines.append("-" * len(lines[0]))
+            lines.append(f"{title:<28} {r['pending']:>8} {r['messages']:>7} {r['tokens']:>9} {r['requests']:>6} "
+                         f"{r['media_bytes'] / 1024 / 1024:>7.1f}MB {CollectionProgress.format_duration(r['seconds']):>8}")
+        return lines
@@ -1,5 +1,7 @@
 import os
 import datetime
+import hashlib
+import re
 from .text_utils import TextUtils
 
 class FileManager:
@@ -12,10 +14,14 @@ class FileManager:
         return local_date.strftime("%Y-%m")
 
     @staticmethod
-    def save_markdown(channel_name: str, message_text: str, translated_text: str, 
-                      message_id: int, message_date: datetime.datetime, 
-                      output_dir: str, is_korean_skipped: bool = False,
-                      image_paths: list = None) -> str:
+    def render_markdown(channel_name: str, message_text: str, translated_text: str, 
+                        message_id: int, message_date: datetime.datetime, 
+                        output_dir: str, is_korean_skipped: bool = False,
+                        image_paths: list = None, attachment_paths: list = None,
+                        skipped_media: list = None, translation_note: str = None,
+                        thumbnails: dict = None) -> tuple:
+        """Builds a message section without writing it. Returns (filepath, content).
+        thumbnails: image path -> thumbnail to embed instead, linking to the image."""
         
         # 1. Prepare filename & directory
         folder_name = FileManager.get_target_directory_name(message_date)
@@ -52,38 +58,156 @@ class FileManager:
         if is_korean_skipped:
             content += "> 번역 생략: 원문이 한국어로 판단됨\n"
         else:
+            if translation_note:
+                content += f"> {translation_note}\n\n"
             content += f"{translated_text}\n"
 
         if image_paths:
             content += "\n### Images\n\n"
             for img_path in image_paths:
-                # Calculate relative path for markdown
-                try:
-                    rel_path = os.path.relpath(img_path, target_dir)
-                    # Markdown uses forward slashes
-                    rel_path = rel_path.replace(os.sep, '/')
-                    content += f"![Image]({rel_path})\n\n"
-                except ValueError:
-                    # If paths are on different drives, relpath fails on Windows
-                    # Fallback to absolute or just ignore?
-                    # Ideally we put images in subfolder of output_dir so it should be fine.
-                    content += f"![Image]({img_path})\n\n"
-            
-        with open(filepath, "a", encoding="utf-8") as f:
-            f.write(content)
+                link = FileManager.markdown_link_path(img_path, target_dir)
+                thumb = (thumbnails or {}).get(img_path)
+                if thumb:
+                    content += f"[![Image]({FileManager.markdown_link_path(thumb, target_dir)})]({link})\n\n"
+                else:
+                    content += f"![Image]({link})\n\n"
+
+        if attachment_paths or skipped_media:
+            content += "\n### Attachments\n\n"
+            for file_path in attachment_paths or []:
+                content += f"- [{os.path.basename(file_path)}]({FileManager.markdown_link_path(file_path, target_dir)})\n"
+            for note in skipped_media or []:
+                content += f"- (not downloaded: {note})\n"
             
-        return filepath
+        return filepath, content
 
     @staticmethod
-    def save_sync_state(data: list, output_dir: str):
-        """Saves synchronization state to a JSON file in the output directory."""
-        import json
-        sync_file = os.path.join(output_dir, "sync_state.json")
+    def markdown_link_path(path: str, target_dir: str) -> str:
+        # Calculate relative path for markdown
         try:
-            with open(sync_file, "w", encoding="utf-8") as f:
-                json.dump(sync_file_data := {"channels": data, "updated_at": int(datetime.datetime.now().timestamp())}, f, indent=4, ensure_ascii=False)
-        except Exception as e:
-            print(f"Error saving sync state: {e}")
+            # Markdown uses forward slashes; spaces would break the link
+            return os.path.relpath(path, target_dir).replace(os.sep, '/').replace(' ', '%20')
+        except ValueError:
+            # If paths are on different drives, relpath fails on Windows
+            return path
+
+    @staticmethod
+    def normalize_path(path: str) -> str:
+        """One spelling per file (absolute, case-folded on Windows), so the manifest can
+        be looked up whatever output directory string a run was given."""
+        return os.path.normcase(os.path.abspath(path))
+
+    @staticmethod
+    def encode_section(content: str) -> bytes:
+        # Same bytes a text-mode append would produce (CRLF on Windows), so offsets stay exact
+        return content.replace("\n", os.linesep).encode("utf-8")
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def get_file_size(filepath: str) -> int:
+        try:
+            return os.path.getsize(filepath)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def append_section(filepath: str, data: bytes):
+        """Appends and fsyncs, so a committed DB row always refers to bytes on disk."""
+        with open(filepath, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def section_matches(filepath: str, offset: int, length: int, digest: str) -> bool:
+        """True if the bytes at offset..offset+length are exactly the recorded section."""
+        try:
+            with open(filepath, "rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+        except OSError:
+            return False
+        return len(data) == length and FileManager.content_hash(data) == digest
+
+    @staticmethod
+    def truncate_file(filepath: str, size: int):
+        # Never extend: a file already shorter than `size` has nothing to roll back
+        if FileManager.get_file_size(filepath) <= size:
+            return
+        with open(filepath, "r+b") as f:
+            f.truncate(size)
+            f.flush()
+            os.fsync(f.fileno())
+
+    # --- Sections in place (see ArchiveManifest) ---
+
+    SECTION_SEPARATOR = "\n---\n\n"
+    SECTION_HEADER = "## Message ID: "
+
+    @staticmethod
+    def scan_sections(data: bytes) -> list:
+        """(message_id, offset, length) of every section in a Markdown file's bytes, found
+        by their headers. A section starts at its separator, as rendered by render_markdown."""
+        sep = FileManager.encode_section(FileManager.SECTION_SEPARATOR)
+        header = FileManager.encode_section(FileManager.SECTION_HEADER)
+        pattern = re.compile(rb"(?:\A|" + re.escape(sep) + rb")" + re.escape(header) + rb"(\d+)" + re.escape(os.linesep.encode()))
+        starts = [(int(m.group(1)), m.start()) for m in pattern.finditer(data)]
+        return [(msg_id, start, (starts[i + 1][1] if i + 1 < len(starts) else len(data)) - start)
+                for i, (msg_id, start) in enumerate(starts)]
+
+    @staticmethod
+    def read_section(filepath: str, offset: int, length: int) -> str:
+        with open(filepath, "rb") as f:
+            f.seek(offset)
+            return f.read(length).decode("utf-8").replace(os.linesep, "\n")
+
+    @staticmethod
+    def replace_section(filepath: str, offset: int, length: int, data: bytes):
+        """Puts `data` in place of the section at offset..offset+length. A section of the
+        same size is overwritten in place; otherwise the file is rewritten to a temporary
+        file and swapped in, so a crash leaves either the old or the new file. The caller
+        holds the commit lock, so no section is appended to the file meanwhile."""
+        if len(data) == length:
+            with open(filepath, "r+b") as f:
+                f.seek(offset)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            return
+        with open(filepath, "rb") as f:
+            head = f.read(offset)
+            f.seek(offset + length)
+            tail = f.read()
+        size = offset + length + len(tail)
+        tmp_path = filepath + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(head + data + tail)
+            f.flush()
+            os.fsync(f.fileno())
+        # Swapping in the copy would drop a section appended meanwhile
+        if FileManager.get_file_size(filepath) != size:
+            os.remove(tmp_path)
+            raise RuntimeError(f"{filepath} changed while its section was rewritten")
+        os.replace(tmp_path, filepath)
+
+    @staticmethod
+    def split_translation(section: str) -> tuple:
+        """(text before, translation, text after) of a section. The translation runs from
+        its heading to the Images/Attachments heading, or to the end of the section."""
+        marker = "### Korean Translation\n\n"
+        start = section.index(marker) + len(marker)
+        ends = [i for i in (section.rfind("\n\n### Images\n\n", start), section.rfind("\n\n### Attachments\n\n", start)) if i >= 0]
+        end = min(ends) + 1 if ends else len(section)
+        return section[:start], section[start:end], section[end:]
+
+    @staticmethod
+    def original_text(section: str) -> str:
+        marker = "### Original Text\n\n"
+        start = section.index(marker) + len(marker)
+        return section[start:section.index("\n\n### Korean Translation\n\n", start)]
 
     @staticmethod
     def load_sync_state(output_dir: str) -> list:
@@ -0,0 +1,80 @@
+import asyncio
+import collections
+
+class RequestGovernor:
+    """Paces the RPCs of one Telegram account and honors its FloodWaits.
+
+    Requests are grouped into method classes (Telegram's flood limits are per method).
+    Each class has a minimum interval between request starts; a FloodWait on a class
+    blocks every caller of that class until it expires and widens its interval, while
+    the other classes (and so other channels' downloads, lookups...) keep going.
+    Waits longer than max_wait are raised to the caller instead, so a multi-account run
+    can hand the channel to another account.
+    """
+    INTERVALS = {
+        "dialogs": 1.0,
+        "entity": 0.2,
+        "history": 0.2,    # per iteration; Telethon pages GetHistory within it
+        "messages": 0.2,
+        "download": 0.05,
+        # Takeout sessions have much higher limits
+        "takeout-history": 0.05,
+        "takeout-download": 0.02,
+    }
+    DEFAULT_INTERVAL = 0.2
+    MAX_INTERVAL_SEC = 5.0
+    MAX_WAIT_SEC = 300
+    # Telethon sleeps through waits up to this itself, unseen by the governor. 0 routes
+    # every FloodWait here so it is shared across callers and counted.
+    FLOOD_SLEEP_THRESHOLD = 0
+
+    def __init__(self, name: str, max_wait: int = MAX_WAIT_SEC):
+        self.name = name
+        self.max_wait = max_wait
+        self.intervals = dict(self.INTERVALS)
+        self._next_start = {}     # class -> loop time the next request may start
+        self._blocked_until = {}  # class -> loop time its FloodWait ends
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.flood_counts = collections.Counter()
+        self.flood_seconds = collections.Counter()
+
+    async def acquire(self, kind: str):
+        """Waits for the class's FloodWait to end and for its next pacing slot."""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            blocked = self._blocked_until.get(kind, 0)
+            if blocked > now:
+                await asyncio.sleep(blocked - now)
+                continue
+            slot = max(now, self._next_start.get(kind, 0))
+            self._next_start[kind] = slot + self.intervals.get(kind, self.DEFAULT_INTERVAL)
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            # A FloodWait may have arrived while this caller waited for its slot
+            if self._blocked_until.get(kind, 0) <= loop.time():
+                return
+
+    def flood(self, kind: str, seconds: int) -> bool:
+        """Records a FloodWait on `kind`. Returns True if callers should wait it out
+        and retry, False if it is too long and should be raised."""
+        self.flood_counts[kind] += 1
+        self.flood_seconds[kind] += seconds
+        self.intervals[kind] = min(self.MAX_INTERVAL_SEC, 2 * self.intervals.get(kind, self.DEFAULT_INTERVAL))
+        if seconds > self.max_wait:
+            return False
+        until = asyncio.get_running_loop().time() + seconds
+        self._blocked_until[kind] = max(self._blocked_until.get(kind, 0), until)
+        print(f"[{self.name}] FloodWait of {seconds}s on {kind} requests; pausing them, "
+              f"pacing now {self.intervals[kind]:.2f}s")
+        return True
+
+    def report(self):
+        if not self.flood_counts:
+            return None
+        total = sum(self.flood_seconds.values())
+        parts = ", ".join(f"{kind} {self.flood_counts[kind]}x/{self.flood_seconds[kind]}s"
+                          for kind in sorted(self.flood_counts))
+        return f"FloodWaits for '{self.name}': {total}s in total ({parts})"
@@ -1,5 +1,5 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, simpledialog
 import threading
 from .add_channel_dialog import AddChannelDialog
 
@@ -7,7 +7,7 @@ class ChannelWindow:
     def __init__(self, parent, db, telegram_service):
         self.top = tk.Toplevel(parent)
         self.top.title("Channel Management")
-        self.top.geometry("600x400")
+        self.top.geometry("780x400")
         
         self.db = db
         self.telegram_service = telegram_service
@@ -27,19 +27,28 @@ class ChannelWindow:
         btn_remove = ttk.Button(frame_toolbar, text="Delete Channel", command=self.delete_channel)
         btn_remove.pack(side=tk.LEFT, padx=5)
         
+        btn_schedule = ttk.Button(frame_toolbar, text="Priority...", command=self.edit_schedule)
+        btn_schedule.pack(side=tk.LEFT, padx=5)
+        
         btn_refresh = ttk.Button(frame_toolbar, text="Refresh", command=self.refresh_list)
         btn_refresh.pack(side=tk.RIGHT, padx=5)
         
         # List
-        self.tree = ttk.Treeview(self.top, columns=("id", "title", "enabled", "last_msg"), show="headings")
+        self.tree = ttk.Treeview(self.top, columns=("id", "title", "enabled", "last_msg", "priority", "weight", "cap"), show="headings")
         self.tree.heading("id", text="ID")
         self.tree.heading("title", text="Title")
         self.tree.heading("enabled", text="Enabled")
         self.tree.heading("last_msg", text="Last Msg ID")
+        self.tree.heading("priority", text="Priority")
+        self.tree.heading("weight", text="Weight")
+        self.tree.heading("cap", text="Max/Run")
         
         self.tree.column("id", width=100)
         self.tree.column("enabled", width=80)
         self.tree.column("last_msg", width=100)
+        self.tree.column("priority", width=60)
+        self.tree.column("weight", width=60)
+        self.tree.column("cap", width=70)
         
         self.tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
@@ -123,7 +132,8 @@ class ChannelWindow:
             
             for ch in channels:
                 status = "Enabled" if ch['is_enabled'] else "Disabled"
-                self.tree.insert("", tk.END, values=(ch['channel_id'], ch['title'], "Active", ch['last_message_id']))
+                self.tree.insert("", tk.END, values=(ch['channel_id'], ch['title'], "Active", ch['last_message_id'],
+                                                     ch['priority'], ch['weight'], ch['max_per_run'] or "-"))
                 
             self.lbl_status.config(text=f"Loaded {len(channels)} channels.")
         except Exception as e:
@@ -132,6 +142,32 @@ class ChannelWindow:
     def open_add_dialog(self):
         AddChannelDialog(self.top, self.telegram_service, self.db, self.refresh_list)
 
+    def edit_schedule(self):
+        selected = self.tree.selection()
+        if not selected:
+            return
+        first = self.db.get_channel(int(self.tree.item(selected[0])['values'][0]))
+        
+        # Higher priority channels are collected first; weight is the share of a run
+        # among equal priorities; max per run caps messages per channel and run
+        priority = simpledialog.askinteger("Priority", "Priority (higher runs first):",
+                                           initialvalue=first['priority'], parent=self.top)
+        if priority is None:
+            return
+        weight = simpledialog.askinteger("Weight", "Weight among channels of the same priority:",
+                                         initialvalue=first['weight'], minvalue=1, parent=self.top)
+        if weight is None:
+            return
+        cap = simpledialog.askinteger("Max per run", "Max messages per run (0 = no limit):",
+                                      initialvalue=first['max_per_run'] or 0, minvalue=0, parent=self.top)
+        if cap is None:
+            return
+        
+        for item_id in selected:
+            cid = int(self.tree.item(item_id)['values'][0])
+            self.db.set_channel_schedule(cid, priority, weight, cap or None)
+        self._reload_tree()
+
     def delete_channel(self):
         selected = self.tree.selection()
         if not selected:
@@ -0,0 +1,109 @@
+import tkinter as tk
+from tkinter import ttk
+import logging
+import logging.handlers
+import queue
+import time
+
+class LogPanel:
+    """Scrolling log view fed from any thread.
+
+    Lines are queued by log() and rendered by the Tk thread in one insert per
+    drain. The widget only keeps the most recent MAX_LINES lines; the complete
+    log goes to a rotating file. Verbose (per-message) lines are rate-limited
+    on screen but always written to the file.
+    """
+    MAX_LINES = 2000
+    MAX_DRAIN = 5000            # lines rendered per tick, the rest waits for the next one
+    VERBOSE_PER_SECOND = 10
+    POLL_MS = 100
+
+    LOG_FILE = "telekb.log"
+    LOG_FILE_BYTES = 5 * 1024 * 1024
+    LOG_FILE_BACKUPS = 3
+
+    def __init__(self, root, parent):
+        self.root = root
+        self.queue = queue.Queue()
+
+        self._verbose_window = 0.0
+        self._verbose_shown = 0
+        self._verbose_dropped = 0
+
+        self.file_logger = self._create_file_logger()
+
+        self.text = tk.Text(parent, state=tk.DISABLED, wrap=tk.WORD)
+        scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.text.yview)
+        self.text.configure(yscrollcommand=scrollbar.set)
+
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+    def _create_file_logger(self):
+        logger = logging.getLogger("telekb")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if not logger.handlers:
+            try:
+                handler = logging.handlers.RotatingFileHandler(
+                    self.LOG_FILE, maxBytes=self.LOG_FILE_BYTES,
+                    backupCount=self.LOG_FILE_BACKUPS, encoding="utf-8"
+                )
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                logger.addHandler(handler)
+            except OSError as e:
+                print(f"Could not open log file: {e}")
+        return logger
+
+    def log(self, line: str, verbose: bool = False):
+        """Thread-safe. `line` should already carry its timestamp."""
+        self.file_logger.info(line)
+        self.queue.put((line, verbose))
+
+    def start(self):
+        self._drain()
+
+    def _allow_verbose(self, now: float) -> bool:
+        if now - self._verbose_window >= 1.0:
+            self._verbose_window = now
+            self._verbose_shown = 0
+        if self._verbose_shown < self.VERBOSE_PER_SECOND:
+            self._verbose_shown += 1
+            return True
+        self._verbose_dropped += 1
+        return False
+
+    def _drain(self):
+        lines = []
+        now = time.monotonic()
+        try:
+            for _ in range(self.MAX_DRAIN):
+                line, verbose = self.queue.get_nowait()
+                if verbose and not self._allow_verbose(now):
+                    continue
+                if not verbose and self._verbose_dropped:
+                    lines.append(f"  ... {self._verbose_dropped} verbose lines omitted (see {self.LOG_FILE})")
+                    self._verbose_dropped = 0
+                lines.append(line)
+        except queue.Empty:
+            pass
+
+        if lines:
+            self._render(lines)
+        self.root.after(self.POLL_MS, self._drain)
+
+    def _render(self, lines):
+        # Keep the user's scroll position unless they are already following the tail
+        at_bottom = self.text.yview()[1] >= 0.999
+
+        self.text.configure(state=tk.NORMAL)
+        self.text.insert(tk.END, "\n".join(lines) + "\n")
+
+        line_count = int(self.text.index("end-1c").split(".")[0]) - 1
+        excess = line_count - self.MAX_LINES
+        if excess > 0:
+            self.text.delete("1.0", f"{excess + 1}.0")
+        self.text.configure(state=tk.DISABLED)
+
+        if at_bottom:
+            self.text.see(tk.END)
@@ -1,7 +1,6 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
-import queue
 import datetime
 import os
 import concurrent.futures
@@ -9,32 +8,52 @@ from ..config import Config
 from ..db import Database
 from ..telegram_service import TelegramService
 from ..translator import Translator
-from ..file_manager import FileManager
-from ..text_utils import TextUtils
+from ..collector import Collector
+from ..progress import CollectionProgress
+from ..media import MediaPolicy
+from ..dedup import NearDuplicateIndex
+from ..cpu_stage import CpuStage
+from ..image_stage import ImageStage
+from ..sessions import SessionPool
+from ..scheduler import ChannelScheduler
+from ..estimator import RunEstimator
+from ..work_queue import WorkQueue
 from .channel_window import ChannelWindow
+from .log_panel import LogPanel
 from ..settings import Settings
 
 class MainWindow:
-    def __init__(self, root):
+    PROGRESS_POLL_MS = 500
+
+    def __init__(self, root, profile=False):
         self.root = root
         self.root.title("TeleKB")
-        self.root.geometry("600x500")
+        self.root.geometry("700x550")
         
         self.db = Database(Config.DB_PATH)
         self.telegram_service = TelegramService()
-        self.translator = Translator()
-        
         self.settings = Settings()
+        self.translator = Translator.from_settings(self.settings)
+        # Loaded once; it keeps growing in memory as messages are translated
+        self.dedup_index = NearDuplicateIndex.from_settings(self.db, self.settings.get("dedup"))
+        # Worker processes are started on the first large batch and reused across runs
+        self.cpu_stage = CpuStage.from_settings(self.settings.get("cpu_pool"))
+        self.image_stage = ImageStage.from_settings(self.settings.get("images"))
+        # Extra Telegram accounts ("accounts" in settings.json) share the main client's loop
+        self.session_pool = SessionPool.from_settings(self.db, self.telegram_service, self.settings.get("accounts"))
+        # Profiling can be enabled per launch (--profile) or persistently via settings.json
+        self.profile_enabled = profile or bool(self.settings.get("profile", False))
         
         saved_output = self.settings.get("output_dir")
         default_output = os.path.join(os.getcwd(), "output")
         self.output_dir = tk.StringVar(value=saved_output if saved_output else default_output)
         self.is_running = False
-        self.log_queue = queue.Queue()
+        self.collector = None
+        self.progress = CollectionProgress()
         self.channel_window = None
         
         self.create_widgets()
-        self.check_queue()
+        self.log_panel.start()
         
         if not os.path.exists(self.output_dir.get()):
             os.makedirs(self.output_dir.get())
@@ -57,21 +76,34 @@ class MainWindow:
         self.btn_run = ttk.Button(frame_controls, text="Run Collection", command=self.start_collection)
         self.btn_run.pack(side=tk.LEFT, padx=(0, 10))
         
+        self.btn_pause = ttk.Button(frame_controls, text="Pause", command=self.toggle_pause, state=tk.DISABLED)
+        self.btn_pause.pack(side=tk.LEFT, padx=(0, 5))
+        
+        self.btn_stop = ttk.Button(frame_controls, text="Stop", command=self.stop_collection, state=tk.DISABLED)
+        self.btn_stop.pack(side=tk.LEFT, padx=(0, 10))
+        
         self.btn_channels = ttk.Button(frame_controls, text="Channel Management", command=self.open_channel_window)
         self.btn_channels.pack(side=tk.LEFT)
         
+        self.btn_estimate = ttk.Button(frame_controls, text="Estimate", command=self.start_estimate)
+        self.btn_estimate.pack(side=tk.LEFT, padx=(5, 0))
+        
         self.lbl_status = ttk.Label(frame_controls, text="Ready")
         self.lbl_status.pack(side=tk.RIGHT)
         
+        frame_progress = ttk.Frame(self.root, padding=(10, 0))
+        frame_progress.pack(fill=tk.X, padx=10)
+        
+        self.progress_bar = ttk.Progressbar(frame_progress, mode="determinate", maximum=100)
+        self.progress_bar.pack(fill=tk.X)
+        
+        self.lbl_progress = ttk.Label(frame_progress, text="")
+        self.lbl_progress.pack(fill=tk.X, pady=(2, 0))
+        
         frame_log = ttk.LabelFrame(self.root, text="Logs", padding=10)
         frame_log.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
         
-        self.txt_log = tk.Text(frame_log, state=tk.DISABLED, wrap=tk.WORD)
-        scrollbar = ttk.Scrollbar(frame_log, orient=tk.VERTICAL, command=self.txt_log.yview)
-        self.txt_log.configure(yscrollcommand=scrollbar.set)
-        
-        self.txt_log.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.log_panel = LogPanel(self.root, frame_log)
 
     def browse_dir(self):
         d = filedialog.askdirectory()
@@ -80,17 +112,9 @@ class MainWindow:
             self.settings.set("output_dir", d)
             self.sync_from_file()
 
-    def log(self, message):
-        self.log_queue.put(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {message}")
-
-    def check_queue(self):
-        while not self.log_queue.empty():
-            msg = self.log_queue.get()
-            self.txt_log.configure(state=tk.NORMAL)
-            self.txt_log.insert(tk.END, msg + "\n")
-            self.txt_log.see(tk.END)
-            self.txt_log.configure(state=tk.DISABLED)
-        self.root.after(100, self.check_queue)
+    def log(self, message, verbose=False):
+        # verbose=True marks per-message lines; they are rate-limited on screen but always kept in the log file
+        self.log_panel.log(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {message}", verbose=verbose)
 
     def open_channel_window(self):
         if self.channel_window is not None:
@@ -105,6 +129,23 @@ class MainWindow:
                 
         self.channel_window = ChannelWindow(self.root, self.db, self.telegram_service)
 
+    def _create_collector(self):
+        collector = Collector(
+            self.db, self.telegram_service, self.translator,
+            self.output_dir.get(), log=self.log, progress=self.progress,
+            media_policy=MediaPolicy(self.settings.get("media_policy")),
+            dedup_index=self.dedup_index,
+            cpu_stage=self.cpu_stage,
+            session_pool=self.session_pool,
+            work_queue=WorkQueue.from_settings(self.settings.get("work_queue"), self.output_dir.get()),
+            image_stage=self.image_stage
+        )
+        collector.profile = self.profile_enabled
+        collector.takeout_min_messages = TelegramService.takeout_threshold(self.settings.get("takeout"))
+        collector.chunk_messages = ChannelScheduler.chunk_size(self.settings.get("scheduling"))
+        collector.profile_threads = {"tk": lambda fn: self.root.after(0, fn)}
+        return collector
+
     def start_collection(self):
         if self.is_running:
             return
@@ -112,173 +153,106 @@ class MainWindow:
         self.is_running = True
         self.btn_run.configure(state=tk.DISABLED)
         self.btn_channels.configure(state=tk.DISABLED)
+        self.btn_pause.configure(state=tk.NORMAL, text="Pause")
+        self.btn_stop.configure(state=tk.NORMAL)
         self.lbl_status.config(text="Running...")
+        self.progress.reset()
         self.log("Starting collection...")
         
-        threading.Thread(target=self.run_collection_thread, daemon=True).start()
+        self.collector = self._create_collector()
+        threading.Thread(target=self.run_collection_thread, name="collector", daemon=True).start()
+        self.update_progress()
+
+    def _login_callbacks(self) -> dict:
+        def _request_ui_input(prompt_type):
+            f = concurrent.futures.Future()
+            self.root.after(0, lambda: self._show_login_dialog(prompt_type, f))
+            return f.result()
+
+        return {
+            "phone_callback": lambda: _request_ui_input("phone"),
+            "code_callback": lambda: _request_ui_input("code"),
+            "password_callback": lambda: _request_ui_input("password"),
+        }
 
     def run_collection_thread(self):
         try:
-            self.log("Connecting to Telegram...")
-            
-            def _request_ui_input(prompt_type):
-                f = concurrent.futures.Future()
-                self.root.after(0, lambda: self._show_login_dialog(prompt_type, f))
-                return f.result()
+            self.collector.run(**self._login_callbacks())
+        finally:
+            self.finish_collection()
 
-            phone_cb = lambda: _request_ui_input("phone")
-            code_cb = lambda: _request_ui_input("code")
-            pw_cb = lambda: _request_ui_input("password")
-            
-            connected = self.telegram_service.connect(
-                phone_callback=phone_cb,
-                code_callback=code_cb,
-                password_callback=pw_cb
-            )
-            
-            if not connected:
+    def start_estimate(self):
+        if self.is_running:
+            return
+        self.btn_estimate.configure(state=tk.DISABLED)
+        self.log("Estimating the backlog (nothing is collected or translated)...")
+        threading.Thread(target=self.run_estimate_thread, name="estimator", daemon=True).start()
+
+    def run_estimate_thread(self):
+        collector = self._create_collector()
+        try:
+            if not self.telegram_service.connect(**self._login_callbacks()):
                 self.log("Login failed or cancelled.")
-                self.finish_collection()
                 return
+            if self.session_pool:
+                self.session_pool.connect_others(self.log, **self._login_callbacks())
+            rows = RunEstimator(collector, self.settings.get("estimate")).estimate(self.db.get_channels(only_enabled=True))
+            for line in RunEstimator.format_table(rows):
+                self.log(line)
+        except Exception as e:
+            self.log(f"Estimate failed: {e}")
+        finally:
+            self.root.after(0, lambda: self.btn_estimate.configure(state=tk.NORMAL))
 
-            channels = self.db.get_channels(only_enabled=True)
-            if not channels:
-                self.log("No enabled channels found.")
-                self.finish_collection()
-                return
+    def toggle_pause(self):
+        if not self.collector:
+            return
+        if self.collector.is_paused:
+            self.collector.resume()
+            self.btn_pause.configure(text="Pause")
+            self.lbl_status.config(text="Running...")
+        else:
+            self.collector.pause()
+            self.btn_pause.configure(text="Resume")
+            self.lbl_status.config(text="Pausing...")
+            self.log("Pause requested. Waiting for the current message to finish...")
 
-            total_channels = len(channels)
-            processed_count = 0
-            
-            for ch in channels:
-                ch_id = ch['channel_id']
-                ch_title = ch['title']
-                last_id = ch['last_message_id']
-                
-                self.log(f"Processing channel: {ch_title} (Last ID: {last_id})")
-                
-                messages = self.telegram_service.fetch_messages(ch_id, min_id=last_id)
-                self.log(f"  Found {len(messages)} new messages.")
-                
-                if not messages:
-                    processed_count += 1
-                    continue
-                    
-                max_id = last_id
-                success_count = 0
-                
-                for msg in messages:
-                    text = msg.message
-                    msg_id = msg.id
-                    
-                    if not text: 
-                        continue
-                        
-                    # Convert to Markdown for preserving links
-                    # We pass msg.entities to helper
-                    original_markdown = TextUtils.convert_entities_to_markdown(text, msg.entities)
-                        
-                    is_kr = TextUtils.is_korean(text)
-                    translated = ""
-                    
-                    if not is_kr:
-                        self.log(f"    Translating msg {msg_id}...")
-                        translated = self.translator.translate_to_korean(text)
-                        if not translated:
-                            self.log(f"    Translation failed for {msg_id}. Saving original.")
-                    else:
-                        self.log(f"    Skipping translation for {msg_id} (Korean detected).")
-                    
-                    image_paths = []
-                    if msg.photo:
-                        # Use same date logic as FileManager
-                        sub_folder = FileManager.get_target_directory_name(msg.date)
-                        images_dir = os.path.join(self.output_dir.get(), sub_folder, "images")
-                        
-                        if not os.path.exists(images_dir):
-                            os.makedirs(images_dir)
-                            
-                        # Use msg_id for unique filename
-                        img_filename = f"{ch_id}_{msg_id}.jpg"
-                        img_path = os.path.join(images_dir, img_filename)
-                        
-                        self.log(f"    Downloading image for {msg_id}...")
-                        downloaded_path = self.telegram_service.download_media(msg, img_path)
-                        
-                        if downloaded_path:
-                            image_paths.append(downloaded_path)
-                        else:
-                             self.log(f"    Image download failed for {msg_id}")
-                    
-                    try:
-                        fpath = FileManager.save_markdown(
-                            channel_name=ch_title,
-                            message_text=original_markdown, # Pass markdown here
-                            translated_text=translated,
-                            message_id=msg_id,
-                            message_date=msg.date,
-                            output_dir=self.output_dir.get(),
-                            is_korean_skipped=is_kr,
-                            image_paths=image_paths
-                        )
+    def stop_collection(self):
+        if not self.collector or self.collector.stop_requested:
+            return
+        self.collector.request_stop()
+        self.btn_pause.configure(state=tk.DISABLED, text="Pause")
+        self.btn_stop.configure(state=tk.DISABLED)
+        self.lbl_status.config(text="Stopping...")
+        self.log("Stop requested. Finishing the current message...")
 
-                        self.db.save_message_log(ch_id, msg_id, fpath)
-                        success_count += 1
-                        if msg_id > max_id:
-                            max_id = msg_id
-                    except Exception as e:
-                        self.log(f"    Error saving file for {msg_id}: {e}")
-                
-                if max_id > last_id:
-                    self.db.update_last_message_id(ch_id, max_id)
-                    self.log(f"  Updated last_message_id to {max_id}")
-                
-                processed_count += 1
-                
-        except Exception as e:
-            self.log(f"Critical Error: {e}")
-            import traceback
-            traceback.print_exc()
-        finally:
-            self.finish_collection()
+    def update_progress(self):
+        # Polled from the Tk thread; the pipeline never touches widgets itself
+        snap = self.progress.snapshot()
+        self.progress_bar["value"] = snap["fraction"] * 100
+        current = f" - {snap['current_channel']}" if snap["current_channel"] else ""
+        self.lbl_progress.config(text=self.progress.format(snap) + current)
+        if self.is_running:
+            self.root.after(self.PROGRESS_POLL_MS, self.update_progress)
 
     def finish_collection(self):
         self.is_running = False
         def _update():
             self.btn_run.configure(state=tk.NORMAL)
             self.btn_channels.configure(state=tk.NORMAL)
+            self.btn_pause.configure(state=tk.DISABLED, text="Pause")
+            self.btn_stop.configure(state=tk.DISABLED)
             self.lbl_status.config(text="Ready")
+            self.update_progress()
             self.log("Collection finished.")
             self.sync_to_file()
         self.root.after(0, _update)
 
     def sync_from_file(self):
-        output_path = self.output_dir.get()
-        if not output_path or not os.path.exists(output_path):
-            return
-        
-        self.log("Checking for sync state file...")
-        sync_data = FileManager.load_sync_state(output_path)
-        if sync_data:
-            try:
-                self.db.update_from_sync_data(sync_data)
-                self.log(f"Synced {len(sync_data)} channels from sync_state.json.")
-            except Exception as e:
-                self.log(f"Error updating from sync file: {e}")
-        else:
-             self.log("No sync file found or file is empty.")
+        self._create_collector().sync_from_file()
 
     def sync_to_file(self):
-        output_path = self.output_dir.get()
-        if not output_path or not os.path.exists(output_path):
-            return
-        
-        try:
-            sync_data = self.db.get_sync_data()
-            FileManager.save_sync_state(sync_data, output_path)
-            self.log("State saved to sync_state.json.")
-        except Exception as e:
-            self.log(f"Error saving sync state: {e}")
+        self._create_collector().sync_to_file()
 
     def _show_login_dialog(self, prompt_type, future):
         dialog = tk.Toplevel(self.root)
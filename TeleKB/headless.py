@@ -0,0 +1,172 @@
+import getpass
+import os
+import signal
+import threading
+from .config import Config
+from .db import Database
+from .settings import Settings
+from .telegram_service import TelegramService
+from .translator import Translator
+from .collector import Collector, console_log
+from .backfill import Backfill
+from .media import MediaPolicy
+from .dedup import NearDuplicateIndex
+from .cpu_stage import CpuStage
+from .sessions import SessionPool
+from .scheduler import ChannelScheduler
+from .estimator import RunEstimator
+from .work_queue import WorkQueue
+from .manifest import ArchiveManifest
+from .cold_storage import ColdStorage
+from .image_stage import ImageStage
+
+def resolve_output_dir(output_dir=None) -> str:
+    settings = Settings()
+    path = output_dir or settings.get("output_dir") or os.path.join(os.getcwd(), "output")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def create_collector(output_dir=None, profile=False, cpu_workers=None, session=None) -> Collector:
+    settings = Settings()
+    db = Database(Config.DB_PATH)
+    telegram_service = TelegramService(session or TelegramService.DEFAULT_SESSION)
+    output_dir = resolve_output_dir(output_dir)
+    collector = Collector(
+        db, telegram_service, Translator.from_settings(settings), output_dir,
+        media_policy=MediaPolicy(settings.get("media_policy")),
+        dedup_index=NearDuplicateIndex.from_settings(db, settings.get("dedup")),
+        cpu_stage=CpuStage.from_settings(settings.get("cpu_pool"), workers=cpu_workers),
+        session_pool=SessionPool.from_settings(db, telegram_service, settings.get("accounts")),
+        work_queue=WorkQueue.from_settings(settings.get("work_queue"), output_dir),
+        image_stage=ImageStage.from_settings(settings.get("images"))
+    )
+    collector.profile = profile or bool(settings.get("profile", False))
+    collector.takeout_min_messages = TelegramService.takeout_threshold(settings.get("takeout"))
+    collector.chunk_messages = ChannelScheduler.chunk_size(settings.get("scheduling"))
+    return collector
+
+def report_progress(collector: Collector, interval: float, stop_event: threading.Event):
+    while not stop_event.wait(interval):
+        console_log(collector.progress.format())
+
+def install_interrupt_handler(collector: Collector):
+    def _on_interrupt(signum, frame):
+        if collector.stop_requested:
+            raise KeyboardInterrupt
+        collector.log("Stop requested (Ctrl+C again to abort). Finishing the current message...")
+        collector.request_stop()
+    signal.signal(signal.SIGINT, _on_interrupt)
+
+def login_callbacks() -> dict:
+    return {
+        "phone_callback": lambda: input("Enter Phone (e.g. +82...): ").strip(),
+        "code_callback": lambda: input("Enter Code: ").strip(),
+        "password_callback": lambda: getpass.getpass("Enter Password: "),
+    }
+
+def run_headless(output_dir=None, profile=False, progress_interval=10.0, session=None):
+    """Runs one collection pass without the GUI, printing progress to stdout. `session`
+    selects the Telegram account, e.g. for a second worker process on the same host."""
+    collector = create_collector(output_dir, profile, session=session)
+    collector.log(f"Output directory: {collector.output_dir}")
+    collector.sync_from_file()
+    install_interrupt_handler(collector)
+
+    stop_event = threading.Event()
+    reporter = threading.Thread(target=report_progress, args=(collector, progress_interval, stop_event), daemon=True)
+    reporter.start()
+    try:
+        collector.run(**login_callbacks())
+    finally:
+        stop_event.set()
+        collector.log(collector.progress.format())
+        collector.log("Collection finished.")
+        collector.sync_to_file()
+        if collector.cpu_stage:
+            collector.cpu_stage.close()
+        if collector.image_stage:
+            collector.image_stage.close()
+
+def run_estimate(output_dir=None):
+    """Dry run: prints the estimated backlog, translation tokens, media and time per
+    channel without collecting anything."""
+    collector = create_collector(output_dir)
+    try:
+        collector.log("Connecting to Telegram...")
+        if not collector.telegram_service.connect(**login_callbacks()):
+            collector.log("Login failed or cancelled.")
+            return
+        channels = collector.db.get_channels(only_enabled=True)
+        if collector.session_pool:
+            collector.session_pool.connect_others(collector.log, **login_callbacks())
+        rows = RunEstimator(collector, Settings().get("estimate")).estimate(channels)
+        for line in RunEstimator.format_table(rows):
+            collector.log(line)
+    finally:
+        if collector.cpu_stage:
+            collector.cpu_stage.close()
+
+def create_cold_storage(db, output_dir=None) -> ColdStorage:
+    return ColdStorage(db, resolve_output_dir(output_dir), Settings().get("cold_storage"))
+
+def run_verify(repair=False, output_dir=None):
+    """Checks every recorded Markdown section against the archive manifest."""
+    db = Database(Config.DB_PATH)
+    try:
+        counts = ArchiveManifest(db, create_cold_storage(db, output_dir)).verify(repair=repair, log=console_log)
+        console_log(ArchiveManifest.format_report(counts))
+    finally:
+        db.close()
+
+def run_rollup(output_dir=None):
+    """Packs completed months of the output directory into cold storage."""
+    db = Database(Config.DB_PATH)
+    try:
+        totals = create_cold_storage(db, output_dir).rollup(log=console_log)
+        saved = totals["bytes_before"] - totals["bytes_after"]
+        console_log(f"Rollup finished: {totals['months']} month(s), {totals['files']} file(s), "
+                    f"{saved / 1024 / 1024:.1f}MB saved.")
+    finally:
+        db.close()
+
+def run_extract(month, output_dir=None):
+    """Restores a rolled-up month to plain files."""
+    db = Database(Config.DB_PATH)
+    try:
+        create_cold_storage(db, output_dir).extract(month, log=console_log)
+    finally:
+        db.close()
+
+def run_retranslate(channel_id, message_id, output_dir=None):
+    """Translates one collected message again and rewrites its section in place."""
+    collector = create_collector(output_dir)
+    try:
+        collector.retranslate_section(channel_id, message_id)
+    except (KeyError, ValueError, RuntimeError) as e:
+        collector.log(f"Retranslation failed: {e}")
+    finally:
+        if collector.cpu_stage:
+            collector.cpu_stage.close()
+
+def run_backfill(channel_id, since=None, until=None, first_id=None, last_id=None,
+                 workers=Backfill.DEFAULT_WORKERS, window_size=Backfill.DEFAULT_WINDOW_SIZE,
+                 output_dir=None, progress_interval=10.0, cpu_workers=None):
+    """Backfills a historical range of one channel without touching its live checkpoint."""
+    collector = create_collector(output_dir, cpu_workers=cpu_workers)
+    collector.log(f"Output directory: {collector.output_dir}")
+    install_interrupt_handler(collector)
+
+    stop_event = threading.Event()
+    reporter = threading.Thread(target=report_progress, args=(collector, progress_interval, stop_event), daemon=True)
+    reporter.start()
+    try:
+        Backfill(collector, workers=workers, window_size=window_size).run(
+            channel_id, since=since, until=until, first_id=first_id, last_id=last_id, **login_callbacks()
+        )
+    finally:
+        stop_event.set()
+        collector.log(collector.progress.format())
+        if collector.cpu_stage:
+            collector.cpu_stage.close()
+        if collector.image_stage:
+            collector.image_stage.close()
@@ -0,0 +1,139 @@
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+EXTENSIONS = {"webp": ".webp", "jpeg": ".jpg", "png": ".png", "avif": ".avif"}
+
+def _encodable(img, fmt: str):
+    # JPEG has no alpha; palette and CMYK images are not accepted by every encoder
+    if fmt == "jpeg":
+        return img.convert("RGB") if img.mode != "RGB" else img
+    if img.mode not in ("RGB", "RGBA"):
+        return img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    return img
+
+def transcode_image(job: dict) -> dict:
+    """Re-encodes one downloaded image and writes its thumbnail. Runs in a worker
+    process. The original is replaced only if the new file is smaller; the result
+    says which file the Markdown should link to."""
+    src = job["path"]
+    fmt = job["format"]
+    before = os.path.getsize(src)
+    result = {"path": src, "thumbnail": None, "before": before, "after": before}
+    with Image.open(src) as opened:
+        # Telegram keeps the camera orientation in EXIF, which the new file won't carry
+        img = _encodable(ImageOps.exif_transpose(opened), fmt)
+        if job["max_dimension"] and max(img.size) > job["max_dimension"]:
+            img.thumbnail((job["max_dimension"], job["max_dimension"]), Image.LANCZOS)
+        target = os.path.splitext(src)[0] + EXTENSIONS[fmt]
+        tmp_path = target + ".tmp"
+        img.save(tmp_path, format=fmt.upper(), quality=job["quality"])
+        after = os.path.getsize(tmp_path)
+        if after < before:
+            os.replace(tmp_path, target)
+            if target != src:
+                os.remove(src)
+            result.update(path=target, after=after)
+        else:
+            os.remove(tmp_path)
+
+        size = job["thumbnail"]
+        if size and max(img.size) > size:
+            thumb_dir = os.path.join(os.path.dirname(src), "thumbs")
+            os.makedirs(thumb_dir, exist_ok=True)
+            thumb_path = os.path.join(thumb_dir, os.path.basename(target))
+            img.thumbnail((size, size), Image.LANCZOS)
+            img.save(thumb_path, format=fmt.upper(), quality=job["quality"])
+            result["thumbnail"] = thumb_path
+            result["after"] += os.path.getsize(thumb_path)
+    return result
+
+class ImageStage:
+    """Optional post-download stage that re-encodes photos (format, quality, maximum
+    dimension) and writes a thumbnail for the Markdown embed, which links to the full
+    image. Needs Pillow.
+
+    Images are handed to a pool of worker processes from prepare_post's coroutine, so
+    encoding overlaps with the translations and downloads of the posts in flight and
+    never runs on the Telethon loop or the collector thread; a post is saved once its
+    images are final. A failed transcode keeps the downloaded file.
+
+    Configured through settings.json: "images": {"enabled": true, "format": "webp",
+    "quality": 80, "max_dimension": 2560, "thumbnail": 480, "workers": 2}.
+    """
+    DEFAULTS = {"format": "webp", "quality": 80, "max_dimension": 2560, "thumbnail": 480, "workers": 2}
+
+    def __init__(self, config: dict = None):
+        self.config = {**self.DEFAULTS, **(config or {})}
+        if self.config["format"] not in EXTENSIONS:
+            raise ValueError(f"Unsupported image format: {self.config['format']}")
+        self._pool = None
+        self.reset_stats()
+
+    @classmethod
+    def from_settings(cls, config: dict):
+        config = config or {}
+        if not config.get("enabled"):
+            return None
+        if Image is None:
+            print("Pillow is not installed; images are kept as downloaded.")
+            return None
+        return cls(config)
+
+    def reset_stats(self):
+        self.images = 0
+        self.failed = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    async def process(self, image_paths: list):
+        """Transcodes the post's images concurrently. Returns (image paths to link,
+        {image path: thumbnail path})."""
+        if not image_paths:
+            return image_paths, {}
+        if self._pool is None:
+            # spawn: forking a process that runs the Telethon loop thread is unsafe
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.config["workers"], mp_context=multiprocessing.get_context("spawn")
+            )
+        loop = asyncio.get_running_loop()
+        jobs = [{"path": path, **{k: self.config[k] for k in ("format", "quality", "max_dimension", "thumbnail")}}
+                for path in image_paths]
+        results = await asyncio.gather(*(loop.run_in_executor(self._pool, transcode_image, job) for job in jobs),
+                                       return_exceptions=True)
+        paths, thumbnails = [], {}
+        for path, result in zip(image_paths, results):
+            if isinstance(result, Exception):
+                print(f"    Image transcode failed for {os.path.basename(path)}: {result}")
+                self.failed += 1
+                paths.append(path)
+                continue
+            self.images += 1
+            self.bytes_before += result["before"]
+            self.bytes_after += result["after"]
+            paths.append(result["path"])
+            if result["thumbnail"]:
+                thumbnails[result["path"]] = result["thumbnail"]
+        return paths, thumbnails
+
+    def report(self):
+        if not self.images and not self.failed:
+            return None
+        saved = self.bytes_before - self.bytes_after
+        share = saved / self.bytes_before * 100 if self.bytes_before else 0
+        line = (f"Images: {self.images} transcoded, {self.bytes_before / 1024 / 1024:.1f}MB -> "
+                f"{self.bytes_after / 1024 / 1024:.1f}MB with thumbnails ({saved / 1024 / 1024:.1f}MB, {share:.0f}% saved)")
+        if self.failed:
+            line += f", {self.failed} kept as downloaded after errors"
+        return line
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
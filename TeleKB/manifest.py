@@ -0,0 +1,146 @@
+import collections
+import os
+from .file_manager import FileManager
+
+class ArchiveManifest:
+    """Where each message's section is in the Markdown archive.
+
+    The manifest is the messages table: commit_section records every section's file,
+    byte offset, length and hash as it is appended, so a message is found with one
+    indexed lookup instead of scanning <YYYY-MM>/*.md. That allows rewriting a single
+    section in place (the later sections of its file shift, the rest of the archive is
+    untouched) and verifying the archive file by file against the recorded hashes.
+    Months rolled up into cold storage are read from their archives when a
+    ColdStorage is given.
+    """
+
+    def __init__(self, db, storage=None):
+        self.db = db
+        self.storage = storage
+
+    def locate(self, channel_id: int, message_id: int):
+        """The manifest row of the message's section, or None if it has no recorded range."""
+        row = self.db.get_section(channel_id, message_id)
+        if row is None or row['byte_offset'] is None:
+            return None
+        return row
+
+    def read(self, channel_id: int, message_id: int):
+        """The message's section, or None if it has no recorded range. Raises
+        ValueError if its file was rolled up and no ColdStorage was given."""
+        row = self.locate(channel_id, message_id)
+        if row is None:
+            return None
+        offset, length = row['byte_offset'], row['byte_length']
+        if not FileManager.section_matches(row['file_path'], offset, length, row['content_hash']) and self.storage:
+            cold = self.storage.read_bytes(row['file_path'])
+            if cold is not None:
+                return cold[offset:offset + length].decode("utf-8").replace(os.linesep, "\n")
+        self._require_on_disk(row)
+        return FileManager.read_section(row['file_path'], offset, length)
+
+    @staticmethod
+    def _require_on_disk(row):
+        if not os.path.exists(row['file_path']):
+            raise ValueError(f"{row['file_path']} is not on disk (rolled up to cold storage?); extract its month first")
+
+    def rewrite(self, channel_id: int, message_id: int, content: str):
+        """Replaces the message's section with `content` (with its separator, as read).
+        The caller holds the commit lock (Collector._commit_lock), which every process
+        appending to the archive takes as well."""
+        row = self.locate(channel_id, message_id)
+        if row is None:
+            raise KeyError(f"No recorded section for message {message_id} of channel {channel_id}")
+        data = FileManager.encode_section(content)
+        self._require_on_disk(row)
+        if not FileManager.section_matches(row['file_path'], row['byte_offset'], row['byte_length'], row['content_hash']):
+            raise ValueError(f"Section of message {message_id} does not match the manifest; run a verify with repair first")
+        FileManager.replace_section(row['file_path'], row['byte_offset'], row['byte_length'], data)
+        self.db.replace_section(row['file_path'], row['byte_offset'], row['byte_length'], len(data), FileManager.content_hash(data))
+
+    # --- Verification ---
+
+    def verify(self, repair: bool = False, log=print) -> dict:
+        """Checks every recorded section against its file, reading each file once.
+        Returns counts per outcome: ok, missing (file gone), corrupted (bytes differ
+        from the hash), duplicate (a message's section appears more than once in its
+        file), unindexed (rows without a byte range, written before it was recorded).
+        With repair, files with corrupted or unindexed sections are re-indexed from
+        their section headers (the copy on disk if there is one, else the archived one)."""
+        rows_by_file = collections.defaultdict(list)
+        for row in self.db.get_manifest_rows():
+            rows_by_file[row['file_path']].append(row)
+
+        counts = collections.Counter()
+        for path, rows in rows_by_file.items():
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            cold = self.storage.read_bytes(path) if self.storage else None
+            if data is None and cold is None:
+                counts["missing"] += len(rows)
+                log(f"Missing file: {path} ({len(rows)} message(s))")
+                continue
+            needs_index = False
+            for row in rows:
+                if row['byte_offset'] is None:
+                    counts["unindexed"] += 1
+                    needs_index = True
+                    continue
+                # Sections written after a rollup are on disk, the others in the archive
+                if any(self._matches(copy, row) for copy in (data, cold) if copy is not None):
+                    counts["ok"] += 1
+                else:
+                    counts["corrupted"] += 1
+                    needs_index = True
+                    log(f"Corrupted section: message {row['message_id']} in {path}")
+            # Reads as one file; duplicates may span the archive and the disk
+            if data is not None and cold is not None:
+                combined = cold + self.storage.separator() + data
+            else:
+                combined = data if data is not None else cold
+            sections = FileManager.scan_sections(combined)
+            seen = collections.Counter(msg_id for msg_id, _, _ in sections)
+            for msg_id, n in seen.items():
+                if n > 1:
+                    counts["duplicate"] += n - 1
+                    log(f"Duplicate section: message {msg_id} appears {n} times in {path}")
+            if repair and needs_index:
+                copy = data if data is not None else cold
+                fixed = self.reindex(rows, copy, FileManager.scan_sections(copy))
+                counts["repaired"] += fixed
+                log(f"Re-indexed {fixed} section(s) of {path}")
+        return dict(counts)
+
+    @staticmethod
+    def _matches(data: bytes, row) -> bool:
+        section = data[row['byte_offset']:row['byte_offset'] + row['byte_length']]
+        return len(section) == row['byte_length'] and FileManager.content_hash(section) == row['content_hash']
+
+    def reindex(self, rows, data: bytes, sections) -> int:
+        """Records the ranges found by their headers for a file's rows. Album members
+        follow their primary. The first section of a duplicated message is kept."""
+        found = {}
+        for msg_id, offset, length in sections:
+            found.setdefault(msg_id, (offset, length))
+        groups = collections.defaultdict(list)  # previous offset -> rows sharing the section
+        for row in rows:
+            if row['byte_offset'] is not None:
+                groups[row['byte_offset']].append(row)
+        updates = []
+        for row in rows:
+            if row['message_id'] not in found:
+                continue
+            offset, length = found[row['message_id']]
+            digest = FileManager.content_hash(data[offset:offset + length])
+            members = groups[row['byte_offset']] if row['byte_offset'] is not None else [row]
+            updates.extend((offset, length, digest, member['id']) for member in members)
+        self.db.set_section_locations(updates)
+        return len(updates)
+
+    @staticmethod
+    def format_report(counts: dict) -> str:
+        keys = ("ok", "corrupted", "duplicate", "missing", "unindexed", "repaired")
+        return "Archive check: " + ", ".join(f"{counts.get(k, 0)} {k}" for k in keys if k in counts or k == "ok")
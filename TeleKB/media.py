@@ -0,0 +1,72 @@
+import copy
+from .text_utils import TextUtils
+
+class MediaPolicy:
+    """Which media types are downloaded and how large they may be.
+
+    Configured through settings.json, for example:
+
+        "media_policy": {
+            "video": {"enabled": false},
+            "document": {"max_mb": 50},
+            "channels": {"-1001234567890": {"video": {"enabled": true, "max_mb": 500}}}
+        }
+
+    Per-channel entries override the global rule for that type only. GIFs are off
+    unless enabled; stickers, voice notes and round videos are never downloaded.
+    """
+    DEFAULTS = {
+        "photo": {"enabled": True, "max_mb": 20},
+        "video": {"enabled": True, "max_mb": 200},
+        "document": {"enabled": True, "max_mb": 100},
+        "gif": {"enabled": False, "max_mb": 20},
+    }
+
+    def __init__(self, config: dict = None):
+        config = config or {}
+        self.rules = copy.deepcopy(self.DEFAULTS)
+        for kind, rule in config.items():
+            if kind in self.rules and isinstance(rule, dict):
+                self.rules[kind].update(rule)
+        self.channel_rules = {str(k): v for k, v in (config.get("channels") or {}).items()}
+
+    @staticmethod
+    def classify(msg):
+        """Returns 'photo', 'video', 'document', 'gif', 'sticker', 'voice', 'video_note'
+        or None for a MessageRecord."""
+        return msg.media.kind if msg.media else None
+
+    def rule(self, kind: str, channel_id: int) -> dict:
+        rule = dict(self.rules.get(kind, {"enabled": False}))
+        rule.update(self.channel_rules.get(str(channel_id), {}).get(kind, {}))
+        return rule
+
+    def max_bytes(self, kind: str, channel_id: int):
+        max_mb = self.rule(kind, channel_id).get("max_mb")
+        return int(max_mb * 1024 * 1024) if max_mb else None
+
+    def check(self, msg, channel_id: int):
+        """Returns (allowed, reason). reason explains a refusal for the log/Markdown."""
+        kind = self.classify(msg)
+        if kind is None:
+            return False, ""
+        rule = self.rule(kind, channel_id)
+        if not rule.get("enabled", False):
+            return False, f"{kind} downloads disabled"
+        limit = self.max_bytes(kind, channel_id)
+        size = msg.media.size
+        if limit and size and size > limit:
+            return False, f"{kind} {size / 1048576:.1f} MB exceeds {limit / 1048576:.0f} MB limit"
+        return True, ""
+
+    @staticmethod
+    def target_filename(msg, channel_id: int) -> str:
+        """Stable per message, so an interrupted download resumes into the same .part file."""
+        kind = MediaPolicy.classify(msg)
+        if kind == "photo":
+            return f"{channel_id}_{msg.id}.jpg"
+        name = msg.media.name
+        if name:
+            return f"{channel_id}_{msg.id}_{TextUtils.sanitize_filename(name)[:80]}"
+        ext = msg.media.ext or ".bin"
+        return f"{channel_id}_{msg.id}{ext}"
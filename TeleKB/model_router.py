@@ -0,0 +1,205 @@
+import collections
+import re
+import threading
+import time
+
+_RETRY_DELAY_RE = re.compile(r"retry(?:_?delay)?\W+(\d+(?:\.\d+)?)s", re.IGNORECASE)
+
+def classify_error(error) -> str:
+    """Returns 'quota' (429/RESOURCE_EXHAUSTED), 'unavailable' (503) or 'error'."""
+    err_str = str(error).upper()
+    if "429" in err_str or "RESOURCE_EXHAUSTED" in err_str:
+        return "quota"
+    if "503" in err_str or "SERVICE_UNAVAILABLE" in err_str or "UNAVAILABLE" in err_str:
+        return "unavailable"
+    return "error"
+
+def retry_delay(error):
+    """The server-suggested retry delay in seconds ("retryDelay": "23s"), if present."""
+    m = _RETRY_DELAY_RE.search(str(error))
+    return float(m.group(1)) if m else None
+
+class ModelHealth:
+    """Rolling success/latency stats and circuit-breaker state of one model."""
+    WINDOW = 50
+
+    def __init__(self, name: str, priority: int):
+        self.name = name
+        self.priority = priority
+        self.outcomes = collections.deque(maxlen=self.WINDOW)   # True/False per request
+        self.latencies = collections.deque(maxlen=self.WINDOW)  # seconds, successful requests
+        self.consecutive_failures = 0
+        self.open_until = 0.0     # circuit open (no traffic) until this monotonic time
+        self.open_count = 0       # consecutive openings; drives the cool-down backoff
+        self.probing = False      # a half-open trial request is in flight
+        self.reset_run()
+
+    def reset_run(self):
+        self.run_calls = 0
+        self.run_failures = 0
+        self.run_quota_errors = 0
+        self.run_opens = 0
+
+    @property
+    def success_rate(self):
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else None
+
+    def percentile(self, pct: float):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+    def state(self, now: float) -> str:
+        if now < self.open_until:
+            return "open"
+        return "half-open" if self.open_count else "closed"
+
+class ModelRouter:
+    """Picks the model for each translation request.
+
+    A model's circuit opens after FAILURE_THRESHOLD consecutive failures, or at once
+    on a quota error, and it gets no traffic for a cool-down that doubles on every
+    re-opening (up to MAX_COOLDOWN_SEC). After the cool-down one trial request is let
+    through: success closes the circuit, failure opens it again. Other requests wait
+    for its outcome (see seconds_until_available). Healthy models are
+    tried in their configured priority, except that a model with a poor recent
+    success rate or slow p95 is moved behind the others.
+    """
+    FAILURE_THRESHOLD = 3
+    BASE_COOLDOWN_SEC = 60.0
+    QUOTA_COOLDOWN_SEC = 300.0
+    MAX_COOLDOWN_SEC = 1800.0
+    MIN_SAMPLES = 5
+    MIN_SUCCESS_RATE = 0.7
+    SLOW_P95_SEC = 30.0
+    # While a trial request is in flight, waiting requests check its outcome this often
+    PROBE_POLL_SEC = 0.5
+
+    def __init__(self, model_names, log=None):
+        self.models = {name: ModelHealth(name, i) for i, name in enumerate(model_names)}
+        self.log = log or print
+        self._lock = threading.Lock()
+        self._last_choice = None
+        self.run_switches = 0
+
+    def begin_run(self, log=None):
+        """Clears the per-run counters; health and circuit state carry over between runs."""
+        with self._lock:
+            if log:
+                self.log = log
+            for health in self.models.values():
+                health.reset_run()
+            self._last_choice = None
+            self.run_switches = 0
+
+    def _degraded(self, health: ModelHealth) -> bool:
+        if len(health.outcomes) < self.MIN_SAMPLES:
+            return False
+        p95 = health.percentile(95)
+        return health.success_rate < self.MIN_SUCCESS_RATE or (p95 is not None and p95 > self.SLOW_P95_SEC)
+
+    def candidates(self) -> list:
+        """Models that may be tried now, best first. Half-open models are reserved for
+        one trial request at a time."""
+        now = time.monotonic()
+        with self._lock:
+            usable = []
+            for health in self.models.values():
+                state = health.state(now)
+                if state == "open" or (state == "half-open" and health.probing):
+                    continue
+                usable.append(health)
+            usable.sort(key=lambda h: (self._degraded(h), h.priority))
+            return [h.name for h in usable]
+
+    def acquire(self, name: str) -> bool:
+        """Claims a model before a request. False if it turned unavailable meanwhile."""
+        now = time.monotonic()
+        with self._lock:
+            health = self.models[name]
+            state = health.state(now)
+            if state == "open" or (state == "half-open" and health.probing):
+                return False
+            if state == "half-open":
+                health.probing = True
+                self.log(f"[router] {name}: cool-down over, sending a trial request.")
+            health.run_calls += 1
+            if self._last_choice and self._last_choice != name:
+                self.run_switches += 1
+                self.log(f"[router] Routing translations to {name} (was {self._last_choice}).")
+            self._last_choice = name
+            return True
+
+    def record_success(self, name: str, latency: float):
+        with self._lock:
+            health = self.models[name]
+            health.outcomes.append(True)
+            health.latencies.append(latency)
+            health.consecutive_failures = 0
+            health.probing = False
+            if health.open_count:
+                self.log(f"[router] {name}: trial request succeeded, circuit closed.")
+                health.open_count = 0
+
+    def record_failure(self, name: str, error):
+        kind = classify_error(error)
+        with self._lock:
+            health = self.models[name]
+            health.outcomes.append(False)
+            health.consecutive_failures += 1
+            health.run_failures += 1
+            was_probing = health.probing
+            health.probing = False
+            if kind == "quota":
+                health.run_quota_errors += 1
+            if kind == "quota" or was_probing or health.consecutive_failures >= self.FAILURE_THRESHOLD:
+                self._open(health, kind, retry_delay(error))
+
+    def _open(self, health: ModelHealth, kind: str, suggested_delay=None):
+        base = self.QUOTA_COOLDOWN_SEC if kind == "quota" else self.BASE_COOLDOWN_SEC
+        cooldown = min(base * (2 ** health.open_count), self.MAX_COOLDOWN_SEC)
+        if suggested_delay:
+            # The hint is a floor; repeated openings keep doubling past it
+            cooldown = max(suggested_delay, cooldown)
+        health.open_until = time.monotonic() + cooldown
+        health.open_count += 1
+        health.run_opens += 1
+        health.consecutive_failures = 0
+        self.log(f"[router] {health.name}: circuit opened for {cooldown:.0f}s ({kind}).")
+
+    def seconds_until_available(self, exclude=()):
+        """How long until a model not in `exclude` may take a request: 0 if one can now,
+        PROBE_POLL_SEC while its trial request is in flight, else the shortest remaining
+        cool-down. None if every model is excluded."""
+        now = time.monotonic()
+        waits = []
+        with self._lock:
+            for health in self.models.values():
+                if health.name in exclude:
+                    continue
+                state = health.state(now)
+                if state == "open":
+                    waits.append(health.open_until - now)
+                elif state == "half-open" and health.probing:
+                    waits.append(self.PROBE_POLL_SEC)
+                else:
+                    waits.append(0.0)
+        return min(waits, default=None)
+
+    def report_lines(self) -> list:
+        """Per-model stats for the run log."""
+        now = time.monotonic()
+        lines = []
+        with self._lock:
+            for health in self.models.values():
+                rate = health.success_rate
+                p50, p95 = health.percentile(50), health.percentile(95)
+                lines.append(
+                    f"  {health.name}: {health.run_calls} calls, {health.run_failures} failed "
+                    f"({health.run_quota_errors} quota), success {'-' if rate is None else f'{rate:.0%}'}, "
+                    f"p50 {'-' if p50 is None else f'{p50:.1f}s'}, p95 {'-' if p95 is None else f'{p95:.1f}s'}, "
+                    f"circuit {health.state(now)}"
+                    + (f" (opened {health.run_opens}x this run)" if health.run_opens else "")
+                )
+        return lines
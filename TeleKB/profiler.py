@@ -0,0 +1,155 @@
+import cProfile
+import collections
+import datetime
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+class RunProfiler:
+    """Opt-in profiler for a single collection run.
+
+    Two complementary views are collected:
+    * cProfile stats for every thread attached with profile_current_thread()/attach()
+      (collector thread, Telethon loop thread, Tk thread).
+    * A lightweight stack sampler over *all* threads, written as a collapsed-stack
+      file that flamegraph.pl / speedscope / inferno can read directly.
+    """
+
+    def __init__(self, output_dir: str, interval: float = 0.005):
+        self.run_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.profile_dir = os.path.join(output_dir, "profiles")
+        self.interval = interval
+
+        self._profiles = {}  # thread name -> cProfile.Profile
+        self._owners = {}    # thread name -> ident of the thread the profile runs on
+        self._detach = {}    # thread name -> callable that disables the profile on its own thread
+        self._stacks = collections.Counter()  # collapsed stack -> sample count
+        self._samples_per_thread = collections.Counter()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._sampler = None
+        self._started_at = None
+
+    def start(self):
+        self._started_at = time.time()
+        self._sampler = threading.Thread(target=self._sample_loop, name="telekb-profiler", daemon=True)
+        self._sampler.start()
+
+    # --- cProfile (per thread) ---
+
+    def profile_current_thread(self, name: str):
+        """Enables a cProfile.Profile on the calling thread."""
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError as e:
+            # Python 3.12+ allows only one active cProfile at a time; the sampler still covers this thread.
+            print(f"Profiler: cProfile unavailable for {name}: {e}")
+            return
+        with self._lock:
+            self._profiles[name] = prof
+            self._owners[name] = threading.get_ident()
+
+    def stop_current_thread(self, name: str):
+        with self._lock:
+            prof = self._profiles.get(name)
+        if prof:
+            prof.disable()
+
+    def attach(self, name: str, call_soon):
+        """Profiles another thread. `call_soon` schedules a callable on that thread,
+        e.g. loop.call_soon_threadsafe or `lambda fn: root.after(0, fn)`."""
+        call_soon(lambda: self.profile_current_thread(name))
+
+        def _detach():
+            done = threading.Event()
+
+            def _disable():
+                self.stop_current_thread(name)
+                done.set()
+            try:
+                call_soon(_disable)
+            except Exception:
+                return
+            # The target thread may be busy or gone; don't hang the run on it.
+            done.wait(timeout=2.0)
+
+        self._detach[name] = _detach
+
+    # --- Sampler (all threads) ---
+
+    def _sample_loop(self):
+        own_ident = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                thread_name = names.get(ident, f"thread-{ident}")
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_name)
+                stack.reverse()
+                key = ";".join(s.replace(";", ":") for s in stack)
+                with self._lock:
+                    self._stacks[key] += 1
+                    self._samples_per_thread[thread_name] += 1
+
+    # --- Output ---
+
+    def stop(self, message_count: int = 0, channel_count: int = 0) -> str:
+        """Stops profiling and writes all reports. Returns the profile directory."""
+        self._stop_event.set()
+        if self._sampler:
+            self._sampler.join(timeout=2.0)
+        for detach in self._detach.values():
+            detach()
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        prefix = os.path.join(self.profile_dir, f"run-{self.run_id}_{message_count}msgs")
+
+        with self._lock:
+            profiles = dict(self._profiles)
+            owners = dict(self._owners)
+            stacks = dict(self._stacks)
+            samples = dict(self._samples_per_thread)
+
+        for thread_name, prof in profiles.items():
+            # cProfile hooks are per-thread; only the owning thread may disable its profile.
+            if owners.get(thread_name) == threading.get_ident():
+                prof.disable()
+            safe_name = thread_name.replace(os.sep, "_").replace(" ", "_")
+            try:
+                prof.dump_stats(f"{prefix}_{safe_name}.prof")
+                buf = io.StringIO()
+                pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(50)
+                with open(f"{prefix}_{safe_name}.txt", "w", encoding="utf-8") as f:
+                    f.write(buf.getvalue())
+            except (TypeError, OSError) as e:
+                # A thread that never got scheduled has no stats to dump.
+                print(f"Profiler: could not write stats for {thread_name}: {e}")
+
+        with open(f"{prefix}.collapsed", "w", encoding="utf-8") as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+        summary = {
+            "run_id": self.run_id,
+            "messages": message_count,
+            "channels": channel_count,
+            "duration_sec": round(time.time() - (self._started_at or time.time()), 3),
+            "sample_interval_sec": self.interval,
+            "samples_per_thread": samples,
+            "cprofile_threads": sorted(profiles.keys()),
+        }
+        with open(f"{prefix}.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=4)
+
+        return self.profile_dir
@@ -0,0 +1,120 @@
+import collections
+import threading
+import time
+
+class CollectionProgress:
+    """Thread-safe progress counters for a collection run.
+
+    The pipeline only bumps counters; readers (the GUI timer, the headless
+    reporter) call snapshot() at their own pace, so progress reporting costs
+    nothing per message on the Tk thread.
+    """
+    RATE_WINDOW_SEC = 60.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, channels_total: int = 0):
+        with self._lock:
+            self.started_at = time.time()
+            self.channels_total = channels_total
+            self.channels_done = 0
+            self.current_channel = ""
+            self.messages_found = 0     # fetched from Telegram so far
+            self.messages_done = 0      # saved to Markdown
+            self.messages_failed = 0
+            self.translations_pending = 0
+            self._completions = collections.deque()  # monotonic timestamps of recent completions
+
+    def start_channel(self, title: str):
+        with self._lock:
+            self.current_channel = title
+
+    def add_found(self, count: int):
+        with self._lock:
+            self.messages_found += count
+
+    def finish_channel(self):
+        with self._lock:
+            self.channels_done += 1
+            self.current_channel = ""
+
+    def message_done(self, failed: bool = False, count: int = 1):
+        with self._lock:
+            if failed:
+                self.messages_failed += count
+            else:
+                self.messages_done += count
+            now = time.monotonic()
+            self._completions.extend([now] * count)
+
+    def translation_started(self):
+        with self._lock:
+            self.translations_pending += 1
+
+    def translation_finished(self):
+        with self._lock:
+            self.translations_pending -= 1
+
+    def _rate(self, now: float) -> float:
+        while self._completions and now - self._completions[0] > self.RATE_WINDOW_SEC:
+            self._completions.popleft()
+        if not self._completions:
+            return 0.0
+        window = min(self.RATE_WINDOW_SEC, max(now - self._completions[0], 1.0))
+        return len(self._completions) / window
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            rate = self._rate(now)
+            processed = self.messages_done + self.messages_failed
+            pending = max(self.messages_found - processed, 0)
+
+            # Channels not fetched yet are estimated from the average seen so far
+            fetched_channels = self.channels_done + (1 if self.current_channel else 0)
+            unfetched = max(self.channels_total - fetched_channels, 0)
+            avg_per_channel = self.messages_found / fetched_channels if fetched_channels else 0
+            estimated_remaining = pending + unfetched * avg_per_channel
+
+            eta = estimated_remaining / rate if rate > 0 else None
+            total_estimate = processed + estimated_remaining
+            if total_estimate > 0:
+                fraction = processed / total_estimate
+            elif self.channels_total:
+                fraction = self.channels_done / self.channels_total
+            else:
+                fraction = 0.0
+
+            return {
+                "channels_total": self.channels_total,
+                "channels_done": self.channels_done,
+                "current_channel": self.current_channel,
+                "messages_done": self.messages_done,
+                "messages_failed": self.messages_failed,
+                "messages_pending": pending,
+                "translations_pending": self.translations_pending,
+                "rate": rate,
+                "eta_sec": eta,
+                "fraction": min(fraction, 1.0),
+                "elapsed_sec": time.time() - self.started_at,
+            }
+
+    @staticmethod
+    def format_duration(seconds) -> str:
+        if seconds is None:
+            return "--:--"
+        seconds = int(seconds)
+        hours, rem = divmod(seconds, 3600)
+        minutes, secs = divmod(rem, 60)
+        if hours:
+            return f"{hours}:{minutes:02d}:{secs:02d}"
+        return f"{minutes:02d}:{secs:02d}"
+
+    def format(self, snap: dict = None) -> str:
+        s = snap or self.snapshot()
+        return (f"Channels {s['channels_done']}/{s['channels_total']} | "
+                f"Messages {s['messages_done']} done, {s['messages_pending']} pending, {s['messages_failed']} failed | "
+                f"{s['rate']:.1f} msg/s | Translating {s['translations_pending']} | "
+                f"ETA {self.format_duration(s['eta_sec'])}")
@@ -0,0 +1,63 @@
+import sys
+import types
+from .text_utils import TextUtils
+
+class MediaHandle:
+    """What the pipeline needs of a message's photo/video/document: its kind, file
+    metadata, and the Telethon Photo/Document object to download it with."""
+    __slots__ = ("kind", "size", "name", "ext", "tl_object")
+
+    def __init__(self, kind, size, name, ext, tl_object):
+        self.kind = kind
+        self.size = size
+        self.name = name
+        self.ext = ext
+        self.tl_object = tl_object
+
+class MessageRecord:
+    """Compact stand-in for a Telethon Message. TelegramService returns these, so the
+    client reference, raw TL tree and sender/chat entities of each message are not
+    kept alive while a channel or backfill window is processed."""
+    __slots__ = ("id", "date", "message", "entities", "grouped_id", "media")
+
+    def __init__(self, id, date, message, entities, grouped_id, media):
+        self.id = id
+        self.date = date
+        self.message = message
+        self.entities = entities      # (kind, offset, length, url) tuples, see TextUtils.entity_records
+        self.grouped_id = grouped_id
+        self.media = media            # MediaHandle or None
+
+    @classmethod
+    def from_message(cls, msg):
+        media = None
+        # Stickers, voice notes, round videos and GIFs are documents (the last two videos) too
+        kind = ("photo" if msg.photo else "sticker" if msg.sticker else "voice" if msg.voice
+                else "video_note" if msg.video_note else "gif" if msg.gif else "video" if msg.video
+                else "document" if msg.document else None)
+        if kind:
+            f = msg.file
+            media = MediaHandle(kind, f.size if f else None, f.name if f else None, f.ext if f else None,
+                                msg.photo or msg.document)
+        return cls(msg.id, msg.date, msg.message or "", TextUtils.entity_records(msg.entities),
+                   msg.grouped_id, media)
+
+def deep_sizeof(obj, skip=(), _seen=None) -> int:
+    """Approximate bytes retained by obj and everything it references, not counting
+    instances of the `skip` types (e.g. the shared TelegramClient)."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen or isinstance(obj, skip) or isinstance(obj, (type, types.ModuleType, types.FunctionType)):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, skip, seen) + deep_sizeof(v, skip, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, skip, seen) for item in obj)
+    else:
+        if hasattr(obj, "__dict__"):
+            size += deep_sizeof(vars(obj), skip, seen)
+        for slot in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, slot):
+                size += deep_sizeof(getattr(obj, slot), skip, seen)
+    return size
@@ -0,0 +1,65 @@
+class ChannelScheduler:
+    """Decides which channel a run works on next, a chunk of messages at a time.
+
+    Higher `priority` channels are served first. Among channels of equal priority the
+    one with the least work done relative to its `weight` goes next (weighted fair
+    queueing), so channels with a small backlog finish in their first turn and one
+    channel with thousands of pending messages no longer holds up all the others.
+    `max_per_run` caps the messages a channel processes in one run; the rest waits for
+    the next run. All three are columns of the channels table.
+
+    Chunk size is configured through settings.json: "scheduling": {"chunk_messages": 200}.
+    """
+    DEFAULT_CHUNK = 200
+
+    def __init__(self, channels, pending: dict, chunk: int = DEFAULT_CHUNK):
+        """pending: channel id -> estimated backlog in messages (missing if unknown)."""
+        self.chunk = max(1, chunk)
+        self.pending = pending
+        self.active = {}  # channel id -> {"priority", "weight", "cap", "served", "order"}
+        for order, ch in enumerate(self.order(channels, pending)):
+            self.active[ch['channel_id']] = {
+                "priority": ch['priority'] or 0,
+                "weight": max(1, ch['weight'] or 1),
+                "cap": ch['max_per_run'] or None,
+                "served": 0,
+                "order": order,
+            }
+
+    @staticmethod
+    def order(channels, pending: dict) -> list:
+        """Channels by priority, then smallest estimated backlog (unknown last)."""
+        def key(ch):
+            backlog = pending.get(ch['channel_id'])
+            return (-(ch['priority'] or 0), backlog is None, backlog or 0)
+        return sorted(channels, key=key)
+
+    @staticmethod
+    def chunk_size(config: dict) -> int:
+        return (config or {}).get("chunk_messages", ChannelScheduler.DEFAULT_CHUNK)
+
+    def next(self):
+        """(channel_id, message limit) for the next turn, or None when every channel is done."""
+        if not self.active:
+            return None
+        ch_id, entry = min(self.active.items(), key=lambda item: (
+            -item[1]["priority"], item[1]["served"] / item[1]["weight"], item[1]["order"]
+        ))
+        limit = self.chunk
+        if entry["cap"] is not None:
+            limit = min(limit, entry["cap"] - entry["served"])
+        return ch_id, limit
+
+    def record(self, channel_id: int, fetched: int, finished: bool) -> bool:
+        """Accounts a turn that fetched `fetched` messages. Returns True once the channel
+        is done for this run (caught up, or at its cap)."""
+        entry = self.active[channel_id]
+        entry["served"] += fetched
+        if finished or self.capped(channel_id):
+            del self.active[channel_id]
+            return True
+        return False
+
+    def capped(self, channel_id: int) -> bool:
+        entry = self.active.get(channel_id)
+        return entry is not None and entry["cap"] is not None and entry["served"] >= entry["cap"]
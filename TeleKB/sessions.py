@@ -0,0 +1,169 @@
+import collections
+import threading
+import time
+from .telegram_service import TelegramService
+
+class SessionPool:
+    """Several Telegram accounts collecting different channels in parallel, so the run
+    is no longer bounded by one account's flood limits.
+
+    Configured through settings.json: "accounts": ["telekb_session", "telekb_second"]
+    (session names; the main telekb_session account is always included). Each channel is
+    assigned to one account that can see it, balanced by recent message volume, and the
+    assignment is kept in the channel_sessions table so it stays stable between runs.
+    An account that hits a FloodWait hands its remaining channels to the others.
+    """
+    LOAD_WINDOW_DAYS = 7
+    # Longer FloodWaits hand the account's channels over instead of waiting them out
+    HANDOFF_WAIT_SEC = 60
+
+    def __init__(self, db, primary: TelegramService, session_names):
+        self.db = db
+        self.primary = primary
+        self.services = {primary.session_name: primary}
+        for name in session_names:
+            if name not in self.services:
+                self.services[name] = TelegramService(name, loop=primary.loop)
+        for service in self.services.values():
+            service.governor.max_wait = self.HANDOFF_WAIT_SEC
+        self.connected = [primary.session_name]
+        self._visible = {}   # session name -> {channel id: top message id}, fetched once per run
+
+    @classmethod
+    def from_settings(cls, db, primary: TelegramService, names):
+        """Returns None unless more than one account is configured."""
+        names = [n for n in (names or []) if n]
+        if len(set(names) | {primary.session_name}) < 2:
+            return None
+        return cls(db, primary, names)
+
+    def connect_others(self, log, phone_callback=None, code_callback=None, password_callback=None):
+        """Connects every account besides the (already connected) primary one."""
+        self.connected = [self.primary.session_name]
+        for name, service in self.services.items():
+            if service is self.primary:
+                continue
+            log(f"Connecting account '{name}'...")
+            if service.connect(phone_callback=phone_callback, code_callback=code_callback,
+                               password_callback=password_callback):
+                self.connected.append(name)
+            else:
+                log(f"Account '{name}' could not log in; its channels go to the other accounts.")
+        self._visible = {}
+
+    def visible_channels(self, name: str) -> dict:
+        """Channel id -> newest message id, for every channel the account can see."""
+        if name not in self._visible:
+            self._visible[name] = self.services[name].get_top_message_ids()
+        return self._visible[name]
+
+    def top_message_ids(self) -> dict:
+        """get_top_message_ids over every connected account."""
+        tops = {}
+        for name in self.connected:
+            for ch_id, top in self.visible_channels(name).items():
+                tops[ch_id] = max(top, tops.get(ch_id, 0))
+        return tops
+
+    def flooded_until(self) -> dict:
+        return self.db.get_session_flood_until()
+
+    def assign(self, channels) -> dict:
+        """Returns session name -> channel rows to collect, persisting the assignment.
+        Existing assignments are kept while the account is usable and sees the channel."""
+        for name in self.connected:
+            self.visible_channels(name)  # one get_dialogs per account, before any balancing
+        stored = self.db.get_channel_sessions()
+        recent = self.db.get_recent_message_counts(int(time.time()) - self.LOAD_WINDOW_DAYS * 86400)
+        flooded = self.flooded_until()
+        now = time.time()
+        available = [n for n in self.connected if flooded.get(n, 0) <= now] or list(self.connected)
+
+        load = {name: 0 for name in available}
+        shards = {name: [] for name in self.connected}
+        changed = {}
+        # Heaviest channels first so greedy placement balances well
+        for ch in sorted(channels, key=lambda c: -recent.get(c['channel_id'], 0)):
+            ch_id = ch['channel_id']
+            weight = 1 + recent.get(ch_id, 0)
+            current = stored.get(ch_id)
+            if current in load and ch_id in self.visible_channels(current):
+                name = current
+            else:
+                candidates = [n for n in available if ch_id in self.visible_channels(n)] or [self.primary.session_name]
+                name = min(candidates, key=lambda n: load.get(n, 0))
+                changed[ch_id] = name
+            load[name] = load.get(name, 0) + weight
+            shards[name].append(ch)
+        if changed:
+            self.db.set_channel_sessions(changed)
+        return shards
+
+    def reassign(self, channel_id: int, exclude: str, loads: dict):
+        """Picks another usable account that can see the channel (least loaded first),
+        persisting the move. Returns its name, or None if there is none."""
+        flooded = self.flooded_until()
+        now = time.time()
+        candidates = [n for n in self.connected
+                      if n != exclude and flooded.get(n, 0) <= now and channel_id in self.visible_channels(n)]
+        if not candidates:
+            return None
+        name = min(candidates, key=lambda n: loads.get(n, 0))
+        self.db.set_channel_sessions({channel_id: name})
+        return name
+
+class ShardQueue:
+    """Per-account channel queues shared by the shard threads of one run.
+
+    A thread takes channels from its own account's queue. On a FloodWait the account's
+    current and remaining channels move to other accounts; channels nobody else can see
+    wait until the flood expires. Threads keep running until every queue is empty and
+    no channel is in progress, since a flood elsewhere can hand them more work.
+    """
+    def __init__(self, pool: SessionPool, shards: dict):
+        self.pool = pool
+        self.queues = {name: collections.deque(chs) for name, chs in shards.items()}
+        self.blocked_until = {}  # session name -> monotonic time its flood ends
+        self.in_progress = 0
+        self._cond = threading.Condition()
+
+    def next(self, name: str, stop_event: threading.Event):
+        """The next channel for `name`, or None when the run's work is done or stopped."""
+        with self._cond:
+            while not stop_event.is_set():
+                wait = self.blocked_until.get(name, 0) - time.monotonic()
+                if self.queues[name] and wait <= 0:
+                    self.in_progress += 1
+                    return self.queues[name].popleft()
+                if not self.in_progress and not any(self.queues.values()):
+                    self._cond.notify_all()
+                    return None
+                self._cond.wait(timeout=min(max(wait, 0), 1.0) or 1.0)
+            return None
+
+    def done(self):
+        with self._cond:
+            self.in_progress -= 1
+            self._cond.notify_all()
+
+    def flood(self, name: str, ch, seconds: int, log):
+        """Moves `ch` (re-read, since it may have advanced) and the rest of `name`'s queue
+        to other accounts, and blocks `name` for the flood wait."""
+        self.pool.db.record_session_flood(name, int(time.time() + seconds))
+        with self._cond:
+            self.blocked_until[name] = time.monotonic() + seconds
+            loads = {n: len(q) for n, q in self.queues.items()}
+            remaining = [self.pool.db.get_channel(ch['channel_id'])] + list(self.queues[name])
+            self.queues[name].clear()
+            kept = 0
+            for channel in remaining:
+                target = self.pool.reassign(channel['channel_id'], name, loads)
+                if target:
+                    self.queues[target].append(channel)
+                    loads[target] += 1
+                else:
+                    self.queues[name].append(channel)
+                    kept += 1
+            self._cond.notify_all()
+        log(f"Account '{name}' hit a FloodWait of {seconds}s: moved {len(remaining) - kept} channel(s) "
+            f"to other accounts, {kept} wait for it.")
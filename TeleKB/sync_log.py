@@ -0,0 +1,135 @@
+import glob
+import json
+import os
+import time
+import uuid
+
+class SyncLog:
+    """Channel state shared between devices through the output directory, as
+    append-only change logs instead of one rewritten sync_state.json.
+
+    Each device appends to its own sync_log/<device_id>.jsonl, so devices never write
+    the same file. An entry carries one channel's metadata, checkpoint and the ranges of
+    message ids processed on that device since its previous entry, plus a per-device
+    version. Other devices read each log only past the byte offset they have applied
+    and merge deterministically: the highest checkpoint wins, metadata goes to the newer
+    updated_at (last writer wins), and processed ids are recorded so the messages are
+    not collected twice.
+    """
+    DIR_NAME = "sync_log"
+    METADATA = ("title", "username", "is_enabled", "priority", "weight", "max_per_run", "last_message_id")
+
+    def __init__(self, db, output_dir: str):
+        self.db = db
+        self.dir = os.path.join(output_dir, self.DIR_NAME)
+
+    def device_id(self) -> str:
+        device = self.db.get_sync_meta("device_id")
+        if device is None:
+            device = uuid.uuid4().hex[:12]
+            self.db.set_sync_meta({"device_id": device})
+        return device
+
+    @staticmethod
+    def to_ranges(ids) -> list:
+        """Sorted ids as inclusive [first, last] runs of consecutive ids."""
+        ranges = []
+        for i in sorted(set(ids)):
+            if ranges and i == ranges[-1][1] + 1:
+                ranges[-1][1] = i
+            else:
+                ranges.append([i, i])
+        return ranges
+
+    @classmethod
+    def fingerprint(cls, row: dict) -> str:
+        return json.dumps([row[k] for k in cls.METADATA])
+
+    # --- Export ---
+
+    def export(self) -> int:
+        """Appends entries for channels changed or collected since the last export.
+        Returns the number of entries written."""
+        device = self.device_id()
+        exported = self.db.get_sync_fingerprints()
+        since = int(self.db.get_sync_meta("exported_rowid", 0))
+        processed, last_rowid = self.db.get_processed_since(since)
+        ids = {}
+        for channel_id, message_id in processed:
+            ids.setdefault(channel_id, []).append(message_id)
+
+        version = int(self.db.get_sync_meta("version", 0))
+        lines, fingerprints = [], {}
+        for row in self.db.get_sync_data():
+            fp = self.fingerprint(row)
+            if exported.get(row["channel_id"]) == fp and row["channel_id"] not in ids:
+                continue
+            version += 1
+            entry = {"v": version, "device": device, "ts": row["updated_at"] or 0, **row,
+                     "processed": self.to_ranges(ids.get(row["channel_id"], []))}
+            lines.append(json.dumps(entry, ensure_ascii=False))
+            fingerprints[row["channel_id"]] = fp
+        if lines:
+            os.makedirs(self.dir, exist_ok=True)
+            with open(os.path.join(self.dir, f"{device}.jsonl"), "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.db.set_sync_fingerprints(fingerprints)
+        self.db.set_sync_meta({"version": version, "exported_rowid": last_rowid, "exported_at": int(time.time())})
+        return len(lines)
+
+    # --- Apply ---
+
+    def read_new_entries(self):
+        """Entries of other devices' logs past the applied offsets, and the new offsets.
+        A partly written last line is left for the next read."""
+        own = self.device_id()
+        cursors = self.db.get_sync_cursors()
+        entries, offsets = [], {}
+        for path in sorted(glob.glob(os.path.join(self.dir, "*.jsonl"))):
+            device = os.path.splitext(os.path.basename(path))[0]
+            if device == own:
+                continue
+            offset = cursors.get(device, 0)
+            if offset > os.path.getsize(path):
+                offset = 0  # the log was replaced; merging is idempotent, so re-read it
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                if line.strip():
+                    entries.append(json.loads(line))
+            offsets[device] = offset + end
+        return entries, offsets
+
+    @classmethod
+    def merge(cls, entries):
+        """Channel rows and processed (channel_id, message_id) pairs; the result does not
+        depend on the order the entries were read in."""
+        channels, processed = {}, set()
+        for e in sorted(entries, key=lambda e: (e["ts"], e["device"], e["v"])):
+            ch_id = e["channel_id"]
+            checkpoint = max(e["last_message_id"], channels[ch_id]["last_message_id"]) if ch_id in channels else e["last_message_id"]
+            channels[ch_id] = {"channel_id": ch_id, "updated_at": e["ts"], "device": e["device"],
+                               **{k: e.get(k) for k in cls.METADATA}, "last_message_id": checkpoint}
+            channels[ch_id]["priority"] = channels[ch_id]["priority"] or 0
+            channels[ch_id]["weight"] = channels[ch_id]["weight"] or 1
+            for first, last in e.get("processed", []):
+                processed.update((ch_id, i) for i in range(first, last + 1))
+        return list(channels.values()), sorted(processed)
+
+    def apply(self) -> int:
+        """Applies other devices' new entries. Returns the number of entries applied."""
+        if not os.path.isdir(self.dir):
+            return 0
+        entries, offsets = self.read_new_entries()
+        channels, processed = self.merge(entries)
+        self.db.apply_sync_changes(channels, processed, offsets, self.device_id())
+        if channels:
+            # Rows that now equal what another device logged are not this device's changes
+            merged = {c["channel_id"]: self.fingerprint(c) for c in channels}
+            self.db.set_sync_fingerprints({r["channel_id"]: merged[r["channel_id"]] for r in self.db.get_sync_data()
+                                           if merged.get(r["channel_id"]) == self.fingerprint(r)})
+        return len(entries)
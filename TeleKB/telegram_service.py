@@ -1,40 +1,107 @@
-from telethon import TelegramClient
+from telethon import TelegramClient, errors
 from telethon.tl.types import Channel, Chat, PeerChannel
 import asyncio
+import concurrent.futures
+import os
 import threading
+import time
 from typing import List, Optional
 from .config import Config
+from .records import MessageRecord, deep_sizeof
+from .connection import ConnectionManager
+from .governor import RequestGovernor
 
 class TelegramService:
-    def __init__(self):
-        # We start looking immediately? No, wait for connect.
-        self.loop = asyncio.new_event_loop()
-        self.thread = threading.Thread(target=self._start_loop, daemon=True)
-        self.thread.start()
+    # Streamed downloads: 512 KB requests (Telegram's maximum part size, a multiple of 4 KB)
+    DOWNLOAD_CHUNK_SIZE = 512 * 1024
+    # Messages per run measured for the memory report (Telethon Message vs MessageRecord)
+    MEMORY_SAMPLE = 50
+
+    DEFAULT_SESSION = "telekb_session"
+    # Catch-ups of at least this many messages go through a takeout session by default
+    TAKEOUT_MIN_MESSAGES = 10000
+    TAKEOUT_MAX_FILE_SIZE = 4 * 1024 ** 3
+
+    def __init__(self, session_name: str = DEFAULT_SESSION, loop=None):
+        """session_name selects the Telegram account (its .session file). Extra accounts
+        pass the first service's loop, so every client runs on one telethon-loop thread."""
+        self.session_name = session_name
+        if loop is None:
+            # We start looking immediately? No, wait for connect.
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self._start_loop, name="telethon-loop", daemon=True)
+            self.thread.start()
+        else:
+            self.loop = loop
+            self.thread = None
         
         # Create client inside the loop context if possible, or just attach later?
         # Telethon client usually prefers being created in the loop.
         # So we should create it inside the loop.
         self.client = None
+        self.conn = None  # ConnectionManager, created with the client
+        self.governor = RequestGovernor(session_name)
+        self._takeout = None               # open takeout proxy client, see start_takeout
+        self._takeout_refused_until = 0.0  # monotonic; no new attempt before then
+        self.reset_memory_stats()
         
         # Future to wait for client creation
         self._client_ready = threading.Event()
         asyncio.run_coroutine_threadsafe(self._init_client(), self.loop)
-        
-        self.is_connected = False
 
     def _start_loop(self):
         asyncio.set_event_loop(self.loop)
         self.loop.run_forever()
 
     async def _init_client(self):
-        self.client = TelegramClient('telekb_session', Config.API_ID, Config.API_HASH, loop=self.loop)
+        self.client = TelegramClient(self.session_name, Config.API_ID, Config.API_HASH, loop=self.loop,
+                                     flood_sleep_threshold=RequestGovernor.FLOOD_SLEEP_THRESHOLD)
+        self.conn = ConnectionManager(self.client, self.session_name, self.governor)
         self._client_ready.set()
 
     def _wait_client(self):
         self._client_ready.wait()
         return self.client
 
+    # --- Message records ---
+
+    def reset_run_stats(self):
+        self.reset_memory_stats()
+        self.governor.reset_stats()
+        self._takeout_refused_until = 0.0
+
+    def reset_memory_stats(self):
+        self.memory_stats = {"sampled": 0, "message_bytes": 0, "record_bytes": 0}
+
+    def _to_records(self, messages) -> List[MessageRecord]:
+        """Converts fetched Telethon messages to MessageRecords; the messages themselves
+        are dropped as soon as the caller's list goes away."""
+        records = [MessageRecord.from_message(m) for m in messages]
+        room = self.MEMORY_SAMPLE - self.memory_stats["sampled"]
+        if room > 0 and records:
+            # Measured together so chat/sender entities shared by the batch count once
+            self.memory_stats["message_bytes"] += deep_sizeof(messages[:room], skip=(TelegramClient,))
+            self.memory_stats["record_bytes"] += deep_sizeof(records[:room])
+            self.memory_stats["sampled"] += len(records[:room])
+        return records
+
+    def memory_report(self):
+        stats = self.memory_stats
+        if not stats["sampled"]:
+            return None
+        n = stats["sampled"]
+        return (f"Memory per message (sampled {n}): {stats['message_bytes'] / n / 1024:.1f} KB as Telethon Message, "
+                f"{stats['record_bytes'] / n / 1024:.1f} KB as MessageRecord")
+
+    def flood_report(self):
+        return self.governor.report()
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedules a coroutine on the client loop, e.g. a pipeline stage that awaits
+        the *_async methods below alongside other coroutines."""
+        self._wait_client()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
     async def _connect_coro(self, phone_callback, code_callback, password_callback):
         await self.client.connect()
         if not await self.client.is_user_authorized():
@@ -50,7 +117,7 @@ class TelegramService:
                     return False
             else:
                 return False
-        self.is_connected = True
+        self.conn.mark_connected(authorized=True)
         return True
 
     def connect(self, phone_callback=None, code_callback=None, password_callback=None):
@@ -61,30 +128,116 @@ class TelegramService:
         )
         return future.result()
 
-    async def _get_subscribed_channels_coro(self, include_groups):
-        if not self.is_connected:
-             await self.client.connect()
-             if await self.client.is_user_authorized():
-                 self.is_connected = True
-        
-        if not self.is_connected:
-            return []
+    @property
+    def is_connected(self) -> bool:
+        return self.conn is not None and self.conn.is_connected
+
+    async def _get_entity(self, channel_id):
+        return await self.conn.call(lambda: self.client.get_entity(PeerChannel(channel_id)), f"get_entity({channel_id})", "entity")
+
+    # --- Takeout ---
+
+    @staticmethod
+    def takeout_threshold(config: dict):
+        """Catch-up size (messages) from which to use a takeout session, from the
+        "takeout" setting ({"enabled": true, "min_messages": 10000}); None if disabled.
+        Off unless enabled: each takeout asks the user to confirm a data export."""
+        config = config or {}
+        if not config.get("enabled", False):
+            return None
+        return config.get("min_messages", TelegramService.TAKEOUT_MIN_MESSAGES)
+
+    @property
+    def takeout_active(self) -> bool:
+        return self._takeout is not None
+
+    async def _start_takeout_coro(self):
+        if self._takeout is not None:
+            return True
+        if time.monotonic() < self._takeout_refused_until:
+            return False
+        await self.conn.ensure()
+        if self.client.session.takeout_id is not None:
+            # Left open by an interrupted run; keep using it
+            takeout = self.client.takeout(finalize=True)
+        else:
+            takeout = self.client.takeout(finalize=True, megagroups=True, channels=True, files=True,
+                                          max_file_size=self.TAKEOUT_MAX_FILE_SIZE)
+        try:
+            self._takeout = await takeout.__aenter__()
+            return True
+        except errors.TakeoutInitDelayError as e:
+            # Telegram wants the export confirmed in another session first
+            self._takeout_refused_until = time.monotonic() + e.seconds
+            print(f"[{self.session_name}] Takeout delayed by {e.seconds}s (confirm it in the Telegram app); "
+                  f"using the normal client.")
+        except errors.RPCError as e:
+            self._takeout_refused_until = float("inf")
+            print(f"[{self.session_name}] Takeout refused ({e}); using the normal client.")
+        return False
+
+    def start_takeout(self) -> bool:
+        """Opens a takeout session, which Telegram rate-limits far more generously, for
+        history fetches and media downloads. Returns False (the normal client is used)
+        if Telegram refuses or delays it."""
+        self._wait_client()
+        future = asyncio.run_coroutine_threadsafe(self._start_takeout_coro(), self.loop)
+        return future.result()
+
+    async def _end_takeout_coro(self):
+        takeout, self._takeout = self._takeout, None
+        if takeout is None:
+            return
+        try:
+            await takeout.__aexit__(None, None, None)
+        except Exception as e:
+            # The session stays recorded and is reused by the next start_takeout
+            print(f"[{self.session_name}] Could not finish takeout: {e}")
+
+    def end_takeout(self):
+        self._wait_client()
+        future = asyncio.run_coroutine_threadsafe(self._end_takeout_coro(), self.loop)
+        return future.result()
+
+    async def _bulk_call(self, request, what: str, kind: str):
+        """conn.call for bulk reads: `request(client)` goes through the takeout session
+        while one is open, and through the normal client if Telegram rejects it."""
+        async def attempt():
+            takeout = self._takeout
+            if takeout is None:
+                return await request(self.client)
+            try:
+                return await request(takeout)
+            except errors.TakeoutInvalidError as e:
+                if self._takeout is takeout:
+                    print(f"[{self.session_name}] Takeout session ended ({e}); using the normal client.")
+                    self._takeout = None
+                    self.client.session.takeout_id = None
+                return await request(self.client)
+
+        if self._takeout is not None:
+            kind = f"takeout-{kind}"
+        return await self.conn.call(attempt, what, kind)
 
-        dialogs = await self.client.get_dialogs()
+    async def _get_channel_dialogs_coro(self, include_groups):
+        dialogs = await self.conn.call(self.client.get_dialogs, "get_dialogs", "dialogs")
         results = []
         for d in dialogs:
             entity = d.entity
             if isinstance(entity, Channel):
                 if entity.megagroup:
                      if include_groups:
-                         results.append(entity)
+                         results.append(d)
                 else:
-                     results.append(entity)
+                     results.append(d)
             elif isinstance(entity, Chat):
                 if include_groups:
-                    results.append(entity)
+                    results.append(d)
         return results
 
+    async def _get_subscribed_channels_coro(self, include_groups):
+        return [d.entity for d in await self._get_channel_dialogs_coro(include_groups)]
+
     def get_subscribed_channels(self, include_groups=False):
         self._wait_client()
         future = asyncio.run_coroutine_threadsafe(
@@ -93,83 +246,222 @@ class TelegramService:
         )
         return future.result()
 
+    async def _get_top_message_ids_coro(self):
+        dialogs = await self._get_channel_dialogs_coro(include_groups=True)
+        return {d.entity.id: d.message.id if d.message else 0 for d in dialogs}
+
+    def get_top_message_ids(self) -> dict:
+        """Channel/group id -> id of its newest message, for every dialog, from a single
+        get_dialogs. Compared with last_message_id this estimates the backlog cheaply."""
+        self._wait_client()
+        future = asyncio.run_coroutine_threadsafe(self._get_top_message_ids_coro(), self.loop)
+        return future.result()
+
+    @staticmethod
+    def _is_content(msg) -> bool:
+        # Album members usually carry no caption but are part of the post;
+        # photos, documents and videos are kept even without a caption, but stickers,
+        # voice notes, round videos and GIFs without one are chatter, not posts
+        chatter = msg.sticker or msg.voice or msg.video_note or msg.gif
+        return bool(msg.message or msg.grouped_id or msg.photo or (msg.document and not chatter))
+
+    async def _fetch_history(self, entity, min_id, max_id=0, limit=None, what="fetch"):
+        """Scans messages with min_id < id < max_id (0: no upper bound), oldest first.
+        Returns the cursor: the content "messages", how many were "seen" and the last
+        id scanned ("min_id"). A retry after a FloodWait or dropped connection resumes
+        after the last message seen."""
+        cursor = {"min_id": min_id, "seen": 0, "messages": []}
+
+        async def iterate(client):
+            remaining = None if limit is None else limit - cursor["seen"]
+            if remaining is not None and remaining <= 0:
+                return cursor
+            async for msg in client.iter_messages(entity, reverse=True, min_id=cursor["min_id"],
+                                                       max_id=max_id, limit=remaining):
+                cursor["min_id"] = msg.id
+                cursor["seen"] += 1
+                if self._is_content(msg):
+                    cursor["messages"].append(msg)
+            return cursor
+
+        return await self._bulk_call(iterate, what, "history")
+
     async def _fetch_messages_coro(self, channel_id, min_id, limit):
-        if not self.is_connected:
-             await self.client.connect()
-             if await self.client.is_user_authorized():
-                 self.is_connected = True
-
-        if not self.is_connected:
-            return []
-             
+        entity = await self._get_entity(channel_id)
+        cursor = await self._fetch_history(entity, min_id, limit=limit, what=f"fetch({channel_id})")
+        return self._to_records(cursor["messages"]), cursor["seen"], cursor["min_id"]
+
+    def fetch_messages(self, channel_id, min_id=0, limit=None):
+        """Scans up to `limit` messages newer than min_id. Returns (content messages,
+        oldest first; messages scanned; last id scanned), so a caller can move past a
+        stretch of service messages that yields no content. Raises TelegramUnavailable
+        if the channel can't be read, rather than reporting it as having no new messages."""
+        self._wait_client()
+        future = asyncio.run_coroutine_threadsafe(
+            self._fetch_messages_coro(channel_id, min_id, limit), 
+            self.loop
+        )
+        return future.result()
+
+    async def _fetch_range_coro(self, entity, first_id, last_id):
+        # iter_messages bounds are exclusive; windows are inclusive
+        cursor = await self._fetch_history(entity, first_id - 1, max_id=last_id + 1,
+                                           what=f"fetch window {first_id}..{last_id}")
+        return self._to_records(cursor["messages"])
+
+    async def _fetch_windows_coro(self, channel_id, windows):
         try:
-            entity = await self.client.get_entity(PeerChannel(channel_id))
+            entity = await self._get_entity(channel_id)
         except Exception as e:
             print(f"Entity error {channel_id}: {e}")
-            return []
+            return [None] * len(windows)
 
-        messages = []
-        async for msg in self.client.iter_messages(entity, min_id=min_id, limit=limit, reverse=True): 
-            if msg.message: 
-                messages.append(msg)
-        return messages
+        results = await asyncio.gather(
+            *(self._fetch_range_coro(entity, first_id, last_id) for first_id, last_id in windows),
+            return_exceptions=True
+        )
+        out = []
+        for (first_id, last_id), result in zip(windows, results):
+            if isinstance(result, Exception):
+                print(f"Window fetch error {channel_id} [{first_id}..{last_id}]: {result}")
+                out.append(None)
+            else:
+                out.append(result)
+        return out
 
-    def fetch_messages(self, channel_id, min_id=0, limit=None):
+    def fetch_message_windows(self, channel_id, windows):
+        """Fetches several inclusive (first_id, last_id) windows concurrently on the
+        client loop. Returns one message list per window, or None for a failed window."""
         self._wait_client()
         future = asyncio.run_coroutine_threadsafe(
-            self._fetch_messages_coro(channel_id, min_id, limit), 
+            self._fetch_windows_coro(channel_id, windows), 
             self.loop
         )
         return future.result()
 
-    async def _get_latest_id_coro(self, channel_id):
-        if not self.is_connected:
-             await self.client.connect()
-             if await self.client.is_user_authorized():
-                 self.is_connected = True
+    async def _get_messages_by_ids_coro(self, channel_id, ids):
+        entity = await self._get_entity(channel_id)
+        # One batched GetMessages request; missing ids come back as None
+        msgs = await self.conn.call(lambda: self.client.get_messages(entity, ids=list(ids)), f"get_messages({channel_id})", "messages")
+        return self._to_records([m for m in msgs if m is not None])
 
-        if not self.is_connected:
-            return 0
+    def get_messages_by_ids(self, channel_id, ids):
+        self._wait_client()
+        future = asyncio.run_coroutine_threadsafe(
+            self._get_messages_by_ids_coro(channel_id, ids), 
+            self.loop
+        )
+        return future.result()
 
-        try:
-            entity = await self.client.get_entity(PeerChannel(channel_id))
-            msgs = await self.client.get_messages(entity, limit=1)
-            if msgs:
-                return msgs[0].id
-            return 0
-        except Exception as e:
-            print(f"Latest ID error {channel_id}: {e}")
-            return 0
+    async def _sample_messages_coro(self, channel_id, min_id, limit):
+        entity = await self._get_entity(channel_id)
+        msgs = await self.conn.call(
+            lambda: self.client.get_messages(entity, limit=limit, min_id=min_id), f"sample({channel_id})", "messages"
+        )
+        return self._to_records([m for m in msgs if self._is_content(m)]), len(msgs)
 
-    def get_latest_message_id(self, channel_id):
+    def sample_messages(self, channel_id, min_id=0, limit=20):
+        """The newest `limit` messages after min_id, as (content records, messages
+        sampled). One request; used to estimate a backlog without fetching it."""
         self._wait_client()
         future = asyncio.run_coroutine_threadsafe(
-            self._get_latest_id_coro(channel_id), 
+            self._sample_messages_coro(channel_id, min_id, limit), 
             self.loop
         )
         return future.result()
 
-    async def _download_media_coro(self, message, output_path):
-        if not self.is_connected:
-             await self.client.connect()
-             if await self.client.is_user_authorized():
-                 self.is_connected = True
+    async def _get_id_before_date_coro(self, channel_id, date):
+        entity = await self._get_entity(channel_id)
+        # offset_date returns messages sent strictly before `date`, newest first
+        msgs = await self.conn.call(
+            lambda: self.client.get_messages(entity, limit=1, offset_date=date), f"date lookup({channel_id})", "messages"
+        )
+        if msgs:
+            return msgs[0].id
+        return 0
 
-        if not self.is_connected:
-            return None
+    def get_message_id_before(self, channel_id, date):
+        self._wait_client()
+        future = asyncio.run_coroutine_threadsafe(
+            self._get_id_before_date_coro(channel_id, date), 
+            self.loop
+        )
+        return future.result()
 
-        try:
-            path = await self.client.download_media(message, file=output_path)
-            return path
-        except Exception as e:
-            print(f"Download media error: {e}")
-            return None
+    async def _get_latest_id_coro(self, channel_id):
+        entity = await self._get_entity(channel_id)
+        msgs = await self.conn.call(lambda: self.client.get_messages(entity, limit=1), f"latest id({channel_id})", "messages")
+        if msgs:
+            return msgs[0].id
+        return 0
 
-    def download_media(self, message, output_path):
+    def get_latest_message_id(self, channel_id):
         self._wait_client()
         future = asyncio.run_coroutine_threadsafe(
-            self._download_media_coro(message, output_path), 
+            self._get_latest_id_coro(channel_id), 
             self.loop
         )
         return future.result()
 
+    async def _download_media_coro(self, message, output_path):
+        try:
+            return await self._bulk_call(
+                lambda client: client.download_media(message.media.tl_object, file=output_path), f"download {message.id}", "download"
+            )
+        except Exception as e:
+            # A missing image doesn't fail the post; the caller logs it
+            print(f"Download media error: {e}")
+            return None
+
+    async def download_media_batch_async(self, items):
+        """Downloads [(message, output_path), ...] concurrently on the client loop.
+        Returns paths (None on failure) in order."""
+        return await asyncio.gather(*(self._download_media_coro(message, path) for message, path in items))
+
+    async def _download_streamed_coro(self, message, output_path, max_bytes=None, attempts=3):
+        part_path = output_path + ".part"
+        for attempt in range(attempts):
+            try:
+                # Each reconnect-and-retry resumes the .part file where it stopped
+                await self._bulk_call(lambda client: self._stream_to_part(client, message, part_path, max_bytes),
+                                      f"stream {message.id}", "download")
+                os.replace(part_path, output_path)
+                return output_path
+            except ValueError as e:
+                # Over the cap: the partial file is useless, don't keep resuming it
+                print(f"Download skipped ({os.path.basename(output_path)}): {e}")
+                try:
+                    os.remove(part_path)
+                except OSError:
+                    pass
+                return None
+            except Exception as e:
+                # Keep the .part file; the next attempt (or the next run) resumes from it
+                print(f"Streamed download error (attempt {attempt + 1}/{attempts}): {e}")
+                await asyncio.sleep(2 * (attempt + 1))
+        return None
+
+    async def _stream_to_part(self, client, message, part_path, max_bytes):
+        # Resume from the last complete chunk of a previous attempt
+        offset = 0
+        if os.path.exists(part_path):
+            offset = os.path.getsize(part_path) // self.DOWNLOAD_CHUNK_SIZE * self.DOWNLOAD_CHUNK_SIZE
+        with open(part_path, "ab") as f:
+            f.truncate(offset)
+            written = offset
+            async for chunk in client.iter_download(
+                message.media.tl_object, offset=offset, request_size=self.DOWNLOAD_CHUNK_SIZE,
+                file_size=message.media.size
+            ):
+                written += len(chunk)
+                if max_bytes and written > max_bytes:
+                    raise ValueError(f"exceeds size cap of {max_bytes} bytes")
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def download_streamed_batch_async(self, items):
+        """Streams [(message, output_path, max_bytes), ...] to disk concurrently on the
+        client loop, in fixed-size chunks via a .part file that is resumed on retry and
+        renamed atomically when complete. Returns paths (None on failure) in order."""
+        return await asyncio.gather(*(self._download_streamed_coro(m, path, cap) for m, path, cap in items))
@@ -6,6 +6,15 @@ KEYWORDS = {
   "kr_range": r"[가-힣ㄱ-ㅎㅏ-ㅣ]"
 }
 
+# Entity types rendered as Markdown, by the kind used in plain entity records
+_ENTITY_KINDS = (
+    (MessageEntityTextUrl, "text_url"),
+    (MessageEntityUrl, "url"),
+    (MessageEntityBold, "bold"),
+    (MessageEntityItalic, "italic"),
+    ((MessageEntityCode, MessageEntityPre), "code"),
+)
+
 class TextUtils:
     @staticmethod
     def is_korean(text: str) -> bool:
@@ -60,13 +69,28 @@ class TextUtils:
             
         return first_line
 
+    @staticmethod
+    def entity_records(entities: list) -> list:
+        """Plain (kind, offset, length, url) tuples for the entities that are rendered,
+        so a message's formatting can be handed to a worker process."""
+        records = []
+        for entity in entities or ():
+            for cls, kind in _ENTITY_KINDS:
+                if isinstance(entity, cls):
+                    records.append((kind, entity.offset, entity.length, getattr(entity, "url", None)))
+                    break
+        return records
+
     @staticmethod
     def convert_entities_to_markdown(text: str, entities: list) -> str:
+        """Accepts Telethon entities or records from entity_records()."""
         if not entities or not text:
             return text
+        if not isinstance(entities[0], tuple):
+            entities = TextUtils.entity_records(entities)
 
         # Sort entities by offset descending so we can replace without shifting earlier offsets
-        sorted_entities = sorted(entities, key=lambda e: e.offset, reverse=True)
+        sorted_entities = sorted(entities, key=lambda e: e[1], reverse=True)
         
         # We need to be careful with UTF-16 offsets if Telegram uses them?
         # Telethon usually handles this, but Python strings are indexed by char (Unicode code points usually).
@@ -118,23 +142,21 @@ class TextUtils:
         
         text_surrogate = safe_add_surrogate(text)
         
-        for entity in sorted_entities:
-            start = entity.offset
-            end = start + entity.length
+        for kind, start, length, url in sorted_entities:
+            end = start + length
             
             inner_text = text_surrogate[start:end]
             replacement = inner_text
             
-            if isinstance(entity, MessageEntityTextUrl):
-                url = entity.url
+            if kind == "text_url":
                 replacement = f"[{inner_text}]({url})"
-            elif isinstance(entity, MessageEntityUrl):
+            elif kind == "url":
                 replacement = f"[{inner_text}]({inner_text})"
-            elif isinstance(entity, MessageEntityBold):
+            elif kind == "bold":
                 replacement = f"**{inner_text}**"
-            elif isinstance(entity, MessageEntityItalic):
+            elif kind == "italic":
                 replacement = f"*{inner_text}*"
-            elif isinstance(entity, (MessageEntityCode, MessageEntityPre)):
+            elif kind == "code":
                 replacement = f"`{inner_text}`"
                 
             text_surrogate = text_surrogate[:start] + replacement + text_surrogate[end:]
@@ -1,54 +1,228 @@
+import asyncio
 import os
+import re
+import time
 from google import genai
 from .config import Config
+from .model_router import ModelRouter, classify_error
+
+# Paragraph separators are kept so the translation can be reassembled with the same layout
+_PARAGRAPH_SPLIT_RE = re.compile(r'(\n\s*\n)')
+# The whitespace after a sentence is captured, so single newlines inside a paragraph survive
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?。！？])(\s+)')
+_CJK_RE = re.compile(r'[぀-ヿ㐀-鿿가-힯]')
 
 class Translator:
-    def __init__(self):
+    # Long posts are split so no single request runs into the output-token limit
+    CHUNK_TOKEN_BUDGET = 1500
+    PARALLEL_CHUNKS = 4
+    CHUNK_RETRIES = 2
+    # When no model can take a request (circuits open or on a trial request), wait this
+    # long at most for one to come back
+    MAX_ROUTER_WAIT_SEC = 60
+    MAX_RETRIES_PER_MODEL = 2
+
+    def __init__(self, chunk_token_budget: int = None, parallel_chunks: int = None):
         if Config.GEMINI_API_KEY:
             self.client = genai.Client(api_key=Config.GEMINI_API_KEY)
             # Priority list of models to try. Fall back to older/other versions if quota exceeded.
             self.model_list = ["models/gemini-3.1-flash-lite-preview", "models/gemini-2.5-flash-lite", "models/gemma-4-31b-it"]
         else:
             self.client = None
+            self.model_list = []
+        self.router = ModelRouter(self.model_list)
+        self.chunk_token_budget = chunk_token_budget or self.CHUNK_TOKEN_BUDGET
+        self.parallel_chunks = parallel_chunks or self.PARALLEL_CHUNKS
+        self._aio_slots = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        # settings.json: "translation": {"chunk_tokens": 1500, "parallel_chunks": 4}
+        config = settings.get("translation") or {}
+        return cls(chunk_token_budget=config.get("chunk_tokens"), parallel_chunks=config.get("parallel_chunks"))
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        # Rough but conservative: ~1 token per CJK character, ~4 characters per token otherwise
+        cjk = len(_CJK_RE.findall(text))
+        return cjk + (len(text) - cjk) // 4 + 1
+
+    @staticmethod
+    def _split_sentences(paragraph: str) -> list:
+        """(sentence, whitespace after it) pairs; the last sentence's whitespace is ""
+        unless the paragraph ends with some."""
+        parts = _SENTENCE_END_RE.split(paragraph)
+        # parts alternates sentence, whitespace, sentence, ...
+        pairs = [(parts[i], parts[i + 1] if i + 1 < len(parts) else "") for i in range(0, len(parts), 2)]
+        if len(pairs) > 1 and not pairs[-1][0]:
+            # Trailing whitespace: keep it with the sentence before
+            _, trailing = pairs.pop()
+            pairs[-1] = (pairs[-1][0], pairs[-1][1] + trailing)
+        return pairs
+
+    @classmethod
+    def split_into_chunks(cls, text: str, token_budget: int) -> list:
+        """Splits text into (chunk, separator) pairs under token_budget, breaking at
+        paragraph boundaries first and sentence boundaries for oversized paragraphs.
+        ''.join(chunk + separator) reproduces the text."""
+        pieces = _PARAGRAPH_SPLIT_RE.split(text)
+        # pieces alternates paragraph, separator, paragraph, ...
+        units = []
+        for i in range(0, len(pieces), 2):
+            paragraph = pieces[i]
+            separator = pieces[i + 1] if i + 1 < len(pieces) else ""
+            if cls.estimate_tokens(paragraph) <= token_budget:
+                units.append((paragraph, separator))
+                continue
+            sentences = cls._split_sentences(paragraph)
+            for j, (sentence, space) in enumerate(sentences):
+                units.append((sentence, space + separator if j == len(sentences) - 1 else space))
 
-    def translate_to_korean(self, text: str) -> str:
+        chunks = []
+        current, current_sep, current_tokens = "", "", 0
+        for unit, sep in units:
+            tokens = cls.estimate_tokens(unit)
+            if current and current_tokens + tokens > token_budget:
+                chunks.append((current, current_sep))
+                current, current_sep, current_tokens = "", "", 0
+            current += current_sep + unit if current else unit
+            current_sep = sep
+            current_tokens += tokens
+        if current or not chunks:
+            chunks.append((current, current_sep))
+        return chunks
+
+    async def translate_to_korean_async(self, text: str) -> str:
+        """Translates on the caller's event loop (the Telethon loop) through the SDK's
+        async client, so translations overlap with fetches and downloads. Long posts
+        are split into chunks that are translated concurrently."""
         if not text or not self.client:
             return ""
-        
-        import time
-        max_retries_per_model = 2
-        
-        for model_name in self.model_list:
-            for attempt in range(max_retries_per_model + 1):
-                try:
-                    prompt = f"Translate the following text to Korean. Output ONLY the translation without any explanation or quotes:\n\n{text}"
-                    
-                    response = self.client.models.generate_content(
-                        model=model_name,
-                        contents=prompt
-                    )
-                    
-                    if response.text:
-                        return response.text.strip()
-                    return ""
-
-                except Exception as e:
-                    err_str = str(e).upper()
-                    # Check for retriable errors: 429 (Quota), 503 (Service Unavailable), RESOURCE_EXHAUSTED
-                    is_retriable = any(code in err_str for code in ["429", "503", "RESOURCE_EXHAUSTED", "SERVICE_UNAVAILABLE"])
-                    
-                    if is_retriable:
-                        if attempt < max_retries_per_model:
-                            sleep_time = 2 * (attempt + 1)
-                            print(f"[{model_name}] Service issue ({'429' if '429' in err_str else '503'}). Retrying in {sleep_time}s...")
-                            time.sleep(sleep_time)
-                            continue
-                        else:
-                            print(f"[{model_name}] Limit/Error reached. Falling back to next model...")
-                            break # Move to the next model in model_list
-                    
-                    print(f"Translation error with {model_name}: {e}")
-                    # For other errors, we also try the next model just in case it's model-specific
-                    break 
-        
+        if self._aio_slots is None:
+            # Caps concurrent requests across all posts in flight, not just one post's chunks
+            self._aio_slots = asyncio.Semaphore(self.parallel_chunks)
+
+        chunks = self.split_into_chunks(text, self.chunk_token_budget)
+        if len(chunks) == 1:
+            return await self._translate_chunk_async(text)
+
+        print(f"Translating long text in {len(chunks)} chunks...")
+        results = await asyncio.gather(*(self._translate_chunk_with_retry_async(c) for c, _ in chunks))
+        return self._assemble(chunks, results)
+
+    @staticmethod
+    def _assemble(chunks, results) -> str:
+        if not any(results):
+            return ""
+        out = []
+        for (chunk, sep), translated in zip(chunks, results):
+            if not translated:
+                # Keep the original for a chunk that failed every retry rather than dropping it
+                print("A chunk could not be translated; keeping its original text.")
+                translated = chunk
+            out.append(translated + sep)
+        return "".join(out).strip()
+
+    async def _translate_chunk_with_retry_async(self, chunk: str) -> str:
+        for attempt in range(self.CHUNK_RETRIES + 1):
+            result = await self._translate_chunk_async(chunk)
+            if result:
+                return result
+            if attempt < self.CHUNK_RETRIES:
+                await asyncio.sleep(2 * (attempt + 1))
         return ""
+
+    def _resplit(self, text: str):
+        # Output hit the token limit: split smaller and translate the halves
+        parts = self.split_into_chunks(text, max(self.estimate_tokens(text) // 2, 50))
+        if len(parts) > 1:
+            print(f"Translation truncated; retrying as {len(parts)} smaller chunks...")
+        return parts
+
+    async def _translate_chunk_async(self, text: str, depth: int = 0) -> str:
+        result, truncated = await self._generate_async(text)
+        if truncated and depth < 2:
+            parts = self._resplit(text)
+            if len(parts) > 1:
+                translated = [await self._translate_chunk_async(p, depth + 1) for p, _ in parts]
+                if all(translated):
+                    return "".join(t + sep for t, (_, sep) in zip(translated, parts)).strip()
+        return result
+
+    @staticmethod
+    def _prompt(text: str) -> str:
+        return f"Translate the following text to Korean. Output ONLY the translation without any explanation or quotes:\n\n{text}"
+
+    def _router_wait(self, deadline: float, tried):
+        """Seconds to wait before looking for a model again, or None to give up: every
+        model not tried yet stays unavailable past the deadline."""
+        wait = self.router.seconds_until_available(exclude=tried)
+        if wait is None:
+            return None
+        if time.monotonic() + wait > deadline:
+            print(f"All translation models are cooling down ({wait:.0f}s left).")
+            return None
+        return wait
+
+    def _on_response(self, model_name, response, started):
+        self.router.record_success(model_name, time.monotonic() - started)
+        truncated = self._is_truncated(response)
+        if response.text:
+            return response.text.strip(), truncated
+        return "", truncated
+
+    def _on_error(self, model_name, e, attempt):
+        """Returns the seconds to sleep before retrying the same model, or None to move on."""
+        self.router.record_failure(model_name, e)
+        kind = classify_error(e)
+
+        # 503 is usually brief: retry the same model. A quota error opens the
+        # circuit, so move on immediately instead of sleeping on it.
+        if kind == "unavailable" and attempt < self.MAX_RETRIES_PER_MODEL:
+            sleep_time = 2 * (attempt + 1)
+            print(f"[{model_name}] Service issue (503). Retrying in {sleep_time}s...")
+            return sleep_time
+
+        if kind == "quota":
+            print(f"[{model_name}] Quota exhausted. Falling back to next model...")
+        else:
+            print(f"Translation error with {model_name}: {e}")
+        # For other errors, we also try the next model just in case it's model-specific
+        return None
+
+    async def _generate_async(self, text: str):
+        """One translation request through client.aio, routed to the best healthy model.
+        Returns (text, truncated). While no model can take it (cool-downs, another
+        request's trial of a half-open circuit) it waits up to MAX_ROUTER_WAIT_SEC."""
+        deadline = time.monotonic() + self.MAX_ROUTER_WAIT_SEC
+        tried = set()
+        while True:
+            for model_name in self.router.candidates():
+                if model_name in tried:
+                    continue
+                for attempt in range(self.MAX_RETRIES_PER_MODEL + 1):
+                    if not self.router.acquire(model_name):
+                        break
+                    tried.add(model_name)
+                    async with self._aio_slots:
+                        started = time.monotonic()
+                        try:
+                            response = await self.client.aio.models.generate_content(model=model_name, contents=self._prompt(text))
+                            return self._on_response(model_name, response, started)
+                        except Exception as e:
+                            sleep_time = self._on_error(model_name, e, attempt)
+                    if sleep_time is None:
+                        break
+                    await asyncio.sleep(sleep_time)
+            wait = self._router_wait(deadline, tried)
+            if wait is None:
+                return "", False
+            await asyncio.sleep(wait)
+
+    @staticmethod
+    def _is_truncated(response) -> bool:
+        try:
+            reason = response.candidates[0].finish_reason
+        except (AttributeError, IndexError, TypeError):
+            return False
+        return "MAX_TOKENS" in str(reason)
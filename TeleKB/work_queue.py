@@ -0,0 +1,143 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+class WorkQueue:
+    """Per-channel leases shared by several TeleKB workers, so each channel is collected
+    by one worker at a time.
+
+    The lease table lives in its own SQLite file, by default in the output directory so
+    workers on other hosts that share it see the same leases. A worker leases a channel
+    before its first turn and keeps it until the channel is done for the run; a
+    heartbeat thread renews its leases and publishes each channel's checkpoint, and a
+    worker that dies simply lets its leases expire. When a channel changes hands the
+    new worker adopts the published checkpoint if it is ahead of its own database.
+
+    Configured through settings.json: "work_queue": {"enabled": true, "path": null,
+    "lease_sec": 120}.
+    """
+    DEFAULT_LEASE_SEC = 120
+    FILE_NAME = "telekb_queue.db"
+
+    def __init__(self, path: str, lease_sec: int = DEFAULT_LEASE_SEC, worker_id: str = None):
+        self.path = path
+        self.lease_sec = lease_sec
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.held = set()
+        self.lost = set()     # leases that expired and were taken while we held them
+        self.checkpoints = None  # callable: channel ids -> {channel id: last_message_id}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+        self.conn = None
+
+    def get_connection(self):
+        # Autocommit; acquire() opens its own IMMEDIATE transaction
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30.0, isolation_level=None)
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS channel_leases (
+                    channel_id INTEGER PRIMARY KEY,
+                    worker_id TEXT,
+                    lease_until REAL DEFAULT 0,
+                    heartbeat_at REAL,
+                    checkpoint INTEGER DEFAULT 0
+                )
+            ''')
+        return self.conn
+
+    @classmethod
+    def from_settings(cls, config: dict, output_dir: str):
+        config = config or {}
+        if not config.get("enabled"):
+            return None
+        path = config.get("path") or os.path.join(output_dir, cls.FILE_NAME)
+        return cls(path, config.get("lease_sec", cls.DEFAULT_LEASE_SEC))
+
+    # --- Leases ---
+
+    def acquire(self, channel_id: int):
+        """Leases the channel for this worker. Returns the checkpoint published for it
+        (0 if none), or None if another worker holds a live lease."""
+        with self._lock:
+            if channel_id in self.held and channel_id not in self.lost:
+                return 0
+            conn = self.get_connection()
+            now = time.time()
+            try:
+                # IMMEDIATE takes the write lock up front, so two workers can't both
+                # see the lease as free
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("INSERT OR IGNORE INTO channel_leases (channel_id) VALUES (?)", (channel_id,))
+                cursor = conn.execute('''
+                    UPDATE channel_leases SET worker_id = ?, lease_until = ?, heartbeat_at = ?
+                    WHERE channel_id = ? AND (worker_id IS NULL OR worker_id = ? OR lease_until < ?)
+                ''', (self.worker_id, now + self.lease_sec, now, channel_id, self.worker_id, now))
+                row = conn.execute("SELECT checkpoint FROM channel_leases WHERE channel_id = ?", (channel_id,)).fetchone()
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            if cursor.rowcount != 1:
+                return None
+            self.held.add(channel_id)
+            self.lost.discard(channel_id)
+            return row[0] or 0
+
+    def release(self, channel_id: int, checkpoint: int):
+        """Publishes the channel's checkpoint and frees it for other workers."""
+        with self._lock:
+            self.held.discard(channel_id)
+            self.get_connection().execute('''
+                UPDATE channel_leases SET worker_id = NULL, lease_until = 0, checkpoint = MAX(checkpoint, ?)
+                WHERE channel_id = ? AND worker_id = ?
+            ''', (checkpoint, channel_id, self.worker_id))
+
+    def renew(self):
+        """Extends every lease held and publishes the checkpoints reached so far."""
+        with self._lock:
+            held = list(self.held)
+        if not held:
+            return
+        checkpoints = self.checkpoints(held) if self.checkpoints else {}
+        now = time.time()
+        with self._lock:
+            for channel_id in held:
+                cursor = self.get_connection().execute('''
+                    UPDATE channel_leases SET lease_until = ?, heartbeat_at = ?, checkpoint = MAX(checkpoint, ?)
+                    WHERE channel_id = ? AND worker_id = ?
+                ''', (now + self.lease_sec, now, checkpoints.get(channel_id, 0), channel_id, self.worker_id))
+                if cursor.rowcount != 1 and channel_id in self.held:
+                    self.lost.add(channel_id)
+
+    # --- Heartbeat ---
+
+    def start(self, checkpoints):
+        """Starts the heartbeat. checkpoints(ids) returns the local last_message_id of each."""
+        self.checkpoints = checkpoints
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="lease-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.lease_sec / 3):
+            try:
+                self.renew()
+            except sqlite3.Error as e:
+                print(f"Lease heartbeat failed: {e}")
+
+    def stop(self):
+        """Stops the heartbeat and releases every lease still held."""
+        self._stop.set()
+        if self._heartbeat:
+            self._heartbeat.join()
+            self._heartbeat = None
+        held = list(self.held)
+        checkpoints = self.checkpoints(held) if self.checkpoints and held else {}
+        for channel_id in held:
+            self.release(channel_id, checkpoints.get(channel_id, 0))
+        self.lost.clear()
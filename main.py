@@ -1,15 +1,59 @@
 import tkinter as tk
 from tkinter import messagebox
+import argparse
+import datetime
+import multiprocessing
 import sys
 import os
 from TeleKB.config import Config
 from TeleKB.gui.main_window import MainWindow
 
+def parse_date(value):
+    # Dates are interpreted in local time, like the Markdown folders
+    return datetime.datetime.fromisoformat(value).astimezone()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="TeleKB - Telegram Knowledge Base")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile collection runs (cProfile + collapsed stacks in <output>/profiles)")
+    parser.add_argument("--headless", action="store_true",
+                        help="Run one collection pass without the GUI and exit")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Estimate pending messages, translation tokens, media and time per channel, then exit")
+    parser.add_argument("--output", help="Output directory for headless runs (default: saved setting)")
+    parser.add_argument("--session", help="Telegram session (account) for headless runs, e.g. for a second worker")
+    parser.add_argument("--progress-interval", type=float, default=10.0,
+                        help="Seconds between progress lines in headless mode")
+    backfill = parser.add_argument_group("backfill", "Collect a historical range of one channel (headless)")
+    backfill.add_argument("--backfill", type=int, metavar="CHANNEL_ID", help="Channel to backfill")
+    backfill.add_argument("--since", type=parse_date, help="Start date, e.g. 2026-04-01")
+    backfill.add_argument("--until", type=parse_date, help="End date (exclusive); default: the live checkpoint")
+    backfill.add_argument("--first-id", type=int, help="First message id (instead of --since)")
+    backfill.add_argument("--last-id", type=int, help="Last message id (instead of --until)")
+    backfill.add_argument("--workers", type=int, default=4, help="Id windows fetched concurrently")
+    backfill.add_argument("--window-size", type=int, default=500, help="Message ids per window")
+    backfill.add_argument("--cpu-workers", type=int,
+                          help="Processes for Markdown conversion/language detection/hashing (default: cpu_pool setting, 0 = inline)")
+    archive = parser.add_argument_group("archive", "Check, repair or roll up the Markdown archive (headless)")
+    archive.add_argument("--verify-archive", action="store_true",
+                         help="Check every collected section against its recorded byte range and hash")
+    archive.add_argument("--repair", action="store_true",
+                         help="With --verify-archive, re-index files whose sections moved or were edited")
+    archive.add_argument("--retranslate", type=int, nargs=2, metavar=("CHANNEL_ID", "MESSAGE_ID"),
+                         help="Translate one collected message again and rewrite its section in place")
+    archive.add_argument("--rollup", action="store_true",
+                         help="Pack completed months into compressed archives in <output>/cold_storage")
+    archive.add_argument("--extract-month", metavar="YYYY-MM", help="Restore a rolled-up month to plain files")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     try:
         Config.validate()
     except ValueError as e:
         print(f"Configuration Error: {e}", file=sys.stderr)
+        if args.headless or args.backfill or args.dry_run or args.verify_archive or args.retranslate or args.rollup or args.extract_month:
+            sys.exit(1)
         # We can't use tk message box easily if root not created yet, 
         # but let's create a temporary root to show error.
         root = tk.Tk()
@@ -17,9 +61,54 @@ def main():
         messagebox.showerror("Configuration Error", str(e) + "\n\nPlease ensure you have a .env file with API_ID, API_HASH, and GEMINI_API_KEY.")
         return
 
+    if args.verify_archive:
+        from TeleKB.headless import run_verify
+        run_verify(repair=args.repair, output_dir=args.output)
+        return
+
+    if args.rollup:
+        from TeleKB.headless import run_rollup
+        run_rollup(output_dir=args.output)
+        return
+
+    if args.extract_month:
+        from TeleKB.headless import run_extract
+        run_extract(args.extract_month, output_dir=args.output)
+        return
+
+    if args.retranslate:
+        from TeleKB.headless import run_retranslate
+        run_retranslate(*args.retranslate, output_dir=args.output)
+        return
+
+    if args.dry_run:
+        from TeleKB.headless import run_estimate
+        run_estimate(output_dir=args.output)
+        return
+
+    if args.backfill:
+        from TeleKB.headless import run_backfill
+        run_backfill(
+            args.backfill, since=args.since, until=args.until,
+            first_id=args.first_id, last_id=args.last_id,
+            workers=args.workers, window_size=args.window_size,
+            output_dir=args.output, progress_interval=args.progress_interval,
+            cpu_workers=args.cpu_workers
+        )
+        return
+
+    if args.headless:
+        from TeleKB.headless import run_headless
+        run_headless(output_dir=args.output, profile=args.profile, progress_interval=args.progress_interval,
+                     session=args.session)
+        return
+
     root = tk.Tk()
-    app = MainWindow(root)
+    app = MainWindow(root, profile=args.profile)
     root.mainloop()
 
 if __name__ == "__main__":
+    # Worker processes (cpu_pool, images) start this module again; in the frozen
+    # exe they must run as pool workers, not open another window
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,30 @@
+import types
+
+from TeleKB.records import MessageRecord
+from TeleKB.telegram_service import TelegramService
+
+def message(text="", grouped_id=None, **media):
+    fields = {kind: None for kind in ("photo", "document", "video", "sticker", "voice", "video_note", "gif")}
+    fields.update(media)
+    if any(media.get(kind) for kind in ("video", "sticker", "voice", "video_note", "gif")):
+        fields["document"] = object()  # Telethon exposes all of these as documents too
+    return types.SimpleNamespace(id=1, date=None, message=text, entities=None, grouped_id=grouped_id,
+                                 file=types.SimpleNamespace(size=1024, name=None, ext=".jpg"), **fields)
+
+def test_caption_less_single_photo_is_content():
+    msg = message(photo=object())
+    assert TelegramService._is_content(msg)
+    assert MessageRecord.from_message(msg).media.kind == "photo"
+
+def test_caption_less_documents_and_videos_are_content():
+    assert TelegramService._is_content(message(document=object()))
+    assert TelegramService._is_content(message(video=object()))
+
+def test_caption_less_chatter_is_not_content():
+    for kind in ("sticker", "voice", "video_note", "gif"):
+        msg = message(**{kind: object()})
+        assert not TelegramService._is_content(msg)
+        assert MessageRecord.from_message(msg).media.kind == kind
+
+def test_captioned_sticker_is_content():
+    assert TelegramService._is_content(message("caption", sticker=object()))
@@ -0,0 +1,75 @@
+import asyncio
+import time
+import types
+
+from TeleKB.model_router import ModelRouter
+from TeleKB.translator import Translator
+
+class FakeModels:
+    """client.aio.models stand-in: answers after `delay`, failing while `fail` is set."""
+
+    def __init__(self, delay=0.2, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = []  # (model, start, end)
+
+    async def generate_content(self, model, contents):
+        started = time.monotonic()
+        await asyncio.sleep(self.delay)
+        self.calls.append((model, started, time.monotonic()))
+        if self.fail:
+            raise RuntimeError("503 UNAVAILABLE")
+        return types.SimpleNamespace(text=f"번역 {contents[-1]}", candidates=[])
+
+def make_translator(models, names=("m1",)):
+    translator = Translator()
+    translator.client = types.SimpleNamespace(aio=types.SimpleNamespace(models=models))
+    translator.router = ModelRouter(list(names), log=lambda *args: None)
+    translator.router.PROBE_POLL_SEC = 0.02
+    return translator
+
+def half_open(router, name):
+    health = router.models[name]
+    health.open_count = 1
+    health.open_until = time.monotonic() - 1
+
+def test_requests_wait_for_half_open_probe():
+    models = FakeModels()
+    translator = make_translator(models)
+    half_open(translator.router, "m1")
+
+    async def run():
+        return await asyncio.gather(*(translator.translate_to_korean_async(f"text {i}") for i in range(6)))
+
+    results = asyncio.run(run())
+    assert all(results)
+    assert len(models.calls) == 6
+    # The trial request went alone; the others were sent once it closed the circuit
+    probe_end = min(end for _, _, end in models.calls)
+    assert sorted(start for _, start, _ in models.calls)[1] >= probe_end
+    assert translator.router.models["m1"].state(time.monotonic()) == "closed"
+
+def test_failed_probe_gives_up_when_cooldown_exceeds_wait():
+    models = FakeModels(fail=True)
+    translator = make_translator(models)
+    translator.CHUNK_RETRIES = 0
+    half_open(translator.router, "m1")
+
+    async def run():
+        return await asyncio.gather(*(translator.translate_to_korean_async(f"text {i}") for i in range(3)))
+
+    started = time.monotonic()
+    assert asyncio.run(run()) == ["", "", ""]
+    # Only the probe was sent; the re-opened circuit's cool-down is past MAX_ROUTER_WAIT_SEC
+    assert len(models.calls) == 1
+    assert time.monotonic() - started < 5
+
+def test_waits_for_short_cooldown():
+    models = FakeModels(delay=0)
+    translator = make_translator(models)
+    health = translator.router.models["m1"]
+    health.open_count = 1
+    health.open_until = time.monotonic() + 0.2
+
+    assert asyncio.run(translator.translate_to_korean_async("text")) == "번역 t"
+    assert len(models.calls) == 1
@@ -0,0 +1,52 @@
+import asyncio
+import concurrent.futures
+import datetime
+import os
+
+import pytest
+
+from TeleKB.cold_storage import ColdStorage
+from TeleKB.collector import Collector
+from TeleKB.db import Database
+from TeleKB.file_manager import FileManager
+from TeleKB.manifest import ArchiveManifest
+
+class FakeService:
+    def submit(self, coro):
+        future = concurrent.futures.Future()
+        future.set_result(asyncio.run(coro))
+        return future
+
+class FakeTranslator:
+    async def translate_to_korean_async(self, text):
+        return f"다시 번역: {text}"
+
+def make_collector(tmp_path):
+    db = Database(str(tmp_path / "telekb.db"))
+    output_dir = str(tmp_path / "out")
+    collector = Collector(db, FakeService(), FakeTranslator(), output_dir, log=lambda *args, **kwargs: None)
+    date = datetime.datetime(2020, 1, 15, 12, 0)
+    for msg_id in (1, 2):
+        filepath, content = FileManager.render_markdown("Chan", f"hello {msg_id}", f"번역 {msg_id}", msg_id, date, output_dir)
+        collector.commit_section(5, msg_id, filepath, content)
+    return collector, ColdStorage(db, output_dir, {"format": "zip"})
+
+def test_retranslate_after_rollup_asks_for_extract(tmp_path):
+    collector, storage = make_collector(tmp_path)
+    assert storage.rollup(log=lambda *args: None)["months"] == 1
+
+    with pytest.raises(ValueError, match="extract its month first"):
+        collector.retranslate_section(5, 1)
+
+    storage.extract("2020-01", log=lambda *args: None)
+    assert collector.retranslate_section(5, 1) == "다시 번역: hello 1"
+    manifest = ArchiveManifest(collector.db, storage)
+    assert "다시 번역: hello 1" in manifest.read(5, 1)
+    assert manifest.verify(log=lambda *args: None) == {"ok": 2}
+
+def test_manifest_reads_rolled_up_section_from_cold_storage(tmp_path):
+    collector, storage = make_collector(tmp_path)
+    storage.rollup(log=lambda *args: None)
+
+    assert not os.path.exists(collector.db.get_section(5, 2)['file_path'])
+    assert "번역 2" in ArchiveManifest(collector.db, storage).read(5, 2)